@@ -1,4 +1,8 @@
 import re, sys, time, json
+import queue, threading
+import copy, tempfile
+import fnmatch
+import zipfile
 from pathlib import Path
 from datetime import date
 import yaml
@@ -8,6 +12,7 @@ from docx import Document
 from docx.oxml import parse_xml
 from datetime import datetime
 import os
+from urllib.parse import urlparse, urlencode
 from docx.table import _Cell, Table
 from docx.oxml.ns import qn
 import html
@@ -101,27 +106,663 @@ def ts():
     return time.strftime("%Y-%m-%d %H:%M:%S")
 def log(msg):
     print(f"[{ts()}] {msg}")
-def find_first_visible_input(page, primary_selector, fallbacks=None, timeout=15000):
-    fallbacks = fallbacks or []
-    selectors = [primary_selector] + fallbacks
-    contexts = [page] + [fr for fr in page.frames]
-    last_exc = None
-    for sel in selectors:
-        for ctx in contexts:
+_FRAME_KIND_SELECTORS = {
+    "leftnav": [
+        "xpath=//*[contains(@class,'left-nav')]",
+        "css=a[data-trans-id], a[data-transId], a[data-transid], a.GUIDE-sideNav, a.GUIDE-sideNavLink",
+    ],
+    "partners": [
+        "xpath=//td[starts-with(@id,'GUIDE-PartnersTable-') or starts-with(@id,'C21_W80_V81_btpartner_table')]",
+    ],
+    "assoc_tx": [
+        "xpath=//div[contains(@id,'_Table_bottom') or contains(@id,'_table_bottom')]",
+    ],
+    "text_info": [
+        "xpath=//td[starts-with(@id,'GUIDE-TextInfoTable-')]",
+    ],
+    "scope": [
+        "xpath=//a[contains(@id,'_Objects-btn') and contains(@class,'th-ip-h')]",
+        "xpath=//input[contains(@id,'_Objects') and contains(@class,'th-if') and @role='combobox']",
+    ],
+}
+_STABLE_FRAME_KINDS = {"leftnav", "scope", "search_for"}
+_FRAME_NAME_KINDS = {
+    "header": re.compile(r"HeaderFrame", re.I),
+    "workarea": re.compile(r"WorkAreaFrame1", re.I),
+}
+class FrameRegistry:
+    def __init__(self, page):
+        self.page = page
+        self.generation = {}
+        self.hits = {}
+        self.lock = threading.Lock()
+        for fr in page.frames:
+            self.generation[fr] = 0
+        page.on("frameattached", self._on_attached)
+        page.on("framenavigated", self._on_navigated)
+        page.on("framedetached", self._on_detached)
+    def _on_attached(self, fr):
+        with self.lock:
+            self.generation.setdefault(fr, 0)
+    def _on_navigated(self, fr):
+        with self.lock:
+            self.generation[fr] = self.generation.get(fr, 0) + 1
+            for key in [k for k, (hit, _) in self.hits.items() if hit is fr]:
+                self.hits.pop(key, None)
+    def _on_detached(self, fr):
+        with self.lock:
+            self.generation.pop(fr, None)
+            for key in [k for k, (hit, _) in self.hits.items() if hit is fr]:
+                self.hits.pop(key, None)
+    def frames(self):
+        with self.lock:
+            known = list(self.generation)
+        return [fr for fr in known if not fr.is_detached()] or list(self.page.frames)
+    def by_name(self, kind):
+        rx = _FRAME_NAME_KINDS.get(kind)
+        for fr in self.frames():
+            if rx and rx.search(fr.name or ""):
+                return fr
+        return None
+    def ordered(self, key):
+        frames = self.frames()
+        hit, _ = self.hits.get(key, (None, None))
+        if hit in frames:
+            frames.remove(hit)
+            frames.insert(0, hit)
+        return frames
+    def remember(self, key, fr):
+        with self.lock:
+            self.hits[key] = (fr, self.generation.get(fr, 0))
+    def cached(self, key):
+        with self.lock:
+            hit, gen = self.hits.get(key, (None, None))
+            if hit is not None and not hit.is_detached() and self.generation.get(hit) == gen:
+                return hit
+        return None
+    def forget(self, key):
+        with self.lock:
+            self.hits.pop(key, None)
+    def _has_any(self, fr, selectors):
+        for sel in selectors:
             try:
-                loc = ctx.locator(sel).first
+                if fr.locator(sel).first.count():
+                    return True
+            except Exception:
+                pass
+        return False
+    def find(self, kind_or_selector, selectors=None):
+        key = kind_or_selector
+        if selectors is None:
+            selectors = _FRAME_KIND_SELECTORS.get(key, [key])
+        hit = self.cached(key)
+        if hit:
+            # AJAX tab switches swap content without a framenavigated, so content kinds re-check the cached frame.
+            if key in _STABLE_FRAME_KINDS or self._has_any(hit, selectors):
+                return hit
+            self.forget(key)
+        for sel in selectors:
+            for fr in self.ordered(key):
                 try:
-                    loc.wait_for(state="visible", timeout=timeout)
-                    return loc, ctx
-                except Exception as e:
-                    last_exc = e
-                count = loc.count()
-                if count:
-                    return loc, ctx
+                    if fr.locator(sel).first.count():
+                        self.remember(key, fr)
+                        return fr
+                except Exception:
+                    pass
+        return None
+    def wait_for(self, kind_or_selector, timeout_ms=10000, poll_ms=250, selectors=None):
+        deadline = time.time() + (timeout_ms / 1000.0)
+        while True:
+            fr = self.find(kind_or_selector, selectors)
+            if fr or time.time() >= deadline:
+                return fr
+            remaining = max(1, int((deadline - time.time()) * 1000))
+            try:
+                self.page.wait_for_event("framenavigated", timeout=min(poll_ms, remaining))
+            except Exception:
+                pass
+_FRAME_REGISTRIES = {}
+_FRAME_REGISTRIES_LOCK = threading.Lock()
+def frame_registry(page):
+    with _FRAME_REGISTRIES_LOCK:
+        reg = _FRAME_REGISTRIES.get(page)
+        if reg is None:
+            reg = FrameRegistry(page)
+            _FRAME_REGISTRIES[page] = reg
+            page.on("close", lambda _p: _FRAME_REGISTRIES.pop(page, None))
+        return reg
+class SelectorCache:
+    def __init__(self, path=None, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self.entries = {}
+        self.stats = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        if path and path.exists():
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                self.entries = data.get("entries", {}) or {}
+                log(f"[selcache] loaded {len(self.entries)} entr(ies) from {path}")
             except Exception as e:
-                last_exc = e
-                continue
-    raise PWTimeout(f"Could not find element (visible or attached) for selectors: {selectors}")
+                log(f"[selcache] could not read {path}: {e}")
+    @staticmethod
+    def _key(purpose, host):
+        return f"{purpose}|{(host or '').lower()}"
+    def lookup(self, purpose, host):
+        if not self.enabled:
+            return None
+        with self.lock:
+            return self.entries.get(self._key(purpose, host))
+    def order(self, purpose, host, selectors):
+        selectors = [sel for sel in selectors if sel]
+        hit = self.lookup(purpose, host)
+        if hit and hit.get("selector") in selectors:
+            selectors.remove(hit["selector"])
+            selectors.insert(0, hit["selector"])
+        return selectors
+    def order_frames(self, purpose, host, frames):
+        hit = self.lookup(purpose, host)
+        want = (hit or {}).get("frame")
+        if want is None:
+            return list(frames)
+        first = [fr for fr in frames if _frame_label(fr) == want]
+        return first + [fr for fr in frames if fr not in first]
+    def record(self, purpose, host, selector, frame=None):
+        if not self.enabled or not selector:
+            return
+        key = self._key(purpose, host)
+        label = _frame_label(frame) if frame is not None else ""
+        with self.lock:
+            entry = self.entries.get(key) or {"hits": 0, "misses": 0}
+            counters = self.stats.setdefault(purpose, {"hit": 0, "miss": 0})
+            if entry.get("selector") == selector:
+                entry["hits"] = entry.get("hits", 0) + 1
+                counters["hit"] += 1
+            else:
+                entry["misses"] = entry.get("misses", 0) + 1
+                counters["miss"] += 1
+            entry["selector"] = selector
+            entry["frame"] = label
+            entry["updated"] = datetime.now().isoformat(timespec="seconds")
+            self.entries[key] = entry
+            self.dirty = True
+    def save(self):
+        if not (self.enabled and self.path and self.dirty):
+            return
+        with self.lock:
+            data = {"version": 1, "entries": copy.deepcopy(self.entries)}
+            self.dirty = False
+        tmp = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.path.parent,
+                                             prefix=self.path.name + ".", suffix=".tmp", delete=False) as fh:
+                tmp = fh.name
+                fh.write(json.dumps(data, indent=2, sort_keys=True))
+            os.replace(tmp, self.path)
+        except Exception as e:
+            self.dirty = True
+            log(f"[selcache] could not save {self.path}: {e}")
+            if tmp:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+    def log_stats(self):
+        with self.lock:
+            items = sorted(self.stats.items())
+        if items:
+            log("[selcache] " + ", ".join(f"{k}: {v['hit']} hit/{v['miss']} miss" for k, v in items))
+def _frame_label(fr):
+    try:
+        if fr.parent_frame is None:
+            return ""
+        return fr.name or urlparse(fr.url or "").path.rsplit("/", 1)[-1]
+    except Exception:
+        return ""
+def _page_host(page):
+    try:
+        return urlparse(page.url).hostname or ""
+    except Exception:
+        return ""
+_SELECTOR_CACHE = SelectorCache(enabled=False)
+def configure_selector_cache(cfg):
+    global _SELECTOR_CACHE
+    sc = cfg.get('selector_cache', {}) or {}
+    raw = (sc.get('path') or "").strip()
+    path = Path(raw).expanduser() if raw else None
+    if _SELECTOR_CACHE.enabled and _SELECTOR_CACHE.path == path:
+        return _SELECTOR_CACHE
+    _SELECTOR_CACHE = SelectorCache(path, enabled=bool(sc.get('enabled', True)))
+    return _SELECTOR_CACHE
+def selector_cache():
+    return _SELECTOR_CACHE
+_OFFLINE_DOM = {"enabled": False, "dump_dir": None, "warned": False}
+def configure_offline_dom(cfg):
+    oc = cfg.get('offline_dom', {}) or {}
+    raw = (oc.get('dump_dir') or "").strip()
+    _OFFLINE_DOM["enabled"] = bool(oc.get('enabled', True))
+    _OFFLINE_DOM["dump_dir"] = Path(raw).expanduser() if raw else None
+def _lxml_html():
+    try:
+        import lxml.html
+        return lxml.html
+    except ImportError:
+        if not _OFFLINE_DOM["warned"]:
+            _OFFLINE_DOM["warned"] = True
+            log("[offline] lxml is not installed; extractors stay on live locators")
+        return None
+_INNER_TEXT_BLOCKS = {"div", "p", "tr", "li", "ul", "ol", "table", "tbody", "thead", "tfoot",
+                      "h1", "h2", "h3", "h4", "h5", "h6", "section", "form", "pre", "blockquote"}
+_HIDDEN_STYLE_RX = re.compile(r"display\s*:\s*none|visibility\s*:\s*(hidden|collapse)", re.I)
+def _lxml_hidden(n):
+    if n.get("hidden") is not None or (n.tag == "input" and (n.get("type") or "").lower() == "hidden"):
+        return True
+    return bool(_HIDDEN_STYLE_RX.search(n.get("style") or ""))
+def _lxml_inner_text(node):
+    out = []
+    def walk(n):
+        tag = n.tag if isinstance(n.tag, str) else None
+        if tag is None or tag in ("script", "style", "noscript", "template") or _lxml_hidden(n):
+            return
+        if tag == "br":
+            out.append("\n")
+            return
+        if n.text:
+            out.append(n.text)
+        for c in n:
+            walk(c)
+            if c.tail:
+                out.append(c.tail)
+        if tag in _INNER_TEXT_BLOCKS:
+            out.append("\n")
+        elif tag in ("td", "th"):
+            out.append("\t")
+    walk(node)
+    text = re.sub(r"[ \r\f\v]+", " ", "".join(out).replace("\xa0", " "))
+    lines = [ln.strip(" \t") for ln in text.split("\n")]
+    return re.sub(r"\n{2,}", "\n", "\n".join(lines)).strip()
+class SnapshotLocator:
+    def __init__(self, snap, parent=None, op=None, arg=None):
+        self.snap = snap
+        self.parent = parent
+        self.op = op
+        self.arg = arg
+        self._cache = None
+    def _nodes(self):
+        if self._cache is not None:
+            return self._cache
+        if self.parent is None:
+            base, at_root = [self.snap.root], True
+        else:
+            base, at_root = self.parent._nodes(), False
+        if self.op == "locator":
+            xp = (self.arg or "").strip()
+            xp = xp[6:] if xp.startswith("xpath=") else xp
+            if not at_root and xp.startswith("/"):
+                xp = "." + xp
+            nodes, seen = [], set()
+            for ctx in base:
+                try:
+                    found = ctx.xpath(xp)
+                except Exception:
+                    found = []
+                for n in found:
+                    if hasattr(n, "tag") and isinstance(n.tag, str) and id(n) not in seen:
+                        seen.add(id(n))
+                        nodes.append(n)
+        elif self.op == "first":
+            nodes = base[:1]
+        elif self.op == "nth":
+            nodes = base[self.arg:self.arg + 1] if self.arg >= 0 else base[self.arg:][:1]
+        else:
+            nodes = base
+        self._cache = nodes
+        return nodes
+    def locator(self, selector):
+        return SnapshotLocator(self.snap, self, "locator", selector)
+    @property
+    def first(self):
+        return SnapshotLocator(self.snap, self, "first")
+    def nth(self, index):
+        return SnapshotLocator(self.snap, self, "nth", index)
+    def count(self):
+        return len(self._nodes())
+    def _one(self):
+        nodes = self._nodes()
+        if not nodes:
+            raise PWTimeout("offline snapshot: no element matches")
+        return nodes[0]
+    def inner_text(self, timeout=None):
+        return _lxml_inner_text(self._one())
+    def get_attribute(self, name, timeout=None):
+        return self._one().get(name)
+    def live(self):
+        if self.parent is None:
+            if self.snap.live_root is None:
+                raise RuntimeError("offline snapshot has no live counterpart")
+            base = self.snap.live_root
+        else:
+            base = self.parent.live()
+        if self.op == "locator":
+            return base.locator(self.arg)
+        if self.op == "first":
+            return base.first
+        if self.op == "nth":
+            return base.nth(self.arg)
+        return base
+class SnapshotFrame:
+    def __init__(self, html_text, frame=None, live_root=None, fragment=False):
+        lh = _lxml_html()
+        if lh is None:
+            raise RuntimeError("lxml is required for offline snapshots")
+        self.frame = frame
+        self.live_root = live_root if live_root is not None else frame
+        self.root = lh.fragment_fromstring(html_text) if fragment else lh.document_fromstring(html_text)
+    def locator(self, selector):
+        return SnapshotLocator(self, None, "locator", selector)
+def _dump_snapshot(label, html_text):
+    d = _OFFLINE_DOM["dump_dir"]
+    if not d:
+        return
+    try:
+        d.mkdir(parents=True, exist_ok=True)
+        path = d / f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{re.sub(r'[^A-Za-z0-9_-]+', '_', label)}.html"
+        path.write_text(html_text, encoding="utf-8")
+    except Exception as e:
+        log(f"[offline] could not dump snapshot {label}: {e}")
+def offline_view(fr, label="frame"):
+    if fr is None or isinstance(fr, SnapshotFrame) or not _OFFLINE_DOM["enabled"] or _lxml_html() is None:
+        return fr
+    started = time.time()
+    try:
+        html_text = fr.content()
+        snap = SnapshotFrame(html_text, frame=fr)
+    except Exception as e:
+        log(f"[offline] {label}: snapshot failed, using live locators ({e})")
+        return fr
+    _dump_snapshot(label, html_text)
+    log(f"[offline] {label}: captured {len(html_text) // 1024} KB in {(time.time() - started) * 1000:.0f} ms")
+    return snap
+def snapshot_element(loc):
+    if loc is None or isinstance(loc, SnapshotLocator) or not _OFFLINE_DOM["enabled"] or _lxml_html() is None:
+        return loc
+    try:
+        if not loc.count():
+            return loc
+        html_text = loc.evaluate("n => n.outerHTML")
+        snap = SnapshotFrame(html_text, live_root=loc, fragment=True)
+    except Exception:
+        return loc
+    return SnapshotLocator(snap, None, "root")
+def to_live(x):
+    return x.live() if isinstance(x, SnapshotLocator) else x
+_CRM_ENDPOINT_PATTERNS = ["/sap/bc/bsp/", "/sap("]
+_WAIT_STATS = threading.local()
+def reset_wait_stats():
+    _WAIT_STATS.data = {"sleep_ms": 0.0, "sleeps": 0, "cond_ms": 0.0, "cond_waits": 0, "by_reason": {}}
+def wait_stats():
+    if not hasattr(_WAIT_STATS, "data"):
+        reset_wait_stats()
+    return _WAIT_STATS.data
+def log_wait_stats(label=""):
+    st = wait_stats()
+    top = sorted(st["by_reason"].items(), key=lambda kv: -kv[1])[:5]
+    detail = ", ".join(f"{k}={v:.0f}ms" for k, v in top)
+    log(f"[waits] {label}: fixed sleeps {st['sleep_ms']:.0f} ms over {st['sleeps']} call(s)"
+        f"{' (' + detail + ')' if detail else ''}; condition waits {st['cond_ms']:.0f} ms over {st['cond_waits']} call(s)")
+def _record_wait(kind, ms, reason=""):
+    st = wait_stats()
+    if kind == "sleep":
+        st["sleep_ms"] += ms
+        st["sleeps"] += 1
+        key = reason or "unlabelled"
+        st["by_reason"][key] = st["by_reason"].get(key, 0.0) + ms
+    else:
+        st["cond_ms"] += ms
+        st["cond_waits"] += 1
+def pause(ctx, ms, reason=""):
+    _record_wait("sleep", ms, reason)
+    if ctx is None:
+        time.sleep(ms / 1000.0)
+    else:
+        ctx.wait_for_timeout(ms)
+class _NetworkTracker:
+    STALE_S = 10.0
+    def __init__(self, page):
+        self.inflight = {}
+        self.last_activity = time.time()
+        self.lock = threading.Lock()
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_done)
+        page.on("requestfailed", self._on_done)
+        page.on("framenavigated", self._on_navigated)
+    def _on_request(self, req):
+        try:
+            fr = req.frame
+        except Exception:
+            fr = None
+        with self.lock:
+            self.inflight[req] = (req.url, time.time(), fr)
+            self.last_activity = time.time()
+    def _on_done(self, req):
+        with self.lock:
+            self.inflight.pop(req, None)
+            self.last_activity = time.time()
+    def _on_navigated(self, fr):
+        with self.lock:
+            for req in [r for r, (_, _, f) in self.inflight.items() if f is fr]:
+                try:
+                    if req.is_navigation_request():
+                        continue
+                except Exception:
+                    pass
+                self.inflight.pop(req, None)
+    def busy(self, patterns):
+        cutoff = time.time() - self.STALE_S
+        with self.lock:
+            entries = list(self.inflight.values())
+            last = self.last_activity
+        pending = [u for u, t, _ in entries if t >= cutoff and (not patterns or any(p in u for p in patterns))]
+        return len(pending), last
+_NETWORK_TRACKERS = {}
+def network_tracker(page):
+    with _FRAME_REGISTRIES_LOCK:
+        tr = _NETWORK_TRACKERS.get(page)
+        if tr is None:
+            tr = _NetworkTracker(page)
+            _NETWORK_TRACKERS[page] = tr
+            page.on("close", lambda _p: _NETWORK_TRACKERS.pop(page, None))
+        return tr
+def watch_page(page):
+    frame_registry(page)
+    network_tracker(page)
+    return page
+def wait_until(page, predicate, timeout_ms=5000, poll_ms=100, event="framenavigated"):
+    started = time.time()
+    deadline = started + timeout_ms / 1000.0
+    result = None
+    try:
+        while True:
+            try:
+                result = predicate()
+            except Exception:
+                result = None
+            if result or time.time() >= deadline:
+                return result
+            remaining = max(1, int((deadline - time.time()) * 1000))
+            try:
+                page.wait_for_event(event, timeout=min(poll_ms, remaining))
+            except Exception:
+                pass
+    finally:
+        _record_wait("cond", (time.time() - started) * 1000)
+def wait_for_frame_change(page, timeout_ms):
+    started = time.time()
+    try:
+        page.wait_for_event("framenavigated", timeout=max(1, int(timeout_ms)))
+        return True
+    except Exception:
+        return False
+    finally:
+        _record_wait("cond", (time.time() - started) * 1000)
+def wait_for_network_quiet(page, patterns=None, quiet_ms=300, timeout_ms=10000):
+    tracker = network_tracker(page)
+    patterns = _CRM_ENDPOINT_PATTERNS if patterns is None else patterns
+    started = time.time()
+    deadline = started + timeout_ms / 1000.0
+    try:
+        while time.time() < deadline:
+            pending, last = tracker.busy(patterns)
+            if not pending and (time.time() - last) * 1000 >= quiet_ms:
+                return True
+            page.wait_for_timeout(min(50, max(1, int((deadline - time.time()) * 1000))))
+        return False
+    finally:
+        _record_wait("cond", (time.time() - started) * 1000)
+def wait_for_selector_in_kind(page, kind, selector, timeout_ms=10000, state="attached"):
+    started = time.time()
+    try:
+        fr = frame_registry(page).wait_for(kind, timeout_ms=timeout_ms)
+        if not fr:
+            return None, None
+        remaining = max(1, int(timeout_ms - (time.time() - started) * 1000))
+        loc = fr.locator(selector).first
+        try:
+            loc.wait_for(state=state, timeout=remaining)
+        except Exception:
+            return fr, None
+        return fr, loc
+    finally:
+        _record_wait("cond", (time.time() - started) * 1000)
+_DOM_CHANGED_JS = """
+([el, sig, n]) => !el || !el.isConnected || (el.innerText || '').slice(0, n) !== sig
+"""
+def dom_signature(loc, n=1200):
+    try:
+        return cl_call(loc, "innerText", n) or ""
+    except Exception:
+        return ""
+def wait_for_dom_change(frame, loc, previous_signature, timeout_ms=5000, n=1200):
+    started = time.time()
+    handle = None
+    try:
+        handle = loc.element_handle(timeout=1000)
+        frame.wait_for_function(_DOM_CHANGED_JS, arg=[handle, previous_signature or "", n], timeout=timeout_ms)
+        return True
+    except Exception:
+        return False
+    finally:
+        if handle is not None:
+            try: handle.dispose()
+            except Exception: pass
+        _record_wait("cond", (time.time() - started) * 1000)
+_PROBE_JS = r"""
+(sels) => {
+  const visible = (el) => {
+    if (!el || !el.isConnected) return false;
+    if (!el.getClientRects().length) return false;
+    const st = getComputedStyle(el);
+    return st.visibility !== 'hidden' && st.display !== 'none';
+  };
+  const first = (sel) => {
+    try {
+      if (sel.startsWith('xpath=') || sel.startsWith('/') || sel.startsWith('(')) {
+        const xp = sel.startsWith('xpath=') ? sel.slice(6) : sel;
+        const r = document.evaluate(xp, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        let k = 0;
+        for (let i = 0; i < r.snapshotLength; i++) {
+          const n = r.snapshotItem(i);
+          if (n.nodeType !== 1) continue;
+          if (visible(n)) return [2, k];
+          k++;
+        }
+        return [k ? 1 : 0, 0];
+      }
+      const css = sel.startsWith('css=') ? sel.slice(4) : sel;
+      const nodes = document.querySelectorAll(css);
+      for (let i = 0; i < nodes.length; i++) if (visible(nodes[i])) return [2, i];
+      return [nodes.length ? 1 : 0, 0];
+    } catch (e) {
+      return [-1, 0];
+    }
+  };
+  return sels.map(first);
+}
+"""
+_PW_ONLY_SELECTOR_RX = re.compile(r"^(?:text|role|id|data-testid|internal:[\w-]+)=|>>|:has-text\(|:text\(|:visible", re.I)
+def _probe_frame(fr, selectors):
+    states = [(0, 0)] * len(selectors)
+    js_idx = [i for i, sel in enumerate(selectors) if not _PW_ONLY_SELECTOR_RX.search(sel or "")]
+    if js_idx:
+        try:
+            got = cl_call(fr, "probe", [selectors[i] for i in js_idx])
+            for i, st in zip(js_idx, got):
+                states[i] = tuple(st)
+        except Exception:
+            for i in js_idx:
+                states[i] = (-1, 0)
+    for i, sel in enumerate(selectors):
+        if states[i][0] != -1 and i in js_idx:
+            continue
+        try:
+            loc = fr.locator(sel)
+            n = loc.count()
+            states[i] = next(((2, k) for k in range(min(n, 20)) if loc.nth(k).is_visible()), (1 if n else 0, 0))
+        except Exception:
+            states[i] = (0, 0)
+    return states
+def probe_selectors(page, selectors, timeout_ms=30000, poll_ms=250, require_visible=True, key=None, purpose=None):
+    selectors = [sel for sel in selectors if sel]
+    host = _page_host(page) if purpose else ""
+    if purpose:
+        selectors = selector_cache().order(purpose, host, selectors)
+    reg = frame_registry(page)
+    key = key or ("probe", tuple(selectors))
+    started = time.time()
+    deadline = started + (timeout_ms / 1000.0)
+    passes = 0
+    try:
+        while True:
+            passes += 1
+            last_pass = time.time() >= deadline
+            best = None
+            frames = reg.ordered(key)
+            if purpose:
+                frames = selector_cache().order_frames(purpose, host, frames)
+            for fr in frames:
+                try:
+                    states = _probe_frame(fr, selectors)
+                except Exception:
+                    continue
+                for i, (st, idx) in enumerate(states):
+                    if st <= 0:
+                        continue
+                    rank = (0 if st == 2 else 1, i)
+                    if best is None or rank < best[0]:
+                        best = (rank, fr, i, idx)
+                if best and best[0] == (0, 0):
+                    break
+            if best and (best[0][0] == 0 or not require_visible or last_pass):
+                _, fr, i, idx = best
+                reg.remember(key, fr)
+                sel = selectors[i]
+                if purpose:
+                    selector_cache().record(purpose, host, sel, fr)
+                log(f"[probe] {sel} won in frame name={getattr(fr,'name','')} after {passes} pass(es), "
+                    f"{(time.time() - started) * 1000:.0f} ms{'' if best[0][0] == 0 else ' (attached, not visible)'}")
+                return (fr.locator(sel).nth(idx) if best[0][0] == 0 else fr.locator(sel).first), fr, sel
+            if last_pass:
+                raise PWTimeout(f"Could not find element in any frame for selectors: {selectors}")
+            wait_for_frame_change(page, min(poll_ms, max(1, (deadline - time.time()) * 1000)))
+    finally:
+        _record_wait("cond", (time.time() - started) * 1000)
+def find_first_visible_input(page, primary_selector, fallbacks=None, timeout=15000):
+    fallbacks = fallbacks or []
+    selectors = [primary_selector] + fallbacks
+    loc, ctx, _ = probe_selectors(page, selectors, timeout_ms=timeout, require_visible=True)
+    return loc, ctx
 def dump_frames_debug(page, basename="debug"):
     info_lines = []
     frames = page.frames
@@ -170,30 +811,10 @@ def soft_click_go(ctx, custom_selector=None):
         except Exception:
             pass
     return False
-def wait_find_in_any_frame(page, selectors, timeout_ms=30000, poll_ms=600):
-    import time
-    deadline = time.time() + (timeout_ms/1000.0)
-    tried = set()
-    while time.time() < deadline:
-        log(f"[wait] scanning {len(page.frames)} frames for any of: {selectors}")
-        frames = page.frames
-        for sel in selectors:
-            if sel in tried:
-                pass
-            for fr in frames:
-                try:
-                    loc = fr.locator(sel).first
-                    if loc.count():
-                        try:
-                            loc.wait_for(state="visible", timeout=poll_ms)
-                        except Exception:
-                            pass
-                        log(f"[wait] found {sel} in frame name={getattr(fr,'name','')} url={getattr(fr,'url','')}")
-                        return loc, fr, sel
-                except Exception:
-                    continue
-        time.sleep(poll_ms/1000.0)
-    raise PWTimeout(f"Could not find element in any frame for selectors: {selectors}")
+def wait_find_in_any_frame(page, selectors, timeout_ms=30000, poll_ms=600, purpose=None):
+    log(f"[wait] probing {len(page.frames)} frames for any of: {selectors}")
+    return probe_selectors(page, selectors, timeout_ms=timeout_ms, poll_ms=poll_ms,
+                           require_visible=False, purpose=purpose)
 import re
 from docx import Document
 def _norm_key(s: str) -> str:
@@ -491,12 +1112,108 @@ def get_grid_row_col(frame, grid_hint_xpath, row_index, col_index):
         return clean(cell.inner_text())
     except Exception:
         return ""
+_FIELD_MAP_JS = r"""
+(specs) => {
+    const lit = s => !s.includes("'") ? "'" + s + "'"
+        : !s.includes('"') ? '"' + s + '"'
+        : "concat('" + s.split("'").join("', \"'\", '") + "')";
+    const first = (xp, ctx) => {
+        try { return document.evaluate(xp, ctx || document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue; }
+        catch (e) { return null; }
+    };
+    const text = n => n ? (n.innerText || n.textContent || '') : '';
+    const byLabel = (labels) => {
+        for (const label of labels) {
+            const el = first("//*[normalize-space(text())=" + lit(label) + "]");
+            if (el) {
+                if (el.nextElementSibling) return text(el.nextElementSibling);
+                const forId = el.getAttribute('for');
+                if (forId) {
+                    const inp = document.getElementById(forId);
+                    if (inp) return inp.tagName.toLowerCase() === 'input' ? (inp.value || '') : text(inp);
+                }
+                const nxt = first("following::*[1]", el);
+                if (nxt) return text(nxt);
+            }
+            const el2 = first("//*[contains(normalize-space(.), " + lit(label) + ")]");
+            if (el2 && el2.nextElementSibling) return text(el2.nextElementSibling);
+        }
+        return '';
+    };
+    const byGrid = (spec) => {
+        const xp = spec.xpath.replace(/^xpath=/, '');
+        let grid = null;
+        if (xp.startsWith('/') || xp.startsWith('(')) grid = first(xp);
+        else { try { grid = document.querySelector(xp.replace(/^css=/, '')); } catch (e) {} }
+        if (!grid) return '';
+        const rows = grid.querySelectorAll('tr');
+        const row = rows[spec.row];
+        if (!row) return '';
+        const cells = row.querySelectorAll('th, td');
+        return text(cells[spec.col - 1]);
+    };
+    const out = {};
+    for (const spec of specs) {
+        try { out[spec.key] = spec.kind === 'grid' ? byGrid(spec) : byLabel(spec.labels); }
+        catch (e) { out[spec.key] = null; }
+    }
+    return out;
+}
+"""
+def _field_map_specs(field_map):
+    specs, literals = [], {}
+    for key, conf in (field_map or {}).items():
+        if isinstance(conf, str):
+            specs.append({"key": key, "kind": "label", "labels": [conf]})
+        elif isinstance(conf, list):
+            specs.append({"key": key, "kind": "label", "labels": list(conf)})
+        elif isinstance(conf, dict):
+            if conf.get('type') == 'label':
+                labels = conf.get('labels', [])
+                specs.append({"key": key, "kind": "label", "labels": [labels] if isinstance(labels, str) else list(labels)})
+            elif conf.get('type') == 'grid':
+                specs.append({"key": key, "kind": "grid", "xpath": conf['grid_xpath'],
+                              "row": int(conf['row']), "col": int(conf['col'])})
+            elif conf.get('type') == 'literal':
+                literals[key] = conf.get('value', '')
+            else:
+                literals[key] = None
+        else:
+            literals[key] = ""
+    return specs, literals
+def resolve_field_map(frame, field_map):
+    specs, literals = _field_map_specs(field_map)
+    started = time.time()
+    raw = None
+    if specs:
+        try:
+            raw = cl_call(frame, "fieldMap", specs)
+        except Exception as e:
+            log(f"[fields] bulk resolve failed, falling back to per-field lookups: {e}")
+    out = {}
+    for spec in specs:
+        key = spec["key"]
+        val = (raw or {}).get(key)
+        if val is None:
+            if spec["kind"] == "grid":
+                val = get_grid_row_col(frame, spec["xpath"], spec["row"], spec["col"])
+            else:
+                val = get_by_label(frame, spec["labels"])
+        out[key] = clean(val)
+    for key, val in literals.items():
+        if val is not None:
+            out[key] = val
+    log(f"[fields] resolved {len(specs)} field(s) in {(time.time() - started) * 1000:.0f} ms")
+    return out
 def click_partners_tab(page, frame):
     sels = [
         "xpath=//a[contains(@class,'ui-tabs-anchor')][normalize-space(.)='Partners']",
         "text=Partners",
         "xpath=//a[@class='ui-tabs-anchor' and contains(@href,'_ovviewset.do_0008')]",
     ]
+    cache = selector_cache()
+    host = _page_host(page)
+    sels = cache.order("tab:Partners", host, sels)
     clicked = False
     for sel in sels:
         try:
@@ -504,13 +1221,14 @@ def click_partners_tab(page, frame):
             if loc.count():
                 log("[nav] Clicking Partners tab")
                 loc.click()
+                cache.record("tab:Partners", host, sel, frame)
                 clicked = True
                 break
         except Exception:
             pass
     if not clicked:
         try:
-            loc, ctx, _ = wait_find_in_any_frame(page, sels, timeout_ms=15000)
+            loc, ctx, _ = wait_find_in_any_frame(page, sels, timeout_ms=15000, purpose="tab:Partners")
             loc.click()
             clicked = True
         except Exception:
@@ -527,64 +1245,115 @@ def click_partners_tab(page, frame):
     except Exception:
         pass
     return True
-def get_initial_reporter_name(frame):
-    tr = _row_by_pf_in_partners(frame, ["Initial Reporter", "Initial Contact", "Initial Reporter/Contact"])
-    if not tr:
+_GUIDE_TABLE_JS = r"""
+(name) => {
+    const rx = new RegExp('^GUIDE-' + name + 'Table-(\\d+)-([A-Za-z0-9_]+)');
+    const rows = {};
+    for (const td of document.querySelectorAll("td[id^='GUIDE-" + name + "Table-']")) {
+        const m = rx.exec(td.id);
+        if (!m) continue;
+        const r = rows[m[1]] || (rows[m[1]] = {});
+        if (!(m[2] in r)) r[m[2]] = td.innerText || td.textContent || '';
+    }
+    return rows;
+}
+"""
+def read_guide_table(frame, name):
+    try:
+        raw = cl_call(frame, "guideTable", name) or {}
+    except Exception as e:
+        log(f"[guide] {name}Table read failed: {e}")
+        return []
+    rows = []
+    for row_no in sorted(raw, key=int):
+        rec = {"_row": int(row_no)}
+        rec.update({col: clean(txt) for col, txt in raw[row_no].items()})
+        rows.append(rec)
+    return rows
+def guide_find_rows(rows, column, wanted, first_only=False, exact=False):
+    if isinstance(wanted, str):
+        wanted = [wanted]
+    hits = []
+    for w in wanted:
+        hits.extend(r for r in rows if r.get(column, "") == w and r not in hits)
+        if hits and first_only:
+            return hits[:1]
+    if hits or exact:
+        return hits
+    for w in wanted:
+        low = w.lower()
+        hits.extend(r for r in rows if low in r.get(column, "").lower() and r not in hits)
+        if hits and first_only:
+            return hits[:1]
+    return hits
+def guide_find_row(rows, column, wanted):
+    hits = guide_find_rows(rows, column, wanted, first_only=True)
+    return hits[0] if hits else None
+def guide_cell(row, *columns):
+    if not row:
         return ""
-    return _cell_text_in_same_row(tr, "Name")
-def get_facility_name_and_address(frame):
-    tr = _row_by_pf_in_partners(frame, ["Facility", "Health Care Facility", "Healthcare Facility", "Plant"])
-    if not tr:
+    for col in columns:
+        if col in row:
+            if row[col]:
+                return row[col]
+            continue
+        for key in row:
+            if key != "_row" and key.startswith(col) and row[key]:
+                return row[key]
+        for key in row:
+            if key != "_row" and col in key and row[key]:
+                return row[key]
+    return ""
+def _guide_field_value(rows, spec):
+    for col, wanted in (spec.get('where', {}) or {}).items():
+        rows = guide_find_rows(rows, col, wanted, exact=bool(spec.get('exact')))
+    if spec.get('column'):
+        cols = spec['column']
+        vals = [guide_cell(r, *([cols] if isinstance(cols, str) else cols)) for r in rows]
+    else:
+        cols = spec.get('columns') or []
+        vals = ["\n".join(v for v in (guide_cell(r, c) for c in cols) if v) for r in rows]
+    vals = [v for v in vals if v]
+    if spec.get('all'):
+        return spec.get('separator', "\n").join(vals)
+    return vals[0] if vals else ""
+def read_guide_table_on_tab(page, root_frame, table, tabs=None, timeout_ms=10000):
+    for tab in ([tabs] if isinstance(tabs, str) else tabs or []):
+        if click_tab_by_text(page, root_frame, tab):
+            break
+    fr = find_frame_with(page, f"xpath=//td[starts-with(@id,'GUIDE-{table}Table-')]", timeout_ms=timeout_ms)
+    rows = read_guide_table(fr, table) if fr else []
+    log(f"[guide] {table}Table: {len(rows)} row(s)")
+    return rows
+def resolve_guide_fields(page, root_frame, cfg, step=None, tables=None):
+    fields = cfg.get('guide_fields', {}) or {}
+    out = {}
+    tables = {} if tables is None else tables
+    for key, spec in fields.items():
+        table = spec.get('table')
+        if not table or spec.get('step') != step:
+            continue
+        if table not in tables:
+            tables[table] = read_guide_table_on_tab(page, root_frame, table, spec.get('tab'),
+                                                    timeout_ms=spec.get('timeout_ms', 10000))
+        out[key] = _guide_field_value(tables[table], spec)
+        log(f"[guide] {key} = {out[key]!r}")
+    return out
+_INITIAL_REPORTER_PFS = ["Initial Reporter", "Initial Contact", "Initial Reporter/Contact"]
+_FACILITY_PFS = ["Facility", "Health Care Facility", "Healthcare Facility", "Plant"]
+def get_initial_reporter_name(frame, rows=None):
+    rows = read_guide_table(frame, "Partners") if rows is None else rows
+    return guide_cell(guide_find_row(rows, "PartnerFunction", _INITIAL_REPORTER_PFS), "Name")
+def get_facility_name_and_address(frame, rows=None):
+    rows = read_guide_table(frame, "Partners") if rows is None else rows
+    row = guide_find_row(rows, "PartnerFunction", _FACILITY_PFS)
+    if not row:
         return ""
-    name = _cell_text_in_same_row(tr, "Name")
-    addr = _cell_text_in_same_row(tr, "Address") or _cell_text_in_same_row(tr, "address_short")
+    name = guide_cell(row, "Name")
+    addr = guide_cell(row, "Address", "address_short")
     return f"{name}\n{addr}".strip()
-def _partners_table(frame):
-    t = frame.locator("xpath=//table[.//td[starts-with(@id,'GUIDE-PartnersTable-')]]").first
-    return t if t.count() else None
-def _row_by_pf_in_partners(frame, pf_names):
-    tbl = _partners_table(frame)
-    if not tbl:
-        return None
-    if isinstance(pf_names, str):
-        pf_names = [pf_names]
-    for pf in pf_names:
-        tr = tbl.locator(
-            "xpath=.//tr[td[starts-with(@id,'GUIDE-PartnersTable-') and "
-            "contains(@id,'-PartnerFunction') and normalize-space(.)=$pf]]"
-        ).filter(has_text=pf).first
-        if tr.count():
-            return tr
-        tr = tbl.locator(
-            f"xpath=.//tr[td[starts-with(@id,'GUIDE-PartnersTable-') and contains(@id,'-PartnerFunction') "
-            f"and normalize-space(.)='{pf}']]"
-        ).first
-        if tr.count():
-            return tr
-    for pf in pf_names:
-        low = pf.lower()
-        tr = tbl.locator(
-            "xpath=.//tr[td[starts-with(@id,'GUIDE-PartnersTable-') and contains(@id,'-PartnerFunction') "
-            f"and contains(translate(normalize-space(.),'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'), '{low}')]]"
-        ).first
-        if tr.count():
-            return tr
-    return None
 def find_partners_frame(page, timeout_ms=10000, poll_ms=200):
-    import time
-    deadline = time.time() + (timeout_ms / 1000.0)
-    sel = ("xpath=//td[starts-with(@id,'GUIDE-PartnersTable-') or "
-           "starts-with(@id,'C21_W80_V81_btpartner_table')]")
-    while time.time() < deadline:
-        for fr in page.frames:
-            try:
-                loc = fr.locator(sel).first
-                if loc.count():
-                    return fr
-            except Exception:
-                pass
-        time.sleep(poll_ms / 1000.0)
-    return None
+    return frame_registry(page).wait_for("partners", timeout_ms=timeout_ms, poll_ms=poll_ms)
 def debug_frames_for_partners(page):
     print("[Partners] Scanning frames for partners grid…")
     for i, fr in enumerate(page.frames):
@@ -593,48 +1362,36 @@ def debug_frames_for_partners(page):
             print(f"  [{i}] name={fr.name!r} url={fr.url!r}  matches={has}")
         except Exception as e:
             print(f"  [{i}] error: {e}")
-def _cell_text_in_same_row(tr_loc, col_name):
-    td = tr_loc.locator(
-        f"xpath=.//td[starts-with(@id,'GUIDE-PartnersTable-') and contains(@id,'-{col_name}')]"
-    ).first
-    if not td.count():
-        return ""
-    return clean(td.inner_text())
-def _debug_list_pf_from_correct_table(frame):
-    tbl = _partners_table(frame)
-    if not tbl:
+def _debug_list_pf_from_correct_table(frame, rows=None):
+    rows = read_guide_table(frame, "Partners") if rows is None else rows
+    if not rows:
         print("[Partners] Could not find the Partners table (GUIDE-PartnersTable).")
         return
-    cells = tbl.locator("xpath=.//td[starts-with(@id,'GUIDE-PartnersTable-') and contains(@id,'-PartnerFunction')]")
-    n = cells.count()
-    print(f"[Partners] Partner table rows detected: {n}")
-    for i in range(min(n, 30)):
-        print("  -", clean(cells.nth(i).inner_text()))
+    pfs = [r.get("PartnerFunction", "") for r in rows if "PartnerFunction" in r]
+    print(f"[Partners] Partner table rows detected: {len(pfs)}")
+    for pf in pfs[:30]:
+        print("  -", pf)
 def find_frame_with(page, selector, timeout_ms=10000, poll_ms=200):
-    import time
-    deadline = time.time() + (timeout_ms/1000.0)
-    while time.time() < deadline:
-        for fr in page.frames:
-            try:
-                if fr.locator(selector).first.count():
-                    return fr
-            except Exception:
-                pass
-        time.sleep(poll_ms/1000.0)
-    return None
+    return frame_registry(page).wait_for(selector, timeout_ms=timeout_ms, poll_ms=poll_ms)
 def click_tab_by_text(page, root_frame, text_or_href_fragment):
     sels = [
         f"xpath=//a[contains(@class,'ui-tabs-anchor') and normalize-space(.)='{text_or_href_fragment}']",
         f"text={text_or_href_fragment}",
         f"xpath=//a[contains(@class,'ui-tabs-anchor') and contains(@href,'{text_or_href_fragment}')]",
     ]
-    for fr in [root_frame] + list(page.frames):
+    cache = selector_cache()
+    purpose = f"tab:{text_or_href_fragment}"
+    host = _page_host(page)
+    sels = cache.order(purpose, host, sels)
+    frames = cache.order_frames(purpose, host, [root_frame] + [fr for fr in page.frames if fr is not root_frame])
+    for fr in frames:
         for sel in sels:
             try:
                 loc = fr.locator(sel).first
                 if loc.count():
                     log(f"[nav] Clicking tab: {text_or_href_fragment}")
                     loc.click()
+                    cache.record(purpose, host, sel, fr)
                     return fr
             except Exception:
                 pass
@@ -658,76 +1415,128 @@ def _find_first_match(patterns, s):
         if m:
             return m.group(0)
     return None
-def _row_combined_text(row):
+_ASSOC_ROWS_JS = """
+(tbl) => {
+    const statusRx = /status|state|result|outcome|disposition|resolution/i;
+    const text = n => n ? (n.innerText || n.textContent || '') : '';
+    const rows = Array.from(tbl.querySelectorAll('tr')).filter(tr => tr.querySelector('td'));
+    return rows.map(tr => {
+        const cells = Array.from(tr.querySelectorAll('th, td'));
+        const statusCell = cells.find(c => statusRx.test(c.getAttribute('aria-label') || ''));
+        const hints = [];
+        tr.querySelectorAll('[title], [aria-label], [alt]').forEach(n => {
+            for (const a of ['title', 'aria-label', 'alt']) {
+                const v = n.getAttribute(a);
+                if (v) hints.push(v);
+            }
+        });
+        const dataAttrs = [];
+        cells.forEach(c => {
+            for (const a of ['data-id', 'data-transactionid', 'data-txid', 'data-key']) {
+                const v = c.getAttribute(a);
+                if (v) dataAttrs.push(v);
+            }
+        });
+        const prodCell = cells.find(c => {
+            const id = c.id || '';
+            return c.tagName === 'TD' && id.includes('GUIDE-AssociatedTransactionsTable') && id.includes('-Product');
+        });
+        const prodA = prodCell ? prodCell.querySelector('a') : null;
+        return {
+            text: text(tr),
+            cells: cells.map(c => ({ text: text(c), id: c.id || '' })),
+            status_cell: statusCell ? text(statusCell) : null,
+            hints: hints,
+            hrefs: Array.from(tr.querySelectorAll('a[href]')).map(a => a.getAttribute('href') || ''),
+            data_attrs: dataAttrs,
+            product_cell: prodCell ? {
+                text: text(prodCell),
+                anchor: prodA ? {
+                    title: prodA.getAttribute('title') || '',
+                    aria: prodA.getAttribute('aria-label') || '',
+                    text: text(prodA),
+                } : null,
+            } : null,
+        };
+    });
+}
+"""
+def snapshot_table_rows(tbl):
+    if not tbl:
+        return []
     try:
-        return clean(row.inner_text())
-    except Exception:
-        try:
-            return (row.evaluate("n => n.textContent || ''") or "").strip()
-        except Exception:
-            return ""
-def _row_txid(row):
-    combined = _row_combined_text(row)
-    txid = _find_first_match(_ID_PATTERNS, combined)
+        return cl_call(tbl, "assocRows") or []
+    except Exception as e:
+        log(f"[AssocTx] grid snapshot failed: {e}")
+        return []
+def _snap_row_txid(r):
+    txid = _find_first_match(_ID_PATTERNS, clean(r.get("text")))
     if txid:
         return txid
-    links = row.locator("xpath=.//a[@href]")
-    for k in range(links.count()):
-        href = (links.nth(k).get_attribute("href") or "")
+    for href in r.get("hrefs") or []:
         txid = _find_first_match(_ID_PATTERNS, href)
         if txid:
             return txid
         m = re.search(r"(?:id|no|number|case|txn|wi)[=:/#](\w[-\w]*)", href, re.I)
         if m:
             return m.group(1)
-    cells = row.locator("xpath=.//th|.//td")
-    for j in range(cells.count()):
-        el = cells.nth(j)
-        for attr in ("data-id", "data-transactionid", "data-txid", "data-key"):
-            val = (el.get_attribute(attr) or "")
-            txid = _find_first_match(_ID_PATTERNS, val)
-            if txid:
-                return txid
+    for val in r.get("data_attrs") or []:
+        txid = _find_first_match(_ID_PATTERNS, val)
+        if txid:
+            return txid
     return None
-def _row_status_text(row):
-    status_like = row.locator(
-        "xpath=.//*[(self::td or self::th) and "
-        " (contains(translate(@aria-label,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'status') or "
-        "  contains(translate(@aria-label,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'state') or "
-        "  contains(translate(@aria-label,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'result') or "
-        "  contains(translate(@aria-label,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'outcome') or "
-        "  contains(translate(@aria-label,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'disposition') or "
-        "  contains(translate(@aria-label,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'resolution'))]"
-    ).first
-    if status_like.count():
-        t = clean(status_like.inner_text()) or ""
-        if t:
-            return t
-    hinted = row.locator("xpath=.//*[@title or @aria-label or @alt]")
-    for k in range(hinted.count()):
-        node = hinted.nth(k)
-        for attr in ("title", "aria-label", "alt"):
-            val = node.get_attribute(attr) or ""
-            if _COMPLETE_RX.search(val):
-                return val
-    return _row_combined_text(row)
-def _row_is_complete(row):
-    t = (_row_status_text(row) or "").lower()
+def _snap_row_status_text(r):
+    t = clean(r.get("status_cell") or "")
+    if t:
+        return t
+    for val in r.get("hints") or []:
+        if _COMPLETE_RX.search(val):
+            return val
+    return clean(r.get("text"))
+def _snap_row_is_complete(r):
+    t = (_snap_row_status_text(r) or "").lower()
     if _COMPLETE_RX.search(t):
         return True
     return ("closed" in t and "complete" in t)
+def _snap_cell_text(r, idx):
+    cells = r.get("cells") or []
+    if idx is None or len(cells) <= idx:
+        return None
+    return clean(cells[idx].get("text"))
+def assoc_records_from_snapshot(rows, idx_id, idx_type, idx_status, idx_product):
+    records = []
+    for r in rows:
+        txid_txt = _snap_cell_text(r, idx_id)
+        if txid_txt is not None:
+            txid = _find_first_match(
+                [r"\b\d{5,}\b", r"\b[A-Z]{2,5}[-_ ]?\d{4,}\b"],
+                txid_txt
+            ) or txid_txt
+        else:
+            txid = _snap_row_txid(r)
+        status = _snap_cell_text(r, idx_status)
+        if status is None:
+            status = _snap_row_status_text(r)
+        product_txt = _snap_cell_text(r, idx_product) or ""
+        if not product_txt and r.get("product_cell"):
+            pc = r["product_cell"]
+            a = pc.get("anchor")
+            if a:
+                product_txt = clean(a.get("title") or a.get("aria") or a.get("text"))
+            else:
+                product_txt = clean(pc.get("text"))
+        records.append({
+            "id": txid or "",
+            "type": _snap_cell_text(r, idx_type) or "",
+            "status": status or "",
+            "product": product_txt,
+            "product_code": extract_product_code(product_txt).upper() if product_txt else "",
+            "complete": _snap_row_is_complete(r) or bool(re.search(r'\bcomplete(d)?\b', (status or ''), re.I)),
+            "cell_ids": [c.get("id") or "" for c in (r.get("cells") or [])],
+        })
+    return records
 def _pli_table(frame):
     return frame.locator("xpath=//table[.//td[starts-with(@id,'GUIDE-ProductLineItemsTable-')]]").first
-def _get_attr_or_text(node):
-    try:
-        text = clean(node.inner_text() or "")
-    except Exception:
-        text = ""
-    if text:
-        return text
-    return clean(
-        (node.get_attribute("title") or node.get_attribute("aria-label") or "")
-    )
 DEFAULT_PA_TEXT = (
     "Information provided to Medtronic indicated that the complaint device "
     "was not available for evaluation."
@@ -826,34 +1635,91 @@ def get_current_activity_product_code(page) -> str:
             continue
     log("[bcTitle] No product code found in any frame")
     return ""
-def read_analysis_summary_and_product_for_txid(page, txid: str):
-    ok = search_activities_for_id(page, txid)
-    if not ok:
-        log(f"[PA-SUMMARY] search_activities_for_id failed for txid={txid}")
-        return "", ""
-    prod_code = get_current_activity_product_code(page)
-    log(f"[PA-SUMMARY] txid={txid} → bcTitle product={prod_code!r}")
-    click_tab_by_text(page, page.main_frame, "Text Info") or \
-    click_tab_by_text(page, page.main_frame, "_ovviewset.do_0006")
-    txt = read_analysis_summary_for_current_pli(page)
-    if not txt:
-        page.wait_for_timeout(500)
-        txt = read_analysis_summary_for_current_pli(page)
-    return (txt or "").strip(), (prod_code or "").strip()
-def read_investigation_summary_and_product_for_txid(page, txid: str):
-    ok = search_activities_for_id(page, txid)
-    if not ok:
-        log(f"[INV-SUMMARY] search_activities_for_id failed for txid={txid}")
-        return "", ""
+def _read_activity_text_info(page, txid: str, kind: str):
+    tag = "PA-SUMMARY" if kind == "analysis" else "INV-SUMMARY"
+    reader = read_analysis_summary_for_current_pli if kind == "analysis" else read_investigation_summary_for_current_pli
     prod_code = get_current_activity_product_code(page)
-    log(f"[INV-SUMMARY] txid={txid} → bcTitle product={prod_code!r}")
+    log(f"[{tag}] txid={txid} → bcTitle product={prod_code!r}")
     click_tab_by_text(page, page.main_frame, "Text Info") or \
     click_tab_by_text(page, page.main_frame, "_ovviewset.do_0006")
-    txt = read_investigation_summary_for_current_pli(page)
-    if not txt:
-        page.wait_for_timeout(500)
-        txt = read_investigation_summary_for_current_pli(page)
+    txt = reader(page, object_id=txid)
     return (txt or "").strip(), (prod_code or "").strip()
+def _activity_parallel_pages(cfg) -> int:
+    try:
+        return max(1, int((cfg.get('activities', {}) or {}).get('parallel_pages', 1)))
+    except (TypeError, ValueError):
+        return 1
+def _open_activity_pages(context, cfg, n):
+    pending = []
+    for _ in range(n):
+        try:
+            pg = watch_page(context.new_page())
+            pg.goto(cfg['crm_url'], wait_until="commit")
+            pending.append(pg)
+        except Exception as e:
+            log(f"[activities] could not open extra page: {e}")
+    ready = []
+    for pg in pending:
+        if probe_search_ready(pg, cfg, timeout_ms=(cfg.get('activities', {}) or {}).get('page_ready_timeout_ms', 20000)):
+            ready.append(pg)
+        else:
+            log("[activities] extra page never reached the CRM search; closing it")
+            try: pg.close()
+            except Exception: pass
+    return ready
+_ACTIVITY_PAGES = {}
+def _activity_pages(context, cfg, n):
+    pool = []
+    for pg in _ACTIVITY_PAGES.get(context, []):
+        try:
+            if not pg.is_closed():
+                pool.append(pg)
+        except Exception:
+            pass
+    if len(pool) < n:
+        pool += _open_activity_pages(context, cfg, n - len(pool))
+    _ACTIVITY_PAGES[context] = pool
+    return pool[:n]
+def release_activity_pages(context):
+    for pg in _ACTIVITY_PAGES.pop(context, []):
+        try: pg.close()
+        except Exception: pass
+def fetch_activity_summaries(page, jobs, cfg):
+    results = {}
+    jobs = list(dict.fromkeys(jobs))
+    if not jobs:
+        return results
+    extra = min(_activity_parallel_pages(cfg), len(jobs)) - 1
+    pages = [page]
+    if extra > 0:
+        pages += _activity_pages(page.context, cfg, extra)
+        log(f"[activities] fetching {len(jobs)} activities across {len(pages)} page(s)")
+    for start in range(0, len(jobs), len(pages)):
+        batch = list(zip(pages, jobs[start:start + len(pages)]))
+        submitted = []
+        for pg, (kind, txid) in batch:
+            tag = "PA-SUMMARY" if kind == "analysis" else "INV-SUMMARY"
+            if submit_deep_link(pg, cfg, "activity", txid):
+                submitted.append((pg, kind, txid, _DEEP_LINKED))
+                continue
+            log(f"[{tag}] submitting activity search for {txid}")
+            submitted.append((pg, kind, txid, _submit_activity_search(pg, txid)))
+        for pg, kind, txid, fr in submitted:
+            tag = "PA-SUMMARY" if kind == "analysis" else "INV-SUMMARY"
+            if fr is _DEEP_LINKED:
+                ok = settle_deep_link(pg, cfg, "activity", txid) or search_activities_for_id(pg, txid)
+            else:
+                ok = bool(fr) and _settle_activity_search(pg, fr)
+            if not ok:
+                log(f"[{tag}] search_activities_for_id failed for txid={txid}")
+                results[(kind, txid)] = ("", "")
+                continue
+            try:
+                results[(kind, txid)] = _read_activity_text_info(pg, txid, kind)
+            except Exception as e:
+                log(f"[{tag}] error reading txid={txid}: {e}")
+                results[(kind, txid)] = ("", "")
+    return results
 def _normalize_text_preserve(s: str) -> str:
     if s is None:
         return ""
@@ -862,149 +1728,123 @@ def _normalize_text_preserve(s: str) -> str:
     lines = [re.sub(r"[ \t]+$", "", ln) for ln in lines]
     s = "\n".join(lines)
     return _strip_boilerplate_sentences(s)
-def _safe_td_text(td, preserve=False):
-    if not td or not td.count():
+_PLI_SN_XPATHS = [
+    ".//td[starts-with(@id,'GUIDE-ProductLineItemsTable-') and contains(@id,'-SN')]",
+    ".//span[contains(translate(@aria-label,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'s/n')]",
+    ".//span[contains(translate(@aria-label,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'serial')]",
+]
+_PLI_LOT_XPATHS = [
+    ".//td[starts-with(@id,'GUIDE-ProductLineItemsTable-') and contains(@id,'-Lot')]",
+    ".//span[contains(translate(@aria-label,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'lot')]",
+]
+_PLI_ROWS_JS = """
+(root, spec) => {
+    const doc = root.ownerDocument || root;
+    const first = (ctx, xp) => {
+        try { return doc.evaluate(xp, ctx, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue; }
+        catch (e) { return null; }
+    };
+    const all = (ctx, xp) => {
+        const out = [];
+        try {
+            const snap = doc.evaluate(xp, ctx, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            for (let i = 0; i < snap.snapshotLength; i++) out.push(snap.snapshotItem(i));
+        } catch (e) {}
+        return out;
+    };
+    const node = n => n ? {
+        text: n.innerText || '',
+        title: n.getAttribute('title') || '',
+        aria: n.getAttribute('aria-label') || '',
+    } : null;
+    return all(root, spec.row).map(row => {
+        const complaint = first(row, spec.complaint);
+        const product = first(row, spec.product);
+        const desc = first(row, spec.desc);
+        return {
+            complaint: node(complaint),
+            complaint_span: complaint ? node(first(complaint, './/span')) : null,
+            product: node(product),
+            product_anchor: product ? node(first(product, spec.product_anchor)) : null,
+            desc: node(desc),
+            desc_anchor: desc ? node(first(desc, './/a')) : null,
+            sn: spec.sn.map(xp => node(first(row, xp))),
+            lot: spec.lot.map(xp => node(first(row, xp))),
+        };
+    });
+}
+"""
+_BTADMINI_ROWS_JS = """
+(root, spec) => {
+    const doc = root.ownerDocument || root;
+    const first = (ctx, xp) => {
+        try { return doc.evaluate(xp, ctx, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue; }
+        catch (e) { return null; }
+    };
+    const node = n => n ? {
+        text: n.innerText || '',
+        title: n.getAttribute('title') || '',
+        aria: n.getAttribute('aria-label') || '',
+    } : null;
+    const rows = [];
+    const snap = doc.evaluate(spec.row, root, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    for (let i = 0; i < snap.snapshotLength; i++) rows.push(snap.snapshotItem(i));
+    return rows.map(row => {
+        const link = first(row, spec.link);
+        return {
+            complaint_span: node(first(row, spec.complaint)),
+            link: node(link),
+            desc: link ? node(first(link, 'ancestor::td[1]/following-sibling::td[1]')) : null,
+        };
+    });
+}
+"""
+def _snap_attr_or_text(n) -> str:
+    if not n:
         return ""
-    try:
-        if preserve:
-            raw = td.evaluate("n => n.textContent || ''") or ""
-            return _normalize_text_preserve(raw)
-        raw = td.evaluate("""
-            (node) => {
-                const a = node.querySelector("a[id*='text_table'][id*='lines']");
-                if (a) {
-                    const t = a.getAttribute('title') || a.getAttribute('aria-label');
-                    if (t && t.trim()) return t;
-                }
-                return node.textContent || '';
-            }
-        """) or ""
-    except Exception:
-        try:
-            raw = td.evaluate("n => n.textContent || ''") or ""
-        except Exception:
-            raw = ""
-    return _normalize_text(raw) if not preserve else _normalize_text_preserve(raw)
-def read_all_products(page, root_frame):
-    click_tab_by_text(page, root_frame, "Product Line Items") or \
-    click_tab_by_text(page, root_frame, "_ovviewset.do_0002")
-    fr = find_frame_with(page, "xpath=//td[starts-with(@id,'GUIDE-ProductLineItemsTable-')]")
-    if fr:
-        tbl = _pli_table(fr)
-        if tbl and tbl.count():
-            rows = tbl.locator(
-                "xpath=.//tr[td[starts-with(@id,'GUIDE-ProductLineItemsTable-') and contains(@id,'-Product')]]"
-            )
-            n = rows.count()
-            out = []
-            for i in range(n):
-                row = rows.nth(i)
-                complaint_val = ""
-                complaint_td = row.locator(
-                    "xpath=.//td[starts-with(@id,'GUIDE-ProductLineItemsTable-') "
-                    "and contains(@id,'-Complaint')]"
-                ).first
-                if complaint_td.count():
-                    span = complaint_td.locator("xpath=.//span").first
-                    if span.count():
-                        complaint_val = clean(
-                            span.get_attribute("title")
-                            or span.inner_text()
-                        )
-                    else:
-                        complaint_val = clean(complaint_td.inner_text())
-                complaint_norm = (complaint_val or "").strip().lower()
-                if complaint_norm.startswith("no"):
-                    log(f"[PLI] Skipping product row {i+1}/{n} because Complaint={complaint_val!r}")
-                    continue
-                prod_cell = row.locator(
-                    f"xpath=.//td[starts-with(@id,'GUIDE-ProductLineItemsTable-') and {ENDS_WITH_PRODUCT}]"
-                ).first
-                desc_cell = row.locator(
-                    f"xpath=.//td[starts-with(@id,'GUIDE-ProductLineItemsTable-') and {ENDS_WITH_DESCRIPTION}]"
-                ).first
-                pid = ""
-                if prod_cell.count():
-                    a = prod_cell.locator("xpath=.//a[contains(@id,'ordered_prod')]").first
-                    if a.count():
-                        pid = _get_attr_or_text(a)
-                    if not pid:
-                        pid = _get_attr_or_text(prod_cell)
-                if pid and not re.search(r"[A-Za-z]", pid):
-                    pid = ""
-                pdesc = ""
-                if desc_cell.count():
-                    a = desc_cell.locator("xpath=.//a").first
-                    pdesc = _get_attr_or_text(a) if a.count() else _get_attr_or_text(desc_cell)
-                pcode = pid or extract_product_code(pdesc)
-                sn_candidates = [
-                    "xpath=.//td[starts-with(@id,'GUIDE-ProductLineItemsTable-') and contains(@id,'-SN')]",
-                    "xpath=.//span[contains(translate(@aria-label,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'s/n')]",
-                    "xpath=.//span[contains(translate(@aria-label,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'serial')]",
-                ]
-                sn_val = ""
-                for sel in sn_candidates:
-                    sn_el = row.locator(sel).first
-                    if sn_el.count():
-                        sn_val = clean(sn_el.inner_text())
-                        if sn_val:
-                            break
-                lot_candidates = [
-                    "xpath=.//td[starts-with(@id,'GUIDE-ProductLineItemsTable-') and contains(@id,'-Lot')]",
-                    "xpath=.//span[contains(translate(@aria-label,'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'lot')]",
-                ]
-                lot_val = ""
-                for sel in lot_candidates:
-                    lot_el = row.locator(sel).first
-                    if lot_el.count():
-                        lot_val = clean(lot_el.inner_text())
-                        if lot_val:
-                            break
-                if pid or pdesc or sn_val or lot_val:
-                    out.append({
-                        "id": pid,
-                        "desc": pdesc,
-                        "code": pcode,
-                        "sn": sn_val,
-                        "lot": lot_val,
-                        "complaint": complaint_val or "",
-                    })
-            if out:
-                return out
-    fr = find_frame_with(page, "xpath=//*[contains(@id,'btadmini_table')]")
-    if not fr:
-        return []
-    rows = fr.locator("xpath=.//tr[.//a[contains(@id,'ordered_prod')]]")
-    n = rows.count()
+    text = clean(n.get("text") or "")
+    if text:
+        return text
+    return clean(n.get("title") or n.get("aria") or "")
+def _snap_text(n) -> str:
+    return clean((n or {}).get("text") or "")
+def _snap_first_index(nodes):
+    for i, n in enumerate(nodes or []):
+        if _snap_text(n):
+            return i
+    return None
+def _snap_first_text(nodes) -> str:
+    i = _snap_first_index(nodes)
+    return _snap_text(nodes[i]) if i is not None else ""
+def _pli_rows_from_snapshot(rows):
     out = []
-    for i in range(n):
-        row = rows.nth(i)
+    n = len(rows)
+    for i, r in enumerate(rows):
         complaint_val = ""
-        complaint_span = row.locator(
-            "xpath=.//span[contains(@id,'zcomplaint') or @aria-label='Complaint']"
-        ).first
-        if complaint_span.count():
-            complaint_val = clean(
-                complaint_span.get_attribute("title") or complaint_span.inner_text()
-            )
+        if r.get("complaint"):
+            span = r.get("complaint_span")
+            if span:
+                complaint_val = clean(span.get("title") or span.get("text"))
+            else:
+                complaint_val = _snap_text(r["complaint"])
         complaint_norm = (complaint_val or "").strip().lower()
         if complaint_norm.startswith("no"):
-            log(f"[PLI-btadmini] Skipping product row {i+1}/{n} because Complaint={complaint_val!r}")
+            log(f"[PLI] Skipping product row {i+1}/{n} because Complaint={complaint_val!r}")
             continue
-        ordered_link = row.locator("xpath=.//a[contains(@id,'ordered_prod')]").first
-        pid = _get_attr_or_text(ordered_link) if ordered_link.count() else ""
+        pid = ""
+        if r.get("product"):
+            pid = _snap_attr_or_text(r.get("product_anchor"))
+            if not pid:
+                pid = _snap_attr_or_text(r["product"])
+        if pid and not re.search(r"[A-Za-z]", pid):
+            pid = ""
         pdesc = ""
-        try:
-            if ordered_link.count():
-                maybe_desc = ordered_link.locator("xpath=ancestor::td[1]/following-sibling::td[1]").first
-                if maybe_desc.count():
-                    pdesc = clean(maybe_desc.inner_text())
-        except Exception:
-            pass
+        if r.get("desc"):
+            pdesc = _snap_attr_or_text(r.get("desc_anchor") or r["desc"])
         pcode = pid or extract_product_code(pdesc)
-        sn_val = ""
-        lot_val = ""
-        if pid or pdesc:
+        sn_val = _snap_first_text(r.get("sn"))
+        lot_val = _snap_first_text(r.get("lot"))
+        if pid or pdesc or sn_val or lot_val:
             out.append({
                 "id": pid,
                 "desc": pdesc,
@@ -1014,222 +1854,238 @@ def read_all_products(page, root_frame):
                 "complaint": complaint_val or "",
             })
     return out
-def _dates_table(frame):
-    return frame.locator("xpath=//table[.//td[starts-with(@id,'GUIDE-DatesTable')]]").first
-def get_event_date(page):
-    click_tab_by_text(page, page.main_frame, "Dates") or \
-    click_tab_by_text(page, page.main_frame, "_ovviewset.do_0003")
-    fr = find_frame_with(page, "xpath=//td[starts-with(@id,'GUIDE-DatesTable')]")
+def _btadmini_rows_from_snapshot(rows):
+    out = []
+    n = len(rows)
+    for i, r in enumerate(rows):
+        complaint_val = ""
+        span = r.get("complaint_span")
+        if span:
+            complaint_val = clean(span.get("title") or span.get("text"))
+        complaint_norm = (complaint_val or "").strip().lower()
+        if complaint_norm.startswith("no"):
+            log(f"[PLI-btadmini] Skipping product row {i+1}/{n} because Complaint={complaint_val!r}")
+            continue
+        pid = _snap_attr_or_text(r.get("link"))
+        pdesc = _snap_text(r.get("desc"))
+        pcode = pid or extract_product_code(pdesc)
+        if pid or pdesc:
+            out.append({
+                "id": pid,
+                "desc": pdesc,
+                "code": pcode,
+                "sn": "",
+                "lot": "",
+                "complaint": complaint_val or "",
+            })
+    return out
+def read_all_products(page, root_frame):
+    click_tab_by_text(page, root_frame, "Product Line Items") or \
+    click_tab_by_text(page, root_frame, "_ovviewset.do_0002")
+    fr = find_frame_with(page, "xpath=//td[starts-with(@id,'GUIDE-ProductLineItemsTable-')]")
+    if fr:
+        tbl = _pli_table(fr)
+        if tbl and tbl.count():
+            candidates = {"sn": _PLI_SN_XPATHS, "lot": _PLI_LOT_XPATHS}
+            spec = {
+                "row": ".//tr[td[starts-with(@id,'GUIDE-ProductLineItemsTable-') and contains(@id,'-Product')]]",
+                "complaint": ".//td[starts-with(@id,'GUIDE-ProductLineItemsTable-') and contains(@id,'-Complaint')]",
+                "product": f".//td[starts-with(@id,'GUIDE-ProductLineItemsTable-') and {ENDS_WITH_PRODUCT}]",
+                "product_anchor": ".//a[contains(@id,'ordered_prod')]",
+                "desc": f".//td[starts-with(@id,'GUIDE-ProductLineItemsTable-') and {ENDS_WITH_DESCRIPTION}]",
+                "sn": candidates["sn"],
+                "lot": candidates["lot"],
+            }
+            started = time.time()
+            try:
+                rows = cl_call(tbl, "pliRows", spec) or []
+            except Exception as e:
+                log(f"[PLI] table snapshot failed: {e}")
+                rows = []
+            out = _pli_rows_from_snapshot(rows)
+            log(f"[PLI] read {len(rows)} row(s) in {(time.time() - started) * 1000:.0f} ms")
+            if out:
+                return out
+    fr = find_frame_with(page, "xpath=//*[contains(@id,'btadmini_table')]")
     if not fr:
-        return ""
-    tbl = _dates_table(fr)
-    if not tbl or not tbl.count():
-        return ""
-    row = tbl.locator(
-        "xpath=.//tr[td[starts-with(@id,'GUIDE-DatesTable') and contains(@id,'-DateType') and normalize-space(.)='Event Date']]"
-    ).first
-    if not row.count():
-        return ""
-    cell = row.locator(
-        "xpath=.//td[starts-with(@id,'GUIDE-DatesTable') and contains(@id,'-DateFrom')]"
-    ).first
-    return clean(cell.inner_text()) if cell.count() else ""
-def _aer_table(frame):
-    return frame.locator("xpath=//table[.//td[starts-with(@id,'GUIDE-AdditionalExternalReferencesTable-')]]").first
-def _aer_row_by_type(tbl, *type_fragments):
-    for t in type_fragments:
-        row = tbl.locator(
-            f"xpath=.//tr[td[starts-with(@id,'GUIDE-AdditionalExternalReferencesTable-') and contains(@id,'-ExtReferenceType') and normalize-space(.)='{t}']]"
-        ).first
-        if row.count():
-            return row
-    for t in type_fragments:
-        low = t.lower()
-        row = tbl.locator(
-            "xpath=.//tr[td[starts-with(@id,'GUIDE-AdditionalExternalReferencesTable-') and contains(@id,'-ExtReferenceType') "
-            f"and contains(translate(normalize-space(.),'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'), '{low}')]]"
-        ).first
-        if row.count():
-            return row
-    return None
-def _aer_rows_by_type(tbl, *type_fragments):
-    rows = []
-    for t in type_fragments:
-        cand = tbl.locator(
-            "xpath=.//tr[td[starts-with(@id,'GUIDE-AdditionalExternalReferencesTable-') "
-            "and contains(@id,'-ExtReferenceType') and normalize-space(.)=$t]]"
-        ).filter(has_text=t)
-        for i in range(cand.count()):
-            rows.append(cand.nth(i))
-    if rows:
-        return rows
-    for t in type_fragments:
-        low = t.lower()
-        cand = tbl.locator(
-            "xpath=.//tr[td[starts-with(@id,'GUIDE-AdditionalExternalReferencesTable-') "
-            "and contains(@id,'-ExtReferenceType') and "
-            "contains(translate(normalize-space(.),"
-            "'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),"
-            f" '{low}')]]"
-        )
-        for i in range(cand.count()):
-            rows.append(cand.nth(i))
-    return rows
-def _aer_comment_from_row(row):
+        return []
+    spec = {
+        "row": "//tr[.//a[contains(@id,'ordered_prod')]]",
+        "complaint": ".//span[contains(@id,'zcomplaint') or @aria-label='Complaint']",
+        "link": ".//a[contains(@id,'ordered_prod')]",
+    }
     try:
-        td = row.locator(
-            "xpath=.//td[starts-with(@id,'GUIDE-AdditionalExternalReferencesTable-') "
-            "and contains(@id,'-ExtReferenceText')]"
-        ).first
-        if td.count():
-            return clean(td.inner_text())
-    except Exception:
-        pass
-    return ""
-def _aer_number_from_row(row):
-    for suffix in ("-ExtReferenceNumber", "-ExtReferenceID", "reference_number", "reference_id"):
-        td = row.locator(
-            f"xpath=.//td[starts-with(@id,'GUIDE-AdditionalExternalReferencesTable-') and contains(@id,'{suffix}')]"
-        ).first
-        if td.count():
-            return clean(td.inner_text())
-    return ""
-def read_external_refs(page, root_frame):
-    owner = click_tab_by_text(page, root_frame, "Additional External References") or \
-            click_tab_by_text(page, root_frame, "_ovviewset.do_0013")
-    fr = find_frame_with(page, "xpath=//td[starts-with(@id,'GUIDE-AdditionalExternalReferencesTable-')]")
-    if not fr:
-        return {"rb_reference": "", "report_number": ""}
-    tbl = _aer_table(fr)
-    if not tbl or not tbl.count():
-        return {"rb_reference": "", "report_number": ""}
-    out = {"rb_reference": "", "report_number": ""}
-    rb_row = _aer_row_by_type(tbl, "RB Reference", "RB", "RBReference")
-    if rb_row:
-        out["rb_reference"] = _aer_number_from_row(rb_row)
-    rep_row = _aer_row_by_type(tbl, "MPXR")
-    if rep_row:
-        out["report_number"] = _aer_number_from_row(rep_row)
-    contact_rows = _aer_rows_by_type(
-        tbl,
-        "External Contact", "ExternalContact", "Ext Contact", "Ext. Contact"
+        rows = cl_call(fr, "btadminiRows", spec) or []
+    except Exception as e:
+        log(f"[PLI-btadmini] table snapshot failed: {e}")
+        return []
+    return _btadmini_rows_from_snapshot(rows)
+_AER_TABS = ["Additional External References", "_ovviewset.do_0013"]
+def read_external_contacts(page, root_frame, tables=None):
+    tables = {} if tables is None else tables
+    if "AdditionalExternalReferences" not in tables:
+        tables["AdditionalExternalReferences"] = read_guide_table_on_tab(
+            page, root_frame, "AdditionalExternalReferences", _AER_TABS
+        )
+    contact_rows = guide_find_rows(
+        tables["AdditionalExternalReferences"], "ExtReferenceType",
+        ["External Contact", "ExternalContact", "Ext Contact", "Ext. Contact"]
     )
-    contacts = []
-    for row in contact_rows or []:
-        num = _aer_number_from_row(row)
-        txt = _aer_comment_from_row(row)
-        contacts.append({
-            "number": num,
-            "text": txt,
-        })
-
-    out["external_contacts"] = contacts
-    return out
-def _find_latest_text_table(page):
-    tables = []
-    for fr in page.frames:
+    number_cols = ("ExtReferenceNumber", "ExtReferenceID", "reference_number", "reference_id")
+    return [
+        {"number": guide_cell(row, *number_cols), "text": guide_cell(row, "ExtReferenceText")}
+        for row in contact_rows
+    ]
+_TEXTINFO_ROWS_JS = r"""
+() => {
+    const CELL = 'GUIDE-TextInfoTable-';
+    const scopes = Array.from(document.querySelectorAll("div[class*='th-clr-cnt-bottom']"));
+    const tables = [];
+    for (const scope of (scopes.length ? scopes : [document])) {
+        for (const t of scope.querySelectorAll('table')) {
+            if (t.querySelector("td[id^='" + CELL + "']") && !tables.includes(t)) tables.push(t);
+        }
+    }
+    const tbl = tables[tables.length - 1];
+    if (!tbl) return null;
+    const rows = [];
+    for (const tr of tbl.querySelectorAll('tr')) {
+        const direct = Array.from(tr.children).filter(td => td.tagName === 'TD' && (td.id || '').startsWith(CELL));
+        const typeTd = direct.find(td => td.id.includes('-TextType'));
+        const hasText = direct.some(td => td.id.includes('-Text'));
+        if (!typeTd && !hasText) continue;
+        const textTd = Array.from(tr.querySelectorAll("td[id^='" + CELL + "']"))
+            .find(td => td.id.includes('-Text') && !td.id.includes('-TextType'));
+        const a = textTd ? textTd.querySelector("a[id*='text_table'][id*='lines']") : null;
+        rows.push({
+            type: typeTd ? (typeTd.textContent || '') : '',
+            has_text_cell: !!textTd,
+            text: textTd ? (textTd.textContent || '') : '',
+            title: a ? (a.getAttribute('title') || a.getAttribute('aria-label') || '') : '',
+        });
+    }
+    const bc = document.getElementById('bcTitle');
+    return { rows: rows, bc: bc ? (bc.getAttribute('title') || '') + ' ' + (bc.innerText || '') : null };
+}
+"""
+def object_on_screen(page, object_id: str, frames=None) -> bool:
+    if not object_id:
+        return True
+    for fr in frames or frame_registry(page).frames():
         try:
-            scope = fr.locator("xpath=//div[contains(@class,'th-clr-cnt-bottom')]")
-            scope = scope if scope.count() else fr
-            tds = scope.locator("xpath=.//table[.//td[starts-with(@id,'GUIDE-TextInfoTable-')]]")
-            n = tds.count()
-            for i in range(n):
-                tables.append((fr, tds.nth(i)))
+            td = fr.locator("xpath=//td[@id='bcTitle']").first
+            if td.count() and object_id in ((td.get_attribute("title") or "") + " " + (td.inner_text() or "")):
+                return True
         except Exception:
             pass
-    return tables[-1] if tables else (None, None)
-def read_event_description(page, root_frame):
-    click_tab_by_text(page, root_frame, "Text Info") or \
-    click_tab_by_text(page, root_frame, "_ovviewset.do_0006")
-    frames = active_content_frames(page, {"content_frame_name_regex": "WorkAreaFrame1"})
-    tbl = None
-    chosen_frame = None
-    for fr in frames:
-        try:
-            fr.wait_for_selector("xpath=//td[starts-with(@id,'GUIDE-TextInfoTable-')]", timeout=3000)
-            candidate = _find_latest_text_table_in(fr)
-            if candidate:
-                tbl, chosen_frame = candidate, fr
-                break
-        except Exception:
-            continue
-    if not (tbl and chosen_frame):
-        fr, tbl_fallback = _find_latest_text_table(page)
-        if not (fr and tbl_fallback and tbl_fallback.count()):
-            return ""
-        chosen_frame, tbl = fr, tbl_fallback
-    want_types = [
-        "Incident description", "Incident description / Reason for report",
-        "Reason for report", "Description of Event", "Event Description",
-        "Narrative", "HCP Narrative", "Event narrative", "Incident Narrative"
-    ]
+    return False
+def _text_info_snapshot(fr):
+    try:
+        return cl_call(fr, "textInfo")
+    except Exception as e:
+        log(f"[Text] Text Info snapshot failed: {e}")
+        return None
+def _text_info_is_for(page, snap, object_id):
+    if not object_id or not snap or not snap.get("rows"):
+        return True
+    if snap.get("bc") is None:
+        return object_on_screen(page, object_id)
+    return object_id in snap["bc"]
+def _scan_text_info_frames(page, object_id):
+    found = []
+    for fr in frame_registry(page).frames():
+        snap = _text_info_snapshot(fr)
+        if snap and snap.get("rows"):
+            found.append((fr, snap))
+    owned = [(fr, snap) for fr, snap in found if _text_info_is_for(page, snap, object_id)]
+    if owned:
+        return owned[-1] + (True,)
+    return (found or [(None, None)])[-1] + (False,)
+_TEXTINFO_CACHE = {}
+def read_text_info(page, object_id="", timeout_ms=3000):
+    reg = frame_registry(page)
+    fr, _ = wait_for_selector_in_kind(page, "text_info", _FRAME_KIND_SELECTORS["text_info"][0], timeout_ms=timeout_ms)
+    if not fr:
+        return None
+    key = (object_id or "", fr, reg.generation.get(fr, 0))
+    hit = _TEXTINFO_CACHE.get(key)
+    if hit is not None:
+        return hit
+    state = {"snap": None, "empty": 0}
+    def _fresh():
+        state["snap"] = snap = _text_info_snapshot(fr)
+        if snap and snap.get("rows"):
+            return _text_info_is_for(page, snap, object_id)
+        state["empty"] += 1
+        if state["empty"] == 1:
+            wait_for_network_quiet(page, quiet_ms=200, timeout_ms=timeout_ms)
+            return False
+        return object_on_screen(page, object_id) if object_id else True
+    fresh = bool(wait_until(page, _fresh, timeout_ms=timeout_ms, poll_ms=150))
+    snap = state["snap"]
+    if not fresh:
+        other, other_snap, owned = _scan_text_info_frames(page, object_id)
+        if other is not None and (owned or not (snap or {}).get("rows")):
+            if other is not fr:
+                log(f"[Text] Text Info in {_frame_label(fr)} is not for {object_id}; using {_frame_label(other)}")
+            fr, snap, fresh = other, other_snap, owned
+    rows = (snap or {}).get("rows")
+    if not rows:
+        return {"frame": fr, "rows": []}
+    for r in rows:
+        r["type"] = re.sub(r"\s+", " ", (r.get("type") or "").replace("\xa0", " ")).strip()
+    info = {"frame": fr, "rows": rows}
+    if not fresh:
+        log(f"[Text] WARNING: Text Info on screen may not belong to {object_id}; not caching it")
+        return info
+    if len(_TEXTINFO_CACHE) > 64:
+        _TEXTINFO_CACHE.clear()
+    _TEXTINFO_CACHE[key] = info
+    log(f"[Text] Text Info rows: {[r['type'] for r in rows if r['type']]}")
+    return info
+def _text_info_row_value(row, preserve_format=False):
+    if preserve_format:
+        return _normalize_text_preserve(row.get("text") or "")
+    title = (row.get("title") or "").strip()
+    return _normalize_text(title or row.get("text") or "")
+def text_info_lookup(rows, wanted_labels, preserve_format=False):
     row = None
-    for t in want_types:
-        cand = tbl.locator(
-            "xpath=.//tr[td[starts-with(@id,'GUIDE-TextInfoTable-') and contains(@id,'-TextType') and normalize-space(.)=$t]]"
-        ).filter(has_text=t).first
-        if cand.count():
-            row = cand
+    for t in wanted_labels:
+        row = next((r for r in rows if r["has_text_cell"] and r["type"] == t), None)
+        if row:
             break
-    if not (row and row.count()):
-        for t in want_types:
+    if not row:
+        for t in wanted_labels:
             low = t.lower()
-            cand = tbl.locator(
-                "xpath=.//tr[td[starts-with(@id,'GUIDE-TextInfoTable-') and contains(@id,'-TextType') "
-                f"and contains(translate(normalize-space(.),'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'), '{low}')]]"
-            ).first
-            if cand.count():
-                row = cand
+            row = next((r for r in rows if r["has_text_cell"] and low in r["type"].lower()), None)
+            if row:
                 break
-    if not (row and row.count()):
-        row = tbl.locator("xpath=.//tr[td[starts-with(@id,'GUIDE-TextInfoTable-') and contains(@id,'-Text')]]").first
-        if not row.count():
-            log("[Text] No row with -Text found")
-            return ""
-    text_td = row.locator(
-        "xpath=.//td[starts-with(@id,'GUIDE-TextInfoTable-') and contains(@id,'-Text') and not(contains(@id,'-TextType'))]"
-    ).first
-    if not text_td.count():
-        log("[Text] No -Text cell present in row")
+    if not row:
+        return None
+    return _text_info_row_value(row, preserve_format)
+_EVENT_DESCRIPTION_TYPES = [
+    "Incident description", "Incident description / Reason for report",
+    "Reason for report", "Description of Event", "Event Description",
+    "Narrative", "HCP Narrative", "Event narrative", "Incident Narrative"
+]
+def read_event_description(page, root_frame, object_id=""):
+    click_tab_by_text(page, root_frame, "Text Info") or \
+    click_tab_by_text(page, root_frame, "_ovviewset.do_0006")
+    info = read_text_info(page, object_id)
+    if not info or not info["rows"]:
+        log("[Text] No Text Info table found")
         return ""
-    _suppress_clicks_enable(chosen_frame)
-    try:
-        desc = _safe_td_text(text_td)
-    finally:
-        _suppress_clicks_disable(chosen_frame)
-    log(f"[Text] Event description read from TD (no click), length={len(desc)}")
+    desc = text_info_lookup(info["rows"], _EVENT_DESCRIPTION_TYPES)
+    if desc is None:
+        row = next((r for r in info["rows"] if r["has_text_cell"]), None)
+        if not row:
+            log("[Text] No -Text cell present in any row")
+            return ""
+        desc = _text_info_row_value(row)
+    log(f"[Text] Event description read from Text Info snapshot, length={len(desc)}")
     return desc
-def _textinfo_signature(page):
-    fr, tbl = _find_latest_analysis_table_nearby(page)
-    if not (fr and tbl and tbl.count()):
-        return ""
-    try:
-        s = tbl.evaluate("t => (t.innerText || '').slice(0, 800)")
-    except Exception:
-        s = tbl.inner_text()[:800] if tbl.count() else ""
-    return s
-def wait_for_textinfo_change(page, previous_sig, timeout=10000):
-    start = time.time()
-    while time.time() - start < (timeout/1000.0):
-        sig = _textinfo_signature(page)
-        if sig and sig != previous_sig:
-            return True
-        time.sleep(0.15)
-    return False
 def _find_leftnav_frame(page):
-    for fr in page.frames:
-        try:
-            if fr.locator("xpath=//*[contains(@class,'left-nav')]").first.count():
-                return fr
-        except Exception:
-            pass
-    for fr in page.frames:
-        try:
-            if fr.locator("css=a[data-trans-id], a[data-transId], a[data-transid], a.GUIDE-sideNav, a.GUIDE-sideNavLink").first.count():
-                return fr
-        except Exception:
-            pass
-    return None
+    return frame_registry(page).find("leftnav")
 def _section_class(section_text: str) -> str:
     return {
         "Product Analysis": "ProductAnalysis",
@@ -1260,11 +2116,11 @@ def _leftnav_section_container(fr, section_text: str):
     container = header.locator("xpath=following-sibling::div[contains(@class,'data-wrapper')][1]").first
     if container.count() == 0 and clicker.count():
         robust_click(clicker, fr)
+        container = header.locator("xpath=following-sibling::div[contains(@class,'data-wrapper')][1]").first
         try:
-            fr.wait_for_timeout(250)
+            container.wait_for(state="attached", timeout=2000)
         except Exception:
             pass
-        container = header.locator("xpath=following-sibling::div[contains(@class,'data-wrapper')][1]").first
     return container if container.count() else None
 def _anchors_in_section(fr, section_text: str):
     anchors = fr.locator(_section_anchor_xpath(section_text))
@@ -1322,10 +2178,7 @@ def _scan_pa_anywhere(page, section_text: str):
 def _enumerate_pa_items(fr):
     return _enumerate_section_items(fr, "Product Analysis")
 def _content_frame(page):
-    for fr in page.frames:
-        if (fr.name or "") == "WorkAreaFrame1":
-            return fr
-    return page.main_frame
+    return frame_registry(page).by_name("workarea") or page.main_frame
 def _ensure_section_expanded(page, section: str):
     fr = _find_leftnav_frame(page)
     if not fr:
@@ -1348,13 +2201,15 @@ def _ensure_section_expanded(page, section: str):
     need_click = True
     if container.count():
         try:
-            need_click = container.evaluate("n => getComputedStyle(n).display === 'none'")
+            need_click = cl_call(container, "isHidden")
         except Exception:
             pass
     if need_click and clicker.count():
         robust_click(clicker, fr)
-        try: fr.wait_for_timeout(250)
-        except Exception: pass
+        try:
+            container.wait_for(state="visible", timeout=2000)
+        except Exception:
+            pass
 def list_side_nav_items(page, section: str):
     fr = _find_leftnav_frame(page)
     if not fr:
@@ -1374,61 +2229,14 @@ def list_side_nav_items(page, section: str):
         code = extract_product_code(t)
         out.append({"text": t, "code": code, "el": el, "frame": fr})
     return out
-def _find_latest_analysis_table_nearby(page):
-    candidates = []
-    for fr in page.frames:
-        try:
-            scope = fr.locator("xpath=//div[contains(@class,'th-clr-cnt-bottom')]")
-            scope = scope if scope.count() else fr
-            tds = scope.locator("xpath=.//table[.//td[starts-with(@id,'GUIDE-TextInfoTable-')]]")
-            n = tds.count()
-            for i in range(n):
-                candidates.append((fr, tds.nth(i)))
-        except Exception:
-            pass
-    return candidates[-1] if candidates else (None, None)
-def read_text_by_labels(page, wanted_labels, *, preserve_format=False):
-    fr, tbl = _find_latest_analysis_table_nearby(page)
-    if not (fr and tbl and tbl.count()):
-        return None
-    row = None
-    for t in wanted_labels:
-        cand = tbl.locator(
-            "xpath=.//tr[td[starts-with(@id,'GUIDE-TextInfoTable-') "
-            "and contains(@id,'-TextType') and normalize-space(.)=$t]]"
-        ).filter(has_text=t).first
-        if cand.count():
-            row = cand; break
-    if not row:
-        for t in wanted_labels:
-            low = t.lower()
-            cand = tbl.locator(
-                "xpath=.//tr[td[starts-with(@id,'GUIDE-TextInfoTable-') "
-                "and contains(@id,'-TextType') and "
-                f"contains(translate(normalize-space(.),'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'), '{low}')]]"
-            ).first
-            if cand.count():
-                row = cand; break
-    if not row:
+def read_text_by_labels(page, wanted_labels, *, preserve_format=False, object_id=""):
+    info = read_text_info(page, object_id)
+    if not info:
         return None
-    td = row.locator(
-        "xpath=.//td[starts-with(@id,'GUIDE-TextInfoTable-') "
-        "and contains(@id,'-Text') and not(contains(@id,'-TextType'))]"
-    ).first
-    if td.count():
-        if preserve_format:
-            txt = _safe_td_text(td, preserve=True)
-            if txt:
-                return txt
-        else:
-            a = td.locator("xpath=.//a[contains(@id,'text_table') and contains(@id,'lines')]").first
-            if a.count():
-                full = (a.get_attribute('title') or a.get_attribute('aria-label') or '').strip()
-                if full:
-                    return _normalize_text(full)
-            txt = _safe_td_text(td, preserve=False)
-            if txt:
-                return txt
+    txt = text_info_lookup(info["rows"], wanted_labels, preserve_format)
+    if txt:
+        return txt
+    fr = info["frame"]
     detail_candidates = fr.locator(
         "xpath=("
         "//textarea[contains(@id,'-Text') and (@readonly or @disabled)] | "
@@ -1441,24 +2249,24 @@ def read_text_by_labels(page, wanted_labels, *, preserve_format=False):
         try:
             raw = detail_candidates.first.inner_text()
         except Exception:
-            raw = detail_candidates.first.evaluate("n => n.textContent || ''")
+            raw = cl_call(detail_candidates.first, "textContent")
         return _normalize_text_preserve(raw) if preserve_format else _normalize_text(raw)
     lab = fr.locator("xpath=//*[normalize-space(.)='Text' or contains(normalize-space(.),'Text')]/following::*[1]").first
     if lab.count():
         try:
             raw = lab.inner_text()
         except Exception:
-            raw = lab.evaluate("n => n.textContent || ''")
+            raw = cl_call(lab, "textContent")
         return _normalize_text_preserve(raw) if preserve_format else _normalize_text(raw)
     return None
-def read_analysis_summary_for_current_pli(page):
+def read_analysis_summary_for_current_pli(page, object_id=""):
     labels = [
         "Analysis Summary",
         "Analysis/Investigation Summary",
         "Analysis/Investigation conclusion",
         "Analysis/Investigation",
     ]
-    return (read_text_by_labels(page, labels, preserve_format=True) or "").strip()
+    return (read_text_by_labels(page, labels, preserve_format=True, object_id=object_id) or "").strip()
 def wait_for_search_with_retries(page, s, *, max_attempts=8, probe_period_ms=2000,
                                  reload_between_attempts=True, total_timeout_ms=240000):
     import re, time
@@ -1468,7 +2276,7 @@ def wait_for_search_with_retries(page, s, *, max_attempts=8, probe_period_ms=200
         try:
             loc, ctx, used = wait_find_in_any_frame(page,
                                                     [s.get('selector')] + (s.get('fallback_selectors', []) or []),
-                                                    timeout_ms=2500, poll_ms=150)
+                                                    timeout_ms=2500, poll_ms=150, purpose="search_input")
             return (loc, ctx, used)
         except Exception:
             return (None, None, None)
@@ -1478,7 +2286,7 @@ def wait_for_search_with_retries(page, s, *, max_attempts=8, probe_period_ms=200
         loc, ctx, used = _try_once()
         if loc:
             return (loc, ctx, used)
-        page.wait_for_timeout(probe_period_ms)
+        wait_for_frame_change(page, probe_period_ms)
         host = ""
         try:
             from urllib.parse import urlparse
@@ -1522,13 +2330,11 @@ def click_associated_transactions_tab(page, root_frame):
         or click_tab_by_text(page, root_frame, "_ovviewset.do_0012")
     )
 def _find_assoc_tx_frame(page):
-    for fr in page.frames:
-        try:
-            if fr.locator("xpath=//div[contains(@id,'_Table_bottom') or contains(@id,'_table_bottom')]").first.count():
-                return fr
-        except Exception:
-            pass
-    for fr in page.frames:
+    reg = frame_registry(page)
+    fr = reg.find("assoc_tx")
+    if fr:
+        return fr
+    for fr in reg.frames():
         try:
             if fr.get_by_role("button", name=re.compile(r"^\s*(Analysis|Investigation)\s*$", re.I)).first.count():
                 return fr
@@ -1537,45 +2343,61 @@ def _find_assoc_tx_frame(page):
         except Exception:
             pass
     return None
-def _row_guess_id_type_status(row):
-    txid = _row_txid(row)
-    status = _row_status_text(row)
-    return txid, status
-def _collect_unfiltered(fr, header_tbl, body_tbl, scroll_div):
+_ASSOC_TYPE_BUCKETS = (
+    ("product_analysis", re.compile(r"\banaly", re.I)),
+    ("investigation", re.compile(r"\binvestigat", re.I)),
+)
+def _classify_assoc_records(records, tx_product_map):
+    buckets = {name: {"complete": [], "any": []} for name, _ in _ASSOC_TYPE_BUCKETS}
+    typed = 0
+    for rec in records:
+        txid = rec["id"]
+        if txid and rec["product_code"]:
+            tx_product_map.setdefault(txid, rec["product_code"])
+        if not txid:
+            continue
+        for name, rx in _ASSOC_TYPE_BUCKETS:
+            if rx.search(rec["type"] or ""):
+                typed += 1
+                buckets[name]["any"].append(txid)
+                if rec["complete"]:
+                    buckets[name]["complete"].append(txid)
+                break
+    out = {}
+    for name, b in buckets.items():
+        ids_complete = list(dict.fromkeys(b["complete"]))
+        ids_any = list(dict.fromkeys(b["any"]))
+        if not ids_complete and ids_any:
+            log(f"[AssocTx:{name}] no explicit 'Complete' statuses found; returning all ({len(ids_any)})")
+        out[name] = ids_complete or ids_any
+    return out, typed
+def _collect_unfiltered(fr, header_tbl, body_tbl, scroll_div, tx_product_map):
     if not body_tbl or not body_tbl.count():
-        return {"product_analysis": [], "investigation": []}
+        return None
+    idx_id, idx_type, idx_status, idx_product = _hdr_indices_from_any(header_tbl, body_tbl)
+    if idx_type is None:
+        log("[AssocTx] (unfiltered) no transaction type column found")
+        return None
     _scroll_to_load_all_in_div(fr, body_tbl, scroll_div)
-    rows = body_tbl.locator("xpath=.//tr[td]")
-    pa, inv = [], []
-    for i in range(rows.count()):
-        row = rows.nth(i)
-        txid, gtype, status = _row_guess_id_type_status(row)
-        if not txid or not gtype:
-            continue
-        is_complete = False
-        if status:
-            s = status.lower()
-            is_complete = ("complete" in s) or (s.strip() == "completed") or ("closed - complete" in s)
-        else:
-            is_complete = False
-        if not is_complete:
-            continue
-        if gtype == "analysis":
-            pa.append(txid)
-        elif gtype == "investigation":
-            inv.append(txid)
-    pa = list(dict.fromkeys(pa))
-    inv = list(dict.fromkeys(inv))
-    log(f"[AssocTx] (unfiltered) PA complete={len(pa)} INV complete={len(inv)}")
-    return {"product_analysis": pa, "investigation": inv}
+    started = time.time()
+    records = assoc_records_from_snapshot(
+        snapshot_table_rows(body_tbl), idx_id, idx_type, idx_status, idx_product
+    )
+    out, typed = _classify_assoc_records(records, tx_product_map)
+    log(
+        f"[AssocTx] (unfiltered) {len(records)} row(s) read in {(time.time() - started) * 1000:.0f} ms; "
+        f"PA={len(out['product_analysis'])} INV={len(out['investigation'])}"
+    )
+    if records and not typed:
+        log("[AssocTx] (unfiltered) type column did not classify any row")
+        return None
+    return out
 def _assoc_click_filter(fr, label: str) -> bool:
     try:
         btn = fr.get_by_role("button", name=re.compile(rf"^\s*{re.escape(label)}\s*$", re.I)).first
         if btn.count():
             log(f"[AssocTx] clicking filter via role: {label}")
             robust_click(btn, fr)
-            try: fr.wait_for_timeout(300)
-            except Exception: pass
             return True
     except Exception:
         pass
@@ -1587,8 +2409,6 @@ def _assoc_click_filter(fr, label: str) -> bool:
         if btn.count():
             log(f"[AssocTx] clicking filter via span/b: {label}")
             robust_click(btn, fr)
-            try: fr.wait_for_timeout(300)
-            except Exception: pass
             return True
     except Exception:
         pass
@@ -1599,14 +2419,13 @@ def _assoc_click_filter(fr, label: str) -> bool:
             if cand.count():
                 log(f"[AssocTx] clicking filter via generic text: {label}")
                 robust_click(cand, fr)
-                try: fr.wait_for_timeout(300)
-                except Exception: pass
                 return True
     except Exception:
         pass
     log(f"[AssocTx] filter button NOT found: {label}")
     return False
 def _hdr_indices_from_any(header_tbl, body_tbl):
+    header_tbl, body_tbl = snapshot_element(header_tbl), snapshot_element(body_tbl)
     labels = []  # list of (index, label_text)
     if header_tbl and header_tbl.count():
         cells = header_tbl.locator("xpath=.//thead//th|.//thead//td|.//tr[1]/*")
@@ -1648,7 +2467,98 @@ def _hdr_indices_from_any(header_tbl, body_tbl):
         r'\bprod\b'
     ])
     return idx_id, idx_type, idx_status, idx_product
+_LAZY_LOAD = {"quiet_ms": 1200, "max_ms": 30000, "stagnant_steps": 3}
+def configure_lazy_load(cfg):
+    at = cfg.get('assoc_tx', {}) or {}
+    _LAZY_LOAD["quiet_ms"] = int(at.get('lazy_quiet_ms', 1200))
+    _LAZY_LOAD["max_ms"] = int(at.get('lazy_max_ms', 30000))
+    _LAZY_LOAD["stagnant_steps"] = max(1, int(at.get('lazy_stagnant_steps', 3)))
+_LAZY_LOAD_JS = """
+async (tbl, opt) => {
+    const started = performance.now();
+    const rowCount = () => Array.from(tbl.querySelectorAll('tr')).filter(tr => tr.querySelector('td')).length;
+    const findScroller = (n) => {
+        while (n && n !== n.ownerDocument.body) {
+            const st = getComputedStyle(n);
+            if (/(auto|scroll)/.test(st.overflowY) && n.scrollHeight > n.clientHeight) return n;
+            n = n.parentElement;
+        }
+        return tbl.ownerDocument.scrollingElement;
+    };
+    const expected = () => {
+        const rx = /\\bof\\s+(\\d+)\\b|\\((\\d+)\\)\\s*$/i;
+        let n = tbl.parentElement;
+        for (let depth = 0; n && depth < 10; depth++, n = n.parentElement) {
+            for (const el of n.querySelectorAll("[class*='title'], [class*='Title'], [class*='pager'], [class*='th-pag']")) {
+                if (tbl.contains(el)) continue;
+                const m = rx.exec((el.innerText || '').trim());
+                if (m) return parseInt(m[1] || m[2], 10);
+            }
+        }
+        return null;
+    };
+    const scroller = opt.target || findScroller(tbl.parentElement);
+    let lastChange = performance.now();
+    const obs = new MutationObserver(() => { lastChange = performance.now(); });
+    obs.observe(tbl, { childList: true, subtree: true });
+    const sleep = ms => new Promise(r => setTimeout(r, ms));
+    let steps = 0, stagnant = 0, total = expected();
+    const initial = rowCount();
+    try {
+        while (performance.now() - started < opt.max_ms) {
+            const before = rowCount();
+            scroller.scrollTop = scroller.scrollHeight;
+            scroller.dispatchEvent(new Event('scroll', { bubbles: true }));
+            steps++;
+            const stepStart = performance.now();
+            while (performance.now() - started < opt.max_ms) {
+                await sleep(40);
+                const now = performance.now();
+                if (now - Math.max(lastChange, stepStart) >= opt.quiet_ms) break;
+            }
+            const atBottom = scroller.scrollTop + scroller.clientHeight >= scroller.scrollHeight - 2;
+            total = expected() ?? total;
+            stagnant = (rowCount() === before && atBottom) ? stagnant + 1 : 0;
+            const limit = total === null ? opt.stagnant_steps
+                : rowCount() >= total ? 1 : opt.stagnant_steps * 2;
+            if (stagnant >= limit) break;
+        }
+    } finally {
+        obs.disconnect();
+    }
+    return { initial: initial, rows: rowCount(), expected: total, ms: Math.round(performance.now() - started), steps: steps };
+}
+"""
 def _scroll_to_load_all_in_div(fr, body_tbl, scroll_div):
+    if not body_tbl or not body_tbl.count():
+        return None
+    target = None
+    try:
+        if scroll_div and scroll_div.count():
+            target = scroll_div.element_handle(timeout=1000)
+    except Exception:
+        target = None
+    try:
+        stats = cl_call(
+            body_tbl, "lazyLoad",
+            dict(_LAZY_LOAD, target=target),
+        )
+    except Exception as e:
+        log(f"[AssocTx] lazy-load observer failed ({e}); falling back to scroll polling")
+        started = time.time()
+        _scroll_to_load_all_in_div_polling(fr, body_tbl, scroll_div)
+        stats = {"rows": body_tbl.locator("xpath=.//tr[td]").count(),
+                 "ms": round((time.time() - started) * 1000), "steps": None, "initial": None}
+    finally:
+        if target is not None:
+            try: target.dispose()
+            except Exception: pass
+    log(f"[AssocTx] lazy-load: {stats.get('initial')} → {stats.get('rows')} row(s) "
+        f"in {stats.get('ms')} ms ({stats.get('steps')} scroll step(s))")
+    if stats.get('expected') and (stats.get('rows') or 0) < stats['expected']:
+        log(f"[AssocTx] WARNING: table reports {stats['expected']} row(s) but only {stats.get('rows')} loaded")
+    return stats
+def _scroll_to_load_all_in_div_polling(fr, body_tbl, scroll_div):
     if not body_tbl or not body_tbl.count():
         return
     rows = body_tbl.locator("xpath=.//tr[td]")
@@ -1694,7 +2604,7 @@ def _scroll_to_load_all_in_div(fr, body_tbl, scroll_div):
             fr.mouse.wheel(0, 1800)
         except Exception:
             pass
-        fr.wait_for_timeout(140)
+        pause(fr, 140, "assoc-scroll-polling")
 _TRANS_HEADER_RX = re.compile(
     r"(transaction|work\s*item|related|type|category|status|state|number|id|no\b|ref|reference)",
     re.I,
@@ -1719,6 +2629,12 @@ def _score_header_labels(labels):
     pli_hits   = sum(1 for t in labels if _PLI_HEADER_RX.search(t))
     return (trans_hits * 3) - (pli_hits * 4)
 def _pick_assoc_grid_table(fr):
+    view = offline_view(fr, "assoc_tx")
+    if view is fr:
+        return _pick_assoc_grid_table_in(fr)
+    header_tbl, body_tbl, scroll_div, headers = _pick_assoc_grid_table_in(view)
+    return to_live(header_tbl), to_live(body_tbl), to_live(scroll_div), headers
+def _pick_assoc_grid_table_in(fr):
     best = (-9999, None, None, None, [])
     bodies = fr.locator(
         "xpath=//div[contains(@id,'_Table_bottom') or contains(@id,'_table_bottom')]"
@@ -1808,14 +2724,9 @@ def _is_bad_table(body_tbl, headers):
     if {"Name","Document Type","Folder Path"}.issubset(h):
         return True  # attachments
     return False
-def read_associated_transactions_complete(page, root_frame):
+def read_associated_transactions_complete(page, root_frame, single_pass=True):
     click_associated_transactions_tab(page, root_frame)
-    fr = None
-    for _ in range(20):
-        fr = _find_assoc_tx_frame(page)
-        if fr:
-            break
-        page.wait_for_timeout(250)
+    fr = frame_registry(page).wait_for("assoc_tx", timeout_ms=5000)
     if not fr:
         log("[AssocTx] grid frame not found")
         return {"product_analysis": [], "investigation": [], "tx_product_map": {}}
@@ -1823,12 +2734,16 @@ def read_associated_transactions_complete(page, root_frame):
     def _collect_for(label):
         header_tbl_0, body_tbl_0, scroll_div_0, headers_0 = _pick_assoc_grid_table(fr)
         sig_before = _node_signature(body_tbl_0) if body_tbl_0 else ""
+        dom_before = dom_signature(body_tbl_0) if body_tbl_0 else ""
         if not _assoc_click_filter(fr, label):
             return []
         header_tbl = body_tbl = scroll_div = None
         headers = []
-        for _ in range(3):  # ~600ms total
-            page.wait_for_timeout(200)
+        if body_tbl_0:
+            wait_for_dom_change(fr, body_tbl_0, dom_before, timeout_ms=3000)
+        for attempt in range(2):
+            if attempt:
+                wait_for_network_quiet(page, quiet_ms=200, timeout_ms=2000)
             h1, b1, sc1, hdr1 = _pick_assoc_grid_table(fr)
             if b1 and _is_assoc_tx_table(hdr1, b1):
                 sig_after = _node_signature(b1)
@@ -1839,58 +2754,25 @@ def read_associated_transactions_complete(page, root_frame):
             log(f"[AssocTx] no AssociatedTransactions grid after clicking {label} — skipping")
             return []
         _scroll_to_load_all_in_div(fr, body_tbl, scroll_div)
-        rows = body_tbl.locator("xpath=.//tr[td]")
         idx_id, idx_type, idx_status, idx_product = _hdr_indices_from_any(header_tbl, body_tbl)
+        started = time.time()
+        records = assoc_records_from_snapshot(
+            snapshot_table_rows(body_tbl), idx_id, idx_type, idx_status, idx_product
+        )
         ids_complete, ids_any = [], []
-        n = rows.count()
-        for i in range(n):
-            row = rows.nth(i)
-            cells = row.locator("xpath=.//th|.//td")
-            txid = None
-            if idx_id is not None and cells.count() > idx_id:
-                txid_txt = clean(cells.nth(idx_id).inner_text())
-                txid = _find_first_match(
-                    [r"\b\d{5,}\b", r"\b[A-Z]{2,5}[-_ ]?\d{4,}\b"],
-                    txid_txt
-                ) or txid_txt
-            else:
-                txid = _row_txid(row)
-            if idx_status is not None and cells.count() > idx_status:
-                status = clean(cells.nth(idx_status).inner_text())
-            else:
-                status = _row_status_text(row)
-            product_txt = ""
-            if idx_product is not None and cells.count() > idx_product:
-                product_txt = clean(cells.nth(idx_product).inner_text())
-            if not product_txt:
-                prod_cell = row.locator(
-                    "xpath=.//td[contains(@id,'GUIDE-AssociatedTransactionsTable') "
-                    "and contains(@id,'-Product')]"
-                ).first
-                if prod_cell.count():
-                    a = prod_cell.locator("xpath=.//a").first
-                    if a.count():
-                        product_txt = clean(
-                            a.get_attribute("title")
-                            or a.get_attribute("aria-label")
-                            or a.inner_text()
-                        )
-                    else:
-                        product_txt = clean(prod_cell.inner_text())
-            product_code = extract_product_code(product_txt).upper() if product_txt else ""
-            dbg = (
-                f"id={txid or '-'} "
-                f"status={(status or '').strip()!r} "
-                f"product={product_txt!r} code={product_code!r}"
-            )
-            log(f"[AssocTx:{label}] row {i+1}/{n}: {dbg}")
-            if txid and product_code:
-                tx_product_map.setdefault(txid, product_code)
+        for rec in records:
+            txid = rec["id"]
+            if txid and rec["product_code"]:
+                tx_product_map.setdefault(txid, rec["product_code"])
             if not txid:
                 continue
             ids_any.append(txid)
-            if _row_is_complete(row) or re.search(r'\bcomplete(d)?\b', (status or ''), re.I):
+            if rec["complete"]:
                 ids_complete.append(txid)
+        log(
+            f"[AssocTx:{label}] {len(records)} row(s) read in {(time.time() - started) * 1000:.0f} ms; "
+            f"ids={len(set(ids_any))} complete={len(set(ids_complete))}"
+        )
         ids_complete = list(dict.fromkeys(ids_complete))
         ids_any = list(dict.fromkeys(ids_any))
         if ids_complete:
@@ -1910,11 +2792,24 @@ def read_associated_transactions_complete(page, root_frame):
         header_tbl, body_tbl, scroll_div, _ = _pick_assoc_grid_table(fr)
         if not body_tbl:
             return {"product_analysis": [], "investigation": [], "tx_product_map": {}}
-        base = _collect_unfiltered(fr, header_tbl, body_tbl, scroll_div)
+        base = _collect_unfiltered(fr, header_tbl, body_tbl, scroll_div, tx_product_map)
+        if base is None:
+            base = {"product_analysis": [], "investigation": []}
         base["tx_product_map"] = tx_product_map
         return base
-    pa = _collect_for("Analysis")
-    inv = _collect_for("Investigation")
+    base = None
+    if single_pass:
+        header_tbl, body_tbl, scroll_div, headers = _pick_assoc_grid_table(fr)
+        if body_tbl and _is_assoc_tx_table(headers, body_tbl):
+            base = _collect_unfiltered(fr, header_tbl, body_tbl, scroll_div, tx_product_map)
+        if base is None:
+            log("[AssocTx] single-pass read not possible; using Analysis/Investigation filters")
+            tx_product_map.clear()
+    if base is not None:
+        pa, inv = base["product_analysis"], base["investigation"]
+    else:
+        pa = _collect_for("Analysis")
+        inv = _collect_for("Investigation")
     log(f"[AssocTx] Product Analysis (Complete or fallback): {pa}")
     log(f"[AssocTx] Investigations (Complete or fallback): {inv}")
     if tx_product_map:
@@ -1942,7 +2837,7 @@ def robust_click(el, frame, timeout_ms=8000):
     except Exception:
         pass
     try:
-        el.evaluate("e => { e.scrollIntoView({block:'center'}); e.click(); }")
+        cl_call(el, "clickCenter")
         return True
     except Exception:
         pass
@@ -1959,62 +2854,18 @@ def expand_full_text_if_collapsed(frame):
         link = frame.locator("xpath=//a[contains(@id,'text_table') and contains(@id,'lines')]").first
         if link.count():
             robust_click(link, frame)
-            frame.wait_for_timeout(200)
+            wait_for_network_quiet(frame.page, quiet_ms=150, timeout_ms=2000)
     except Exception:
         pass
 def extract_product_code(desc: str) -> str:
-    s = (desc or "").upper()
-    toks = re.findall(r"[A-Z0-9][A-Z0-9_-]*", s)
-    if not toks:
-        return ""
-    for t in toks:
-        if re.search(r"\d", t):
-            return t
-    return toks[0]
-def active_content_frames(page, cfg):
-    name_rx = cfg.get('content_frame_name_regex') or cfg.get('frame_name_regex')
-    url_rx  = cfg.get('frame_url_regex')
-    frames = []
-    for fr in page.frames:
-        try:
-            nm, url = (fr.name or ""), (fr.url or "")
-        except Exception:
-            nm, url = "", ""
-        if (name_rx and re.search(name_rx, nm, re.I)) or (url_rx and re.search(url_rx, url, re.I)):
-            frames.append(fr)
-    if frames:
-        return frames
-    for fr in page.frames:
-        if (fr.name or "") == "WorkAreaFrame1":
-            return [fr]
-    return list(page.frames)
-def _find_latest_text_table_in(fr):
-    scope = fr.locator("xpath=//div[contains(@class,'th-clr-cnt-bottom')]")
-    scope = scope if scope.count() else fr
-    tds = scope.locator("xpath=.//table[.//td[starts-with(@id,'GUIDE-TextInfoTable-')]]")
-    return tds.nth(tds.count()-1) if tds.count() else None
-def _suppress_clicks_enable(frame):
-    try:
-        frame.evaluate("""
-            window.__mdt_suppress = e => { e.stopPropagation(); e.preventDefault(); };
-            document.addEventListener('mousedown', window.__mdt_suppress, true);
-            document.addEventListener('click', window.__mdt_suppress, true);
-            document.addEventListener('mouseup', window.__mdt_suppress, true);
-        """)
-    except Exception:
-        pass
-def _suppress_clicks_disable(frame):
-    try:
-        frame.evaluate("""
-            if (window.__mdt_suppress) {
-                document.removeEventListener('mousedown', window.__mdt_suppress, true);
-                document.removeEventListener('click', window.__mdt_suppress, true);
-                document.removeEventListener('mouseup', window.__mdt_suppress, true);
-                window.__mdt_suppress = null;
-            }
-        """)
-    except Exception:
-        pass
+    s = (desc or "").upper()
+    toks = re.findall(r"[A-Z0-9][A-Z0-9_-]*", s)
+    if not toks:
+        return ""
+    for t in toks:
+        if re.search(r"\d", t):
+            return t
+    return toks[0]
 def _normalize_text(s: str) -> str:
     s = (s or "").replace("\xa0", " ")
     s = re.sub(r'\r?\n\s*\r?\n+', '\n\n', s)
@@ -2029,7 +2880,7 @@ def _pa_try_expand(fr):
     container = header.locator("xpath=following-sibling::*[contains(@class,'data-wrapper')][1]").first
     if container.count():
         try:
-            is_hidden = container.evaluate("n => getComputedStyle(n).display === 'none'")
+            is_hidden = cl_call(container, "isHidden")
         except Exception:
             is_hidden = False
         if not is_hidden:
@@ -2037,12 +2888,12 @@ def _pa_try_expand(fr):
     if clicker.count():
         try:
             robust_click(clicker, fr)
-            fr.wait_for_timeout(250)
+            container.wait_for(state="visible", timeout=2000)
         except Exception:
             pass
     if container.count():
         try:
-            return not container.evaluate("n => getComputedStyle(n).display === 'none'")
+            return not cl_call(container, "isHidden")
         except Exception:
             return True
     return False
@@ -2067,19 +2918,12 @@ def robust_click_plus(el, frame):
     except Exception:
         pass
     try:
-        el.evaluate("""
-            e => {
-                const ev1 = new MouseEvent('mousedown', {bubbles:true, cancelable:true});
-                const ev2 = new MouseEvent('mouseup',   {bubbles:true, cancelable:true});
-                const ev3 = new MouseEvent('click',     {bubbles:true, cancelable:true});
-                e.dispatchEvent(ev1); e.dispatchEvent(ev2); e.dispatchEvent(ev3);
-            }
-        """)
+        cl_call(el, "dispatchClick")
         return True
     except Exception:
         pass
     try:
-        el.evaluate("e => { e.scrollIntoView({block:'center'}); e.click(); }")
+        cl_call(el, "clickCenter")
         return True
     except Exception:
         pass
@@ -2114,7 +2958,10 @@ def _click_objects_dropdown(fr):
         return False
     try:
         robust_click(btn, fr)
-        fr.wait_for_timeout(150)
+        try:
+            _objects_dropdown_list(fr).wait_for(state="visible", timeout=1500)
+        except Exception:
+            pass
         return True
     except Exception:
         return False
@@ -2161,7 +3008,10 @@ def _pick_dropdown_option(fr, want_texts) -> bool:
         clickable = target
     try:
         robust_click(clickable, fr)
-        fr.wait_for_timeout(200)
+        try:
+            ul.wait_for(state="hidden", timeout=1500)
+        except Exception:
+            pass
         return True
     except Exception:
         return False
@@ -2179,7 +3029,13 @@ def set_search_scope(page, desired_labels=("Activities","Activity")) -> bool:
     if not fr:
         log("[scope] Could not find frame for Objects dropdown")
         return False
+    def _matches(text):
+        low = (text or "").lower()
+        return any(lbl.lower() in low for lbl in desired_labels) or ("activit" in low)
     before = _objects_button_text(fr)
+    if _matches(before):
+        log(f"[scope] Objects already shows {before!r}")
+        return True
     if not _click_objects_dropdown(fr):
         log("[scope] Could not open Objects dropdown")
         return False
@@ -2189,13 +3045,17 @@ def set_search_scope(page, desired_labels=("Activities","Activity")) -> bool:
         try: _click_objects_dropdown(fr)
         except Exception: pass
         return False
-    fr.wait_for_timeout(150)
+    wait_until(fr.page, lambda: _objects_button_text(fr) != before, timeout_ms=1500, poll_ms=50)
     after = _objects_button_text(fr)
-    ok = any(lbl.lower() in (after or "").lower() for lbl in desired_labels) or ("activit" in (after or "").lower())
+    ok = _matches(after)
     log(f"[scope] Objects now shows: {after!r} ⇒ ok={ok}")
     return ok
 def _find_scope_frame_for_objects(page):
-    for fr in page.frames:
+    reg = frame_registry(page)
+    hit = reg.cached("search_for")
+    if hit:
+        return hit
+    for fr in reg.ordered("search_for"):
         try:
             have = (
                 fr.locator("xpath=//*[normalize-space(.)='Search For:']").first.count() and
@@ -2203,16 +3063,11 @@ def _find_scope_frame_for_objects(page):
                 (fr.locator("text=Go").first.count() or fr.locator("xpath=//input[@value='Go']|//a[normalize-space(.)='Go']").first.count())
             )
             if have:
+                reg.remember("search_for", fr)
                 return fr
         except Exception:
             continue
-    for fr in page.frames:
-        try:
-            if _objects_dropdown_button(fr).count() or _objects_input(fr).count():
-                return fr
-        except Exception:
-            continue
-    return page.main_frame
+    return reg.find("scope") or page.main_frame
 def _current_scope_text(fr) -> str:
     val = _read_objects_value(fr)
     if val: return val
@@ -2268,9 +3123,8 @@ def _open_objects_popup(fr):
         try:
             inp.scroll_into_view_if_needed()
             inp.click()
-            fr.wait_for_timeout(80)
+            pause(fr, 80, "scope-keyboard")
             inp.press("ArrowDown")   # opens the list in most builds
-            fr.wait_for_timeout(120)
             return True
         except Exception:
             pass
@@ -2312,8 +3166,7 @@ def _pick_popup_option_by_text(fr, *want_texts):
     if not wants:
         wants = ["activities", "activity"]
     _open_objects_popup(fr)
-    fr.wait_for_timeout(120)
-    options = _popup_options_any(fr)
+    options = wait_until(fr.page, lambda: _popup_options_any(fr), timeout_ms=1500, poll_ms=60) or []
     if options:
         log("[scope] Popup options: " + ", ".join(repr(t) for _, t in options[:30]))
     def _match(txt):
@@ -2325,7 +3178,6 @@ def _pick_popup_option_by_text(fr, *want_texts):
         if _match(txt):
             try:
                 robust_click(el, fr)
-                fr.wait_for_timeout(120)
                 return True
             except Exception:
                 pass
@@ -2345,31 +3197,12 @@ def _direct_set_objects_value(fr, value: str) -> bool:
     if not inp.count():
         return False
     try:
-        fr.evaluate(
-            """
-            (id, val) => {
-              const el = document.getElementById(id);
-              if (!el) return false;
-              const wasRO = el.hasAttribute('readonly');
-              if (wasRO) el.removeAttribute('readonly');
-              const old = el.value;
-              el.value = val;
-              el.dispatchEvent(new Event('input', { bubbles: true }));
-              el.dispatchEvent(new Event('change', { bubbles: true }));
-              try { if (window.thtmlbAutoSave) thtmlbAutoSave(el); } catch (e) {}
-              try { if (window.th_ddlb_onchange) th_ddlb_onchange(el); } catch (e) {}
-              try { el.blur(); el.focus(); } catch (e) {}
-              if (wasRO) el.setAttribute('readonly','readonly');
-              return true;
-            }
-            """,
-            inp.get_attribute("id"),
-            value,
-        )
-        fr.wait_for_timeout(120)
-        return True
+        return bool(cl_call(fr, "setObjectsValue", inp.get_attribute("id"), value))
     except Exception:
         return False
+def _wait_scope_activities(fr, timeout_ms=1500) -> str:
+    wait_until(fr.page, lambda: "activit" in (_current_scope_text(fr) or "").lower(), timeout_ms=timeout_ms, poll_ms=60)
+    return (_current_scope_text(fr) or "").lower()
 def force_scope_to_activities(page) -> bool:
     fr = _find_scope_frame_for_objects(page)
     if not fr:
@@ -2380,8 +3213,7 @@ def force_scope_to_activities(page) -> bool:
         log(f"[scope] already Activities: {cur!r}")
         return True
     if _pick_popup_option_by_text(fr, "Activities", "Activity"):
-        fr.wait_for_timeout(160)
-        cur = (_current_scope_text(fr) or "").lower()
+        cur = _wait_scope_activities(fr)
         if "activit" in cur:
             log(f"[scope] selected via popup: {cur!r}")
             return True
@@ -2389,38 +3221,26 @@ def force_scope_to_activities(page) -> bool:
     if inp.count():
         try:
             inp.click()
-            fr.wait_for_timeout(60)
+            pause(fr, 60, "scope-keyboard")
             try: inp.press("Alt+ArrowDown")
             except Exception: pass
-            inp.press("Control+A"); fr.wait_for_timeout(40)
-            inp.type("Activities", delay=15); fr.wait_for_timeout(120)
-            inp.press("Enter"); fr.wait_for_timeout(180)
-            cur = (_current_scope_text(fr) or "").lower()
+            inp.press("Control+A"); pause(fr, 40, "scope-keyboard")
+            inp.type("Activities", delay=15); pause(fr, 120, "scope-keyboard")
+            inp.press("Enter")
+            cur = _wait_scope_activities(fr)
             if "activit" in cur:
                 log("[scope] selected via keyboard type+Enter")
                 return True
         except Exception:
             pass
     if _direct_set_objects_value(fr, "Activities"):
-        fr.wait_for_timeout(160)
-        cur = (_current_scope_text(fr) or "").lower()
+        cur = _wait_scope_activities(fr)
         log(f"[scope] after direct-set, now={cur!r}")
         if "activit" in cur:
             return True
     try:
-        fr.evaluate("""
-            (() => {
-              const el = document.querySelector("input[id*='_Objects'][role='combobox']") || document.querySelector("input[id*='_Objects']");
-              if (!el) return false;
-              const ev = new Event('change', {bubbles:true});
-              el.dispatchEvent(ev);
-              try { if (window.th_ddlb_onchange) th_ddlb_onchange(el); } catch(e){}
-              try { if (window.thtmlbAutoSave) thtmlbAutoSave(el); } catch(e){}
-              return true;
-            })();
-        """)
-        fr.wait_for_timeout(160)
-        cur = (_current_scope_text(fr) or "").lower()
+        cl_call(fr, "fireObjectsChange")
+        cur = _wait_scope_activities(fr)
         if "activit" in cur:
             log("[scope] selected via change hooks")
             return True
@@ -2428,31 +3248,37 @@ def force_scope_to_activities(page) -> bool:
         pass
     log("[scope] FAILED to set Activities (still showing %r)" % _current_scope_text(fr))
     return False
-def search_activities_for_id(page, txid: str) -> bool:
+def _submit_activity_search(page, txid: str):
     fr = _find_scope_frame_for_objects(page)
     if not fr:
         log("[search] header frame not found")
-        return False
+        return None
     if not force_scope_to_activities(page):
         log("[search] scope not Activities; aborting to avoid SR/PE results")
-        return False
+        return None
     input_el = _find_global_search_input_in_frame(fr)
     if not input_el:
         log("[search] header search input not found")
-        return False
+        return None
     try:
         input_el.click()
         try: input_el.fill("")
         except Exception: pass
         input_el.type(str(txid), delay=18)
         try:
-            input_el.evaluate("el => el.dispatchEvent(new Event('input',{bubbles:true}))")
+            cl_call(input_el, "fireInput")
         except Exception: pass
         if not soft_click_go(fr):
             input_el.press("Enter")
+        return fr
+    except Exception as e:
+        log(f"[search] error: {e}")
+        return None
+def _settle_activity_search(page, fr) -> bool:
+    try:
         try: fr.wait_for_load_state("networkidle")
         except Exception: pass
-        fr.wait_for_timeout(800)
+        wait_for_network_quiet(page, quiet_ms=250, timeout_ms=5000)
         if "activit" not in (_current_scope_text(fr) or "").lower():
             log("[search] scope reverted after submit; likely clicked content-frame Go. Aborting.")
             return False
@@ -2460,6 +3286,11 @@ def search_activities_for_id(page, txid: str) -> bool:
     except Exception as e:
         log(f"[search] error: {e}")
         return False
+def search_activities_for_id(page, txid: str) -> bool:
+    fr = _submit_activity_search(page, txid)
+    if not fr:
+        return False
+    return _settle_activity_search(page, fr)
 def _row_has_productid_placeholder(row) -> bool:
     t = _row_text(row)
     return bool(re.search(r'\bproduct\s*id\b', t))
@@ -2541,28 +3372,17 @@ def read_analysis_summary_for_txid(page, txid: str) -> str:
     ok = search_activities_for_id(page, txid)
     if not ok:
         return ""
-    click_tab_by_text(page, page.main_frame, "Text Info") or click_tab_by_text(page, page.main_frame, "_ovviewset.do_0006")
-    txt = read_analysis_summary_for_current_pli(page)
-    if not txt:
-        page.wait_for_timeout(500)
-        txt = read_analysis_summary_for_current_pli(page)
-    return (txt or "").strip()
+    return _read_activity_text_info(page, txid, "analysis")[0]
 def read_investigation_summary_for_txid(page, txid: str) -> str:
     ok = search_activities_for_id(page, txid)
     if not ok:
         return ""
-    click_tab_by_text(page, page.main_frame, "Text Info") or \
-    click_tab_by_text(page, page.main_frame, "_ovviewset.do_0006")
-    txt = read_investigation_summary_for_current_pli(page)
-    if not txt:
-        page.wait_for_timeout(500)
-        txt = read_investigation_summary_for_current_pli(page)
-    return (txt or "").strip()
-def read_investigation_summary_for_current_pli(page):
+    return _read_activity_text_info(page, txid, "investigation")[0]
+def read_investigation_summary_for_current_pli(page, object_id=""):
     labels = [
         "Summary of Investigation",
     ]
-    return (read_text_by_labels(page, labels, preserve_format=True) or "").strip()
+    return (read_text_by_labels(page, labels, preserve_format=True, object_id=object_id) or "").strip()
 def _apply_plural_s(xml: str, plural: bool) -> str:
     rx = re.compile(r'(\{\{|\[\[)\s*s\s*(\}\}|\]\])', re.I)
     return rx.sub('s' if plural else '', xml)
@@ -2606,30 +3426,18 @@ def _strip_analysis_phrases(text: str) -> str:
     text = re.sub(r'[ \t]{2,}', ' ', text)
     text = re.sub(r'\n{3,}', '\n\n', text)
     return text.strip()
-def get_partners_for_ui(frame):
-    tbl = _partners_table(frame)
-    if not tbl:
+def get_partners_for_ui(frame, rows=None):
+    rows = read_guide_table(frame, "Partners") if rows is None else rows
+    rows = [r for r in rows if "PartnerFunction" in r]
+    if not rows:
         print("[Partners] No partners table found for UI.")
         return []
-    rows = tbl.locator(
-        "xpath=.//tr[td[starts-with(@id,'GUIDE-PartnersTable-') "
-        "and contains(@id,'-PartnerFunction')]]"
-    )
     partners = []
-    n = rows.count()
-    print(f"[Partners] Partner table rows detected: {n}")
-    for i in range(n):
-        row = rows.nth(i)
-        pf_cell = row.locator(
-            "xpath=.//td[starts-with(@id,'GUIDE-PartnersTable-') "
-            "and contains(@id,'-PartnerFunction')]"
-        ).first
-        pf_text = clean(pf_cell.inner_text()) if pf_cell.count() else ""
-        name = _cell_text_in_same_row(row, "Name")
-        addr = (
-            _cell_text_in_same_row(row, "Address")
-            or _cell_text_in_same_row(row, "address_short")
-        )
+    print(f"[Partners] Partner table rows detected: {len(rows)}")
+    for row in rows:
+        pf_text = row.get("PartnerFunction", "")
+        name = guide_cell(row, "Name")
+        addr = guide_cell(row, "Address", "address_short")
         block = "\n".join(x for x in [name, addr] if x).strip()
         partners.append(
             {
@@ -2646,138 +3454,600 @@ def get_partners_for_ui(frame):
     for p in partners:
         print("   -", p["display"].replace("\n", " / "))
     return partners
-def scrape_complaint(complaint_id: str, cfg_path: str):
-    cfg_path = Path(cfg_path)
-    cfg = yaml.safe_load(cfg_path.read_text())
+_AAD_HOST_RX = re.compile(r'(?:^|\.)login\.microsoftonline\.com$', re.I)
+def _load_config(cfg_path):
+    cfg = yaml.safe_load(Path(cfg_path).read_text())
     template_path = Path(cfg['template_path']).expanduser()
     out_dir = Path(cfg.get('output_dir', '.')).expanduser()
     out_dir.mkdir(parents=True, exist_ok=True)
-    values = {}
-    products = []
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=cfg.get('headless', False))
-        context = browser.new_context()
-        page = context.new_page()
-        log(f"Navigating to CRM: {cfg['crm_url']}")
-        page.goto(cfg['crm_url'], wait_until="load")
-        sso_wait = cfg.get('sso_pause_seconds', 0)
-        if sso_wait > 0:
-            s = cfg.get('search', {})
+    return cfg, template_path, out_dir
+def _session_cfg(cfg):
+    return cfg.get('session', {}) or {}
+def _storage_state_path(cfg):
+    sc = _session_cfg(cfg)
+    if not sc.get('persist', False):
+        return None
+    raw = (sc.get('storage_state_path') or "").strip()
+    return Path(raw).expanduser() if raw else None
+def _user_data_dir(cfg):
+    sc = _session_cfg(cfg)
+    if not sc.get('persist', False):
+        return None
+    raw = (sc.get('user_data_dir') or "").strip()
+    return Path(raw).expanduser() if raw else None
+def _search_selectors(cfg):
+    s = cfg.get('search', {}) or {}
+    return [s.get('selector')] + (s.get('fallback_selectors', []) or [])
+def _on_sso_host(page) -> bool:
+    try:
+        host = urlparse(page.url).hostname or ""
+    except Exception:
+        return False
+    return bool(_AAD_HOST_RX.search(host))
+class CrmSession:
+    def __init__(self, browser, context, page, restored=False):
+        self.browser = browser
+        self.context = context
+        self.page = page
+        self.restored = restored
+        self.ready = False
+        self.persist = True
+        self.attached = False
+        self.route_stats = {}
+    def save_state(self, cfg):
+        path = _storage_state_path(cfg)
+        if not self.persist or not path or _user_data_dir(cfg):
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.context.storage_state(path=str(path))
+            log(f"[session] saved storage state to {path}")
+        except Exception as e:
+            log(f"[session] could not save storage state: {e}")
+    def close(self, cfg):
+        release_activity_pages(self.context)
+        if self.attached:
+            selector_cache().save()
+            log_cl_stats()
             try:
-                wait_find_in_any_frame(page, [s.get('selector')] + (s.get('fallback_selectors', []) or []),
-                                    timeout_ms=2500, poll_ms=150)
-                print("[SSO] Search is already available; skipping SSO wait.")
+                self.page.close()
             except Exception:
-                print(f"[SSO] Search not ready; running extended SSO retries (up to ~{cfg.get('sso_total_timeout_ms', 240000)//1000}s)…")
+                pass
+            return
+        if self.ready:
+            self.save_state(cfg)
+        selector_cache().save()
+        selector_cache().log_stats()
+        log_cl_stats()
+        if self.route_stats.get("blocked"):
+            log(f"[route] blocked {self.route_stats['blocked']} request(s), allowed {self.route_stats.get('allowed', 0)}")
+        try:
+            if self.browser is not None:
+                self.browser.close()
+            else:
+                self.context.close()
+        except Exception:
+            pass
+def _resource_blocking_cfg(cfg):
+    return cfg.get('resource_blocking', {}) or {}
+def _host_allowed(host: str, allow_hosts) -> bool:
+    host = (host or "").lower()
+    for h in allow_hosts or []:
+        h = (h or "").strip().lower()
+        if h and (host == h or host.endswith("." + h)):
+            return True
+    return False
+def _url_matches_any(url: str, patterns) -> bool:
+    low = (url or "").lower()
+    for pat in patterns or []:
+        pat = (pat or "").strip().lower()
+        if not pat:
+            continue
+        if "*" in pat or "?" in pat:
+            if fnmatch.fnmatch(low, pat):
+                return True
+        elif pat in low:
+            return True
+    return False
+_RESOURCE_TYPE_EXTENSIONS = {
+    "image": ["png", "jpe?g", "gif", "webp", "svg", "ico", "bmp"],
+    "font": ["woff2?", "ttf", "otf", "eot"],
+    "media": ["mp4", "webm", "mp3", "ogg", "wav", "m4a"],
+    "stylesheet": ["css"],
+}
+def _resource_block_regex(block_types, url_patterns):
+    alts = []
+    exts = [e for t in sorted(block_types) for e in _RESOURCE_TYPE_EXTENSIONS.get(t, [])]
+    if exts:
+        alts.append(r"\.(?:" + "|".join(exts) + r")(?:[?#]|$)")
+    for pat in url_patterns or []:
+        pat = (pat or "").strip().lower()
+        if not pat:
+            continue
+        if "*" in pat or "?" in pat:
+            alts.append("^" + fnmatch.translate(pat))
+        else:
+            alts.append(re.escape(pat))
+    return re.compile("|".join(alts), re.I) if alts else None
+def install_resource_blocking(context, cfg, stats=None):
+    rb = _resource_blocking_cfg(cfg)
+    if not rb.get('enabled', False):
+        return False
+    block_types = {t.strip().lower() for t in (rb.get('resource_types') or []) if t}
+    block_types.discard("document")
+    url_patterns = rb.get('url_patterns') or []
+    allow_hosts = rb.get('allow_hosts') or []
+    stats = stats if stats is not None else {}
+    stats.setdefault("blocked", 0)
+    stats.setdefault("allowed", 0)
+    def _handler(route):
+        req = route.request
+        url = req.url
+        try:
+            host = urlparse(url).hostname or ""
+        except Exception:
+            host = ""
+        if not _host_allowed(host, allow_hosts):
+            if req.resource_type in block_types or _url_matches_any(url, url_patterns):
+                stats["blocked"] += 1
                 try:
-                    wait_for_search_with_retries(
-                        page, s,
-                        max_attempts=cfg.get('sso_max_attempts', 8),
-                        probe_period_ms=cfg.get('sso_probe_period_ms', 2000),
-                        reload_between_attempts=cfg.get('sso_reload_between_attempts', True),
-                        total_timeout_ms=cfg.get('sso_total_timeout_ms', 240000),
-                    )
+                    route.abort()
                 except Exception:
-                    page.wait_for_timeout(sso_wait * 1000)
-        frame = find_app_frame(
-            page,
-            frame_name_regex=cfg.get('frame_name_regex'),
-            url_regex=cfg.get('frame_url_regex')
+                    pass
+                return
+        stats["allowed"] += 1
+        try:
+            route.continue_()
+        except Exception:
+            pass
+    url_rx = _resource_block_regex(block_types, url_patterns)
+    if url_rx is None:
+        return False
+    context.route(url_rx, _handler)
+    log(f"[route] blocking resource types {sorted(block_types)} and {len(url_patterns)} URL pattern(s); "
+        f"other requests bypass the route")
+    return True
+_CL_BUNDLE_VERSION = 3
+_CL_HELPERS_JS = {
+    "probe": _PROBE_JS,
+    "fieldMap": _FIELD_MAP_JS,
+    "guideTable": _GUIDE_TABLE_JS,
+    "textInfo": _TEXTINFO_ROWS_JS,
+    "assocRows": _ASSOC_ROWS_JS,
+    "pliRows": _PLI_ROWS_JS,
+    "btadminiRows": "(spec) => (" + _BTADMINI_ROWS_JS + ")(document, spec)",
+    "lazyLoad": _LAZY_LOAD_JS,
+    "innerText": "(el, n) => (el.innerText || '').slice(0, n)",
+    "textContent": "(el) => el.textContent || ''",
+    "isHidden": "(el) => getComputedStyle(el).display === 'none'",
+    "clickCenter": "(el) => { el.scrollIntoView({block:'center'}); el.click(); }",
+    "dispatchClick": """(el) => {
+        for (const type of ['mousedown', 'mouseup', 'click'])
+            el.dispatchEvent(new MouseEvent(type, {bubbles:true, cancelable:true}));
+    }""",
+    "fireInput": "(el) => { el.dispatchEvent(new Event('input', {bubbles:true})); }",
+    "setObjectsValue": """(id, val) => {
+        const el = document.getElementById(id);
+        if (!el) return false;
+        const wasRO = el.hasAttribute('readonly');
+        if (wasRO) el.removeAttribute('readonly');
+        el.value = val;
+        el.dispatchEvent(new Event('input', { bubbles: true }));
+        el.dispatchEvent(new Event('change', { bubbles: true }));
+        try { if (window.thtmlbAutoSave) thtmlbAutoSave(el); } catch (e) {}
+        try { if (window.th_ddlb_onchange) th_ddlb_onchange(el); } catch (e) {}
+        try { el.blur(); el.focus(); } catch (e) {}
+        if (wasRO) el.setAttribute('readonly','readonly');
+        return true;
+    }""",
+    "fireObjectsChange": """() => {
+        const el = document.querySelector("input[id*='_Objects'][role='combobox']") || document.querySelector("input[id*='_Objects']");
+        if (!el) return false;
+        el.dispatchEvent(new Event('change', {bubbles:true}));
+        try { if (window.th_ddlb_onchange) th_ddlb_onchange(el); } catch(e){}
+        try { if (window.thtmlbAutoSave) thtmlbAutoSave(el); } catch(e){}
+        return true;
+    }""",
+}
+_CL_BUNDLE_JS = (
+    "() => {\n"
+    f"    if (window.__cl && window.__cl.version === {_CL_BUNDLE_VERSION}) return;\n"
+    f"    window.__cl = {{ version: {_CL_BUNDLE_VERSION},\n"
+    + ",\n".join(f"    {name}: ({src.strip()})" for name, src in _CL_HELPERS_JS.items())
+    + "\n    };\n}"
+)
+_CL_CALL_JS = "([v, f, a]) => (window.__cl && window.__cl.version === v) ? window.__cl[f](...a) : {__cl_missing__: true}"
+_CL_CALL_EL_JS = "(el, [v, f, a]) => (window.__cl && window.__cl.version === v) ? window.__cl[f](el, ...a) : {__cl_missing__: true}"
+_CL_STATS = {"calls": 0, "injected": 0}
+def install_cl_bundle(context):
+    try:
+        context.add_init_script(script=f"({_CL_BUNDLE_JS})();")
+        return True
+    except Exception as e:
+        log(f"[cl] could not register helper bundle v{_CL_BUNDLE_VERSION}: {e}")
+        return False
+def cl_call(target, fn, *args):
+    on_element = not hasattr(target, "goto")
+    js = _CL_CALL_EL_JS if on_element else _CL_CALL_JS
+    _CL_STATS["calls"] += 1
+    for attempt in range(2):
+        got = target.evaluate(js, [_CL_BUNDLE_VERSION, fn, list(args)])
+        if not (isinstance(got, dict) and got.get("__cl_missing__")):
+            return got
+        if attempt:
+            break
+        _CL_STATS["injected"] += 1
+        target.evaluate(_CL_BUNDLE_JS)
+    raise RuntimeError(f"__cl.{fn} unavailable after injecting helper bundle v{_CL_BUNDLE_VERSION}")
+def log_cl_stats():
+    if _CL_STATS["calls"]:
+        log(f"[cl] {_CL_STATS['calls']} helper call(s), bundle injected on demand {_CL_STATS['injected']} time(s)")
+def open_crm_session(p, cfg, storage_state=None, debug_port=None):
+    headless = cfg.get('headless', False)
+    profile = _user_data_dir(cfg)
+    if debug_port:
+        profile = profile or _daemon_profile_dir(cfg)
+        profile.mkdir(parents=True, exist_ok=True)
+        restored = any(profile.iterdir())
+        context = p.chromium.launch_persistent_context(
+            str(profile), headless=headless,
+            args=[f"--remote-debugging-port={debug_port}", "--remote-debugging-address=127.0.0.1"],
         )
-        if 'search' in cfg:
-            s = cfg['search']
-            if s.get('selector'):
+        log(f"[daemon] browser listening on 127.0.0.1:{debug_port} (profile {profile})")
+        state_path = _storage_state_path(cfg)
+        if not restored and state_path and state_path.exists():
+            try:
+                context.add_cookies(json.loads(state_path.read_text(encoding="utf-8")).get("cookies", []))
+                restored = True
+                log(f"[daemon] seeded profile cookies from {state_path}")
+            except Exception as e:
+                log(f"[daemon] could not seed cookies from {state_path}: {e}")
+        session = CrmSession(None, context, None, restored=restored)
+    elif storage_state is not None:
+        browser = p.chromium.launch(headless=headless)
+        context = browser.new_context(storage_state=storage_state)
+        session = CrmSession(browser, context, None, restored=True)
+        session.persist = False
+    elif profile:
+        profile.mkdir(parents=True, exist_ok=True)
+        restored = any(profile.iterdir())
+        context = p.chromium.launch_persistent_context(str(profile), headless=headless)
+        log(f"[session] using persistent profile {profile} (restored={restored})")
+        session = CrmSession(None, context, None, restored=restored)
+    else:
+        browser = p.chromium.launch(headless=headless)
+        state_path = _storage_state_path(cfg)
+        context = None
+        restored = False
+        if state_path and state_path.exists():
+            try:
+                context = browser.new_context(storage_state=str(state_path))
+                restored = True
+                log(f"[session] restored storage state from {state_path}")
+            except Exception as e:
+                log(f"[session] could not load {state_path}: {e}")
+        if context is None:
+            context = browser.new_context()
+        session = CrmSession(browser, context, None, restored=restored)
+    configure_selector_cache(cfg)
+    configure_offline_dom(cfg)
+    configure_lazy_load(cfg)
+    install_resource_blocking(session.context, cfg, session.route_stats)
+    install_cl_bundle(session.context)
+    session.page = watch_page(session.context.pages[0] if session.context.pages else session.context.new_page())
+    return session
+def probe_search_ready(page, cfg, timeout_ms=2500) -> bool:
+    try:
+        wait_find_in_any_frame(page, _search_selectors(cfg), timeout_ms=timeout_ms, poll_ms=150, purpose="search_input")
+        return True
+    except Exception:
+        return False
+def _wait_for_sso(page, cfg):
+    sso_wait = cfg.get('sso_pause_seconds', 0)
+    if sso_wait > 0:
+        s = cfg.get('search', {})
+        if probe_search_ready(page, cfg, timeout_ms=2500):
+            print("[SSO] Search is already available; skipping SSO wait.")
+            return
+        print(f"[SSO] Search not ready; running extended SSO retries (up to ~{cfg.get('sso_total_timeout_ms', 240000)//1000}s)…")
+        try:
+            wait_for_search_with_retries(
+                page, s,
+                max_attempts=cfg.get('sso_max_attempts', 8),
+                probe_period_ms=cfg.get('sso_probe_period_ms', 2000),
+                reload_between_attempts=cfg.get('sso_reload_between_attempts', True),
+                total_timeout_ms=cfg.get('sso_total_timeout_ms', 240000),
+            )
+        except Exception:
+            pause(page, sso_wait * 1000, "sso-fallback")
+def ensure_crm_ready(session, cfg) -> bool:
+    page = session.page
+    log(f"Navigating to CRM: {cfg['crm_url']}")
+    page.goto(cfg['crm_url'], wait_until="load")
+    if session.attached:
+        probe_ms = _session_cfg(cfg).get('probe_timeout_ms', 5000)
+        for attempt in range(2):
+            if attempt:
+                page.goto(cfg['crm_url'], wait_until="load")
+            if not _on_sso_host(page) and probe_search_ready(page, cfg, timeout_ms=probe_ms):
+                session.ready = True
+                return True
+        log("[daemon] daemon browser is not logged in to CRM; leaving its session untouched")
+        session.ready = False
+        return False
+    if session.restored:
+        probe_ms = _session_cfg(cfg).get('probe_timeout_ms', 5000)
+        if not _on_sso_host(page) and probe_search_ready(page, cfg, timeout_ms=probe_ms):
+            log("[session] saved session accepted; skipping SSO")
+            session.ready = True
+            return True
+        log("[session] saved session rejected; falling back to interactive SSO")
+        session.restored = False
+        try:
+            session.context.clear_cookies()
+        except Exception:
+            pass
+        page.goto(cfg['crm_url'], wait_until="load")
+    _wait_for_sso(page, cfg)
+    session.ready = probe_search_ready(page, cfg, timeout_ms=1500)
+    if session.ready:
+        session.save_state(cfg)
+    return session.ready
+_DEEP_LINK_BROKEN = {}
+def _deep_link_disabled(page, object_kind: str) -> bool:
+    until = _DEEP_LINK_BROKEN.get((page.context, object_kind))
+    if until is None:
+        return False
+    if time.time() >= until:
+        _DEEP_LINK_BROKEN.pop((page.context, object_kind), None)
+        log(f"[deeplink] retrying deep links for {object_kind}")
+        return False
+    return True
+_DEEP_LINKED = object()
+def _deep_link_cfg(cfg):
+    return cfg.get('deep_link', {}) or {}
+def build_deep_link_url(cfg, object_kind: str, object_id: str):
+    dl = _deep_link_cfg(cfg)
+    spec = dl.get(object_kind) or {}
+    if not dl.get('enabled', False) or not spec.get('object_type') or not object_id:
+        return None
+    params = {
+        "crm-object-type": spec['object_type'],
+        "crm-object-action": spec.get('action', 'B'),
+        "crm-object-keyname": spec.get('keyname', 'OBJECT_ID'),
+        "crm-object-value": str(object_id).strip(),
+    }
+    base = cfg['crm_url']
+    sep = "" if base.endswith(("?", "&")) else ("&" if "?" in base else "?")
+    return base + sep + urlencode(params)
+def _deep_link_ready_selectors(cfg, object_kind: str, object_id: str):
+    spec = _deep_link_cfg(cfg).get(object_kind) or {}
+    if spec.get('ready_selector'):
+        return [spec['ready_selector']]
+    if object_kind == "complaint":
+        wait_for = (cfg.get('search', {}) or {}).get('wait_for')
+        return [wait_for] if wait_for else []
+    return [
+        f"xpath=//td[@id='bcTitle'][contains(@title,'{object_id}') or contains(normalize-space(.),'{object_id}')]"
+    ]
+def submit_deep_link(page, cfg, object_kind: str, object_id: str) -> bool:
+    if _deep_link_disabled(page, object_kind):
+        return False
+    url = build_deep_link_url(cfg, object_kind, object_id)
+    if not url:
+        return False
+    try:
+        log(f"[deeplink] opening {object_kind} {object_id}")
+        page.goto(url, wait_until="commit")
+        return True
+    except Exception as e:
+        log(f"[deeplink] navigation failed for {object_kind} {object_id}: {e}")
+        return False
+def settle_deep_link(page, cfg, object_kind: str, object_id: str) -> bool:
+    sels = _deep_link_ready_selectors(cfg, object_kind, object_id)
+    if not sels:
+        return False
+    timeout_ms = _deep_link_cfg(cfg).get('timeout_ms', 15000)
+    try:
+        wait_find_in_any_frame(page, sels, timeout_ms=timeout_ms, poll_ms=250)
+        log(f"[deeplink] {object_kind} {object_id} opened directly")
+        return True
+    except Exception:
+        pass
+    if _on_sso_host(page):
+        log("[deeplink] redirected to SSO; falling back to UI search")
+    else:
+        retry_s = _deep_link_cfg(cfg).get('retry_after_s', 600)
+        log(f"[deeplink] {object_kind} {object_id} did not open; using the search UI for {object_kind} "
+            f"in this session for {retry_s}s")
+        _DEEP_LINK_BROKEN[(page.context, object_kind)] = time.time() + retry_s
+    try:
+        page.goto(cfg['crm_url'], wait_until="load")
+    except Exception:
+        pass
+    return False
+def open_object_by_deep_link(page, cfg, object_kind: str, object_id: str) -> bool:
+    if not submit_deep_link(page, cfg, object_kind, object_id):
+        return False
+    return settle_deep_link(page, cfg, object_kind, object_id)
+def search_complaint_via_ui(page, frame, complaint_id: str, cfg: dict):
+    if 'search' in cfg:
+        s = cfg['search']
+        if s.get('selector'):
+            try:
+                fallbacks = s.get('fallback_selectors', [])
+                extra_defaults = [
+                    "xpath=//input[@id='C12_W37_V38_SearchValue']",
+                    "css=#C1_W1_V2_C9_W28_V29_C12_W37_V38_launcher\\.do > span > table > tbody > tr > td > span.th-if-wrapper > input",
+                    "xpath=/html/body/form/div[5]/div/table/tbody/tr[1]/td/div/div/div/div/table/tbody/tr/td[1]/div/div/span/table/tbody/tr/td/span[3]/input",
+                ]
+                all_selectors = [s['selector']] + [sel for sel in fallbacks + extra_defaults if sel not in fallbacks]
+                log("[search] waiting for search input…")
+                target = target_ctx = used_sel = None
                 try:
-                    fallbacks = s.get('fallback_selectors', [])
-                    extra_defaults = [
-                        "xpath=//input[@id='C12_W37_V38_SearchValue']",
-                        "css=#C1_W1_V2_C9_W28_V29_C12_W37_V38_launcher\\.do > span > table > tbody > tr > td > span.th-if-wrapper > input",
-                        "xpath=/html/body/form/div[5]/div/table/tbody/tr[1]/td/div/div/div/div/table/tbody/tr/td[1]/div/div/span/table/tbody/tr/td/span[3]/input",
-                    ]
-                    all_selectors = [s['selector']] + [sel for sel in fallbacks + extra_defaults if sel not in fallbacks]
-                    log("[search] polling every 2s for search input…")
-                    poll_deadline = time.time() + s.get('pre_wait_timeout', 30000)/1000.0
-                    target = target_ctx = used_sel = None
-                    while time.time() < poll_deadline:
-                        try:
-                            target, target_ctx, used_sel = wait_find_in_any_frame(page, all_selectors, timeout_ms=1, poll_ms=1)
-                            break
-                        except Exception:
-                            log("[search] not visible yet; sleeping 2s")
-                            time.sleep(2)
-                    if not target:
-                        target, target_ctx, used_sel = wait_find_in_any_frame(page, all_selectors, timeout_ms=5000)
-                    log(f"[search] Found input via selector: {used_sel} in frame url={getattr(target_ctx, 'url', '')} name={getattr(target_ctx, 'name', '')}")
-                    if s.get('clear', True):
-                        try:
-                            target.fill("")
-                        except Exception:
-                            pass
-                    target.click()
-                    frame.wait_for_timeout(100)
-                    try:
-                        log(f"[search] filling complaint id: {complaint_id}")
-                        target.fill(complaint_id)
-                    except:
-                        target.type(complaint_id, delay=30)
+                    target, target_ctx, used_sel = wait_find_in_any_frame(
+                        page, all_selectors, timeout_ms=s.get('pre_wait_timeout', 30000), poll_ms=250,
+                        purpose="search_input"
+                    )
+                except Exception:
+                    log("[search] search input not visible before pre_wait_timeout")
+                if not target:
+                    target, target_ctx, used_sel = wait_find_in_any_frame(page, all_selectors, timeout_ms=5000,
+                                                                          purpose="search_input")
+                log(f"[search] Found input via selector: {used_sel} in frame url={getattr(target_ctx, 'url', '')} name={getattr(target_ctx, 'name', '')}")
+                if s.get('clear', True):
                     try:
-                        target.evaluate("el => { el.dispatchEvent(new Event('input',{bubbles:true})); el.blur(); el.focus(); }")
-                    except: pass
-                    submitted = False
-                    if s.get('submit_selector'):
-                        try:
-                            btn = target_ctx.locator(s['submit_selector']).first
-                            if btn.count():
-                                log("[search] clicking submit")
-                                btn.click()
-                                submitted = True
-                        except Exception:
-                            pass
-                    if not submitted:
-                        key = s.get('press_key', 'Enter')
-                        try:
-                            log(f"[search] pressing key: {key}")
-                            target.press(key)
-                        except Exception: pass
-                    if s.get('wait_for'):
-                        log(f"[wait] waiting for results: {s['wait_for']}")
-                        target_ctx.wait_for_selector(s['wait_for'], timeout=s.get('wait_timeout', 60000))
-                    else:
-                        target_ctx.wait_for_load_state("networkidle")
-                        target_ctx.wait_for_timeout(s.get('post_wait_ms', 3000))
-                except Exception as e:
-                    log(f"[ERROR] Search failed: {e}")
-                    print(f"[Search] Failed to drive search: {e}")
-                    dump_frames_debug(page, basename='debug')
+                        target.fill("")
+                    except Exception:
+                        pass
+                target.click()
+                try:
+                    log(f"[search] filling complaint id: {complaint_id}")
+                    target.fill(complaint_id)
+                except:
+                    target.type(complaint_id, delay=30)
+                try:
+                    target.evaluate("el => { el.dispatchEvent(new Event('input',{bubbles:true})); el.blur(); el.focus(); }")
+                except: pass
+                submitted = False
+                if s.get('submit_selector'):
                     try:
-                        page.screenshot(path="debug_search_failure.png", full_page=True)
-                        print("Saved debug_search_failure.png")
-                        log("Saved debug_search_failure.png")
+                        btn = target_ctx.locator(s['submit_selector']).first
+                        if btn.count():
+                            log("[search] clicking submit")
+                            btn.click()
+                            submitted = True
                     except Exception:
                         pass
-        values = {}
+                if not submitted:
+                    key = s.get('press_key', 'Enter')
+                    try:
+                        log(f"[search] pressing key: {key}")
+                        target.press(key)
+                    except Exception: pass
+                if s.get('wait_for'):
+                    log(f"[wait] waiting for results: {s['wait_for']}")
+                    target_ctx.wait_for_selector(s['wait_for'], timeout=s.get('wait_timeout', 60000))
+                else:
+                    target_ctx.wait_for_load_state("networkidle")
+                    wait_for_network_quiet(page, quiet_ms=s.get('post_quiet_ms', 500), timeout_ms=s.get('post_wait_ms', 3000))
+            except Exception as e:
+                log(f"[ERROR] Search failed: {e}")
+                print(f"[Search] Failed to drive search: {e}")
+                dump_frames_debug(page, basename='debug')
+                try:
+                    page.screenshot(path="debug_search_failure.png", full_page=True)
+                    print("Saved debug_search_failure.png")
+                    log("Saved debug_search_failure.png")
+                except Exception:
+                    pass
+SCRAPE_STEPS = ("partners", "external_refs", "dates", "products", "text_info", "activities")
+_STEP_PLACEHOLDER_RULES = {
+    "partners": re.compile(r"^ir(?:_|$)|facility|initial_reporter|external_contact"),
+    "external_refs": re.compile(r"^rb(?:_|$)|ref_number|report_number|mpxr|external_contact"),
+    "dates": re.compile(r"event_date|date_of_event"),
+    "products": re.compile(r"^product|lot|serial|^s$"),
+    "text_info": re.compile(r"event_description|description_of_event"),
+    "activities": re.compile(r"^analysis|^investigation"),
+}
+_STEP_DEPENDS = {"activities": ("products",)}
+UI_REQUIRED_STEPS = ("partners", "external_refs")
+_DOCX_PARAGRAPH_RX = re.compile(r'<w:p[ >].*?</w:p>', re.S)
+_DOCX_TEXT_RX = re.compile(r'<w:t(?:\s[^>]*)?>([^<]*)</w:t>')
+_TEMPLATE_TOKEN_RX = re.compile(r'(\{\{|\[\[)\s*(.*?)\s*(\}\}|\]\])', re.S)
+def _docx_placeholder_labels(xml: str):
+    for para in _DOCX_PARAGRAPH_RX.findall(xml):
+        text = html.unescape("".join(_DOCX_TEXT_RX.findall(para)))
+        for m in _TEMPLATE_TOKEN_RX.finditer(text):
+            yield m.group(2)
+_TEMPLATE_PLACEHOLDERS = {}
+def template_placeholders(template_path):
+    path = Path(template_path)
+    stamp = (str(path.resolve()), path.stat().st_mtime)
+    hit = _TEMPLATE_PLACEHOLDERS.get(stamp)
+    if hit is not None:
+        return hit
+    found = set()
+    with zipfile.ZipFile(path) as z:
+        for name in z.namelist():
+            if not name.endswith(".xml"):
+                continue
+            xml = z.read(name).decode("utf-8", errors="ignore")
+            found.update(_norm_key(label) for label in _docx_placeholder_labels(xml))
+    found.discard("")
+    _TEMPLATE_PLACEHOLDERS[stamp] = found
+    return found
+def plan_scrape_steps(cfg, template_path=None, keep=()):
+    sp = cfg.get('scrape_plan', {}) or {}
+    if not sp.get('from_template', True) or not template_path:
+        return list(SCRAPE_STEPS)
+    try:
+        placeholders = template_placeholders(template_path)
+    except Exception as e:
+        log(f"[plan] could not read placeholders from {template_path}: {e}; running every step")
+        return list(SCRAPE_STEPS)
+    wanted = set(sp.get('always', []) or []) | set(keep)
+    for key in placeholders:
+        for step, rx in _STEP_PLACEHOLDER_RULES.items():
+            if rx.search(key):
+                wanted.add(step)
+    for step in list(wanted):
+        wanted.update(_STEP_DEPENDS.get(step, ()))
+    steps = [st for st in SCRAPE_STEPS if st in wanted]
+    skipped = [st for st in SCRAPE_STEPS if st not in wanted]
+    log(f"[plan] {len(placeholders)} placeholder(s) → steps={steps} skipped={skipped}")
+    return steps
+class ScrapeCancelled(Exception):
+    pass
+def scrape_complaint_on_page(page, complaint_id: str, cfg: dict, steps=None, resume=None, prefetch_only=False,
+                             cancel=None, progress=None):
+    reset_wait_stats()
+    frame = find_app_frame(
+        page,
+        frame_name_regex=cfg.get('frame_name_regex'),
+        url_regex=cfg.get('frame_url_regex')
+    )
+    steps = set(SCRAPE_STEPS if steps is None else steps)
+    done = set(resume[2] if resume is not None else [])
+    total = len(steps - done) + (0 if resume is not None else 1)
+    def _progress(step, phase, **counts):
+        if progress is None:
+            return
+        try:
+            progress({"step": step, "phase": phase, "time": time.time(), "total": total, "counts": counts})
+        except Exception:
+            pass
+    def _check_cancel(n, name):
+        if cancel is not None and cancel.is_set():
+            raise ScrapeCancelled(f"{complaint_id} cancelled before step {n} ({name})")
+    if resume is not None:
+        values, products = dict(resume[0]), list(resume[1])
+        log(f"[prefetch] {complaint_id} already open; reusing {sorted(done) or 'no'} step(s)")
+    else:
+        _check_cancel(0, "open")
+        _progress("open", "start", label="Open complaint")
+        if not open_object_by_deep_link(page, cfg, "complaint", complaint_id):
+            search_complaint_via_ui(page, frame, complaint_id, cfg)
+        values, products = {}, []
         if not values.get("todays_date"):
             values["todays_date"] = datetime.now().strftime("%B %d, %Y").replace(" 0", " ")
         values['complaint_id'] = complaint_id
-        for key, conf in cfg.get('field_map', {}).items():
-            if isinstance(conf, str):
-                values[key] = get_by_label(frame, conf)
-            elif isinstance(conf, list):
-                values[key] = get_by_label(frame, conf)
-            elif isinstance(conf, dict):
-                if conf.get('type') == 'label':
-                    values[key] = get_by_label(frame, conf.get('labels', []))
-                elif conf.get('type') == 'grid':
-                    grid_xpath = conf['grid_xpath']
-                    row = conf['row']
-                    col = conf['col']
-                    values[key] = get_grid_row_col(frame, grid_xpath, row, col)
-                elif conf.get('type') == 'literal':
-                    values[key] = conf.get('value', '')
-            else:
-                values[key] = ""
+        values.update(resolve_field_map(frame, cfg.get('field_map', {})))
         for k, v in cfg.get('defaults', {}).items():
             values.setdefault(k, v)
+        _progress("open", "end", fields=sum(1 for v in values.values() if v))
+    def _wants(n, name, step):
+        _check_cancel(n, name)
+        if step in done:
+            log(f"[step {n}] {name} already loaded")
+            return False
+        if step not in steps:
+            log(f"[step {n}] {name} skipped (not needed by template)")
+            return False
+        done.add(step)
+        _progress(step, "start", label=name)
+        return True
+    if _wants(1, "Partners", "partners"):
         try:
             log("[step 1] Partners tab → IR name & facility")
             if click_partners_tab(page, frame):
@@ -2787,15 +4057,15 @@ def scrape_complaint(complaint_id: str, cfg_path: str):
                     print("[Partners] Could not locate the partners frame.")
                     log("[Partners] Could not locate the partners frame.")
                 else:
-                    _debug_list_pf_from_correct_table(pframe)
-                    irname = get_initial_reporter_name(pframe)
-                    irname = get_initial_reporter_name(pframe)
+                    prows = read_guide_table(pframe, "Partners")
+                    _debug_list_pf_from_correct_table(pframe, prows)
+                    irname = get_initial_reporter_name(pframe, prows)
                     if irname:
                         values['ir_name'] = irname
-                    facility_block = get_facility_name_and_address(pframe)
+                    facility_block = get_facility_name_and_address(pframe, prows)
                     if facility_block:
                         values['ir_with_address'] = facility_block
-                    partners_for_ui = get_partners_for_ui(pframe)
+                    partners_for_ui = get_partners_for_ui(pframe, prows)
                     if partners_for_ui:
                         values["_external_contacts"] = partners_for_ui
                     print("[Partners] ir_name =", values.get('ir_name', ''))
@@ -2808,13 +4078,12 @@ def scrape_complaint(complaint_id: str, cfg_path: str):
         except Exception as e:
             print(f"[Partners] Error scraping Partners tab: {e}")
             log(f"[ERROR] Partners scrape: {e}")
+        _progress("partners", "end", contacts=len(values.get("_external_contacts") or []))
+    if _wants(2, "Additional External References", "external_refs"):
         log("[step 2] Additional External References → rb_reference & report_number")
-        ext = read_external_refs(page, frame)
-        if ext.get("rb_reference"):
-            values["rb_reference"] = ext["rb_reference"]
-        if ext.get("report_number"):
-            values["report_number"] = ext["report_number"]
-        contacts = ext.get("external_contacts") or []
+        aer_tables = {}
+        values.update({k: v for k, v in resolve_guide_fields(page, frame, cfg, "external_refs", aer_tables).items() if v})
+        contacts = read_external_contacts(page, frame, aer_tables)
         values["_aer_external_contacts"] = contacts  
         if contacts and not values.get("external_contact"):
             values["external_contact"] = contacts[0].get("number", "")
@@ -2823,280 +4092,676 @@ def scrape_complaint(complaint_id: str, cfg_path: str):
             f"report_number={values.get('report_number','')}, "
             f"external_contacts={len(contacts)}"
         )
+        _progress("external_refs", "end", contacts=len(contacts))
+    if _wants(3, "Dates", "dates"):
         log("[step 3] Dates tab → event_date")
-        event_date_text = get_event_date(page)
-        if event_date_text:
-            values['event_date'] = event_date_text
+        values.update({k: v for k, v in resolve_guide_fields(page, frame, cfg, "dates").items() if v})
         log(f"[Dates] event_date={values.get('event_date','')}")
+        _progress("dates", "end", found=int(bool(values.get('event_date'))))
+    if _wants(4, "Product Line Items", "products"):
         log("[step 4] Product Line Items → all rows")
         products = read_all_products(page, frame)
         log(f"[PLI] rows detected: {len(products)}")
+        _progress("products", "end", pli_rows=len(products))
+    if _wants(5, "Text Info", "text_info"):
         log("[step 5] Text Info → event_description")
-        prev_sig = _textinfo_signature(page)
-        desc = read_event_description(page, frame)
-        if not desc and wait_for_textinfo_change(page, prev_sig, timeout=8000):
-            desc = read_event_description(page, frame)
+        desc = read_event_description(page, frame, object_id=complaint_id)
         if desc:
             desc = re.sub(r'^\s*according\s+to\s+the\s+reporter[,:-]?\s*', '', desc, flags=re.I)
             desc = re.sub(r'^\s*it\s+was\s+reported(?:\s+that)?[,:-]?\s*', '', desc, flags=re.I).lstrip()
             desc = re.sub(r'([.!?])\1+', r'\1', desc)
             values["event_description"] = desc
         log(f"[Text] description length: {len(values.get('event_description',''))}")
+        _progress("text_info", "end", chars=len(values.get('event_description', '')))
+    if cfg.get('guide_fields') and "guide_fields" not in done:
+        done.add("guide_fields")
+        values.update(resolve_guide_fields(page, frame, cfg))
+    if prefetch_only:
+        log_wait_stats(f"{complaint_id} prefetch")
+        return values, products, sorted(done)
+    if not _wants(6, "Associated Transactions", "activities"):
+        assoc = {"product_analysis": [], "investigation": [], "tx_product_map": {}}
+    else:
         log("[step 6] Associated Transactions → collect Complete Investigation/Product Analysis IDs")
-        assoc = read_associated_transactions_complete(page, frame)
-        tx_product_map = assoc.get("tx_product_map", {}) or {}
-        code_to_idx = {}
-        def _match_summary_to_product_index(
-            txid: str,
-            summary: str,
-            prod_code_from_bc: str,
-            products: list,
-            code_to_idx: dict,
-            tx_product_map: dict,
-        ):
-            def _fuzzy_lookup(code: str):
-                if not code:
-                    return None
-                c = code.strip().upper()
-                if not c:
-                    return None
-                idx = code_to_idx.get(c)
-                if idx:
-                    return idx
-                candidates = []
-                for key, idx in code_to_idx.items():
-                    if c in key or key in c:
-                        candidates.append((key, idx))
-                if len(candidates) == 1:
-                    key, idx = candidates[0]
-                    log(
-                        f"[Match] txid={txid} fuzzy-matched code={c!r} "
-                        f"to key={key!r} → product index {idx}"
-                    )
-                    return idx
-                if candidates:
-                    log(
-                        f"[Match] txid={txid} ambiguous fuzzy match for code={c!r} "
-                        f"candidates={[k for k, _ in candidates]}"
-                    )
+        assoc = read_associated_transactions_complete(
+            page, frame, single_pass=(cfg.get('assoc_tx', {}) or {}).get('single_pass', True)
+        )
+    tx_product_map = assoc.get("tx_product_map", {}) or {}
+    code_to_idx = {}
+    def _match_summary_to_product_index(
+        txid: str,
+        summary: str,
+        prod_code_from_bc: str,
+        products: list,
+        code_to_idx: dict,
+        tx_product_map: dict,
+    ):
+        def _fuzzy_lookup(code: str):
+            if not code:
                 return None
-            assoc_code_raw = tx_product_map.get(txid) or ""
-            assoc_idx = _fuzzy_lookup(assoc_code_raw)
-            if assoc_idx:
+            c = code.strip().upper()
+            if not c:
+                return None
+            idx = code_to_idx.get(c)
+            if idx:
+                return idx
+            candidates = []
+            for key, idx in code_to_idx.items():
+                if c in key or key in c:
+                    candidates.append((key, idx))
+            if len(candidates) == 1:
+                key, idx = candidates[0]
                 log(
-                    f"[Match] txid={txid} matched via AssocTx grid "
-                    f"product={assoc_code_raw.strip().upper()!r} → product index {assoc_idx}"
+                    f"[Match] txid={txid} fuzzy-matched code={c!r} "
+                    f"to key={key!r} → product index {idx}"
                 )
-                return assoc_idx
-            bc_code_raw = prod_code_from_bc or ""
-            bc_idx = _fuzzy_lookup(bc_code_raw)
-            if bc_idx:
+                return idx
+            if candidates:
                 log(
-                    f"[Match] txid={txid} matched via bcTitle product="
-                    f"{bc_code_raw.strip().upper()!r} → product index {bc_idx}"
+                    f"[Match] txid={txid} ambiguous fuzzy match for code={c!r} "
+                    f"candidates={[k for k, _ in candidates]}"
                 )
-                return bc_idx
-            for i, p in enumerate(products, start=1):
-                pid = (p.get("id") or "").strip()
-                if pid and summary_has_product_id(summary, pid):
-                    log(
-                        f"[Match] txid={txid} matched via summary_has_product_id({pid!r}) "
-                        f"→ product index {i}"
-                    )
-                    return i
-            for i, p in enumerate(products, start=1):
-                desc = (p.get("desc") or "").strip()
-                if not desc:
-                    continue
-                code_token = extract_product_code(desc)
-                if not code_token:
-                    continue
-                if re.search(rf"\b{re.escape(code_token)}\b", summary, re.I):
-                    log(
-                        f"[Match] txid={txid} matched via summary product code token "
-                        f"{code_token!r} → product index {i}"
-                    )
-                    return i
-            log(f"[Match] txid={txid} could NOT be matched to any product")
             return None
-        for idx, p in enumerate(products, start=1):
-            pid  = (p.get("id")   or "").strip().upper()
-            code = (p.get("code") or extract_product_code(p.get("desc", ""))).upper()
-            if pid:
-                code_to_idx.setdefault(pid, idx)
-            if code:
-                code_to_idx.setdefault(code, idx)
-        default_pa_text = (
-            "Information provided to Medtronic indicated that the complaint device "
-            "was not available for evaluation."
-        )
-        pa_ids_raw = values.get("assoc_tx_product_analysis_ids", "") or ", ".join(assoc.get("product_analysis", []))
-        pa_ids = [x.strip() for x in pa_ids_raw.split(",") if x.strip()]
-        per_product_pa = {}
-        unmatched_pa = []  # just for logging/debug, not used in outputs
-        for txid in pa_ids:
-            log(f"[PA-SUMMARY] Fetching Analysis Summary for PA ID: {txid}")
-            raw_summary, prod_code = read_analysis_summary_and_product_for_txid(page, txid)
-            summary = _normalize_text_preserve(raw_summary)
-            summary = _strip_analysis_phrases(summary)
-            if not summary:
-                summary = "(No Analysis Summary found)"
-            idx = _match_summary_to_product_index(
-                txid,
-                summary,
-                prod_code,
-                products,
-                code_to_idx,
-                tx_product_map,
+        assoc_code_raw = tx_product_map.get(txid) or ""
+        assoc_idx = _fuzzy_lookup(assoc_code_raw)
+        if assoc_idx:
+            log(
+                f"[Match] txid={txid} matched via AssocTx grid "
+                f"product={assoc_code_raw.strip().upper()!r} → product index {assoc_idx}"
             )
-            if idx:
-                prod_desc = ""
-                if 1 <= idx <= len(products):
-                    prod_desc = products[idx - 1].get("desc", "")
-                formatted = _format_analysis_block(prod_desc, summary)
-                prev = per_product_pa.get(idx, "")
-                per_product_pa[idx] = (prev + ("\n\n" if prev else "") + formatted).strip()
-            else:
-                unmatched_pa.append(summary)
-                log(f"[PA-SUMMARY] txid={txid} could not be matched to any included product; analysis ignored.")
-        for idx, text in per_product_pa.items():
-            values[f"analysis_{idx}"] = text
-        all_pa_blocks = list(per_product_pa.values())
-        if all_pa_blocks:
-            values["analysis_results"] = "\n\n".join(all_pa_blocks)
-        else:
-            values["analysis_results"] = default_pa_text
-        if len(products) == 1:
-            if values.get("analysis_results"):
-                values.setdefault("analysis_1", values["analysis_results"])
-            else:
-                values.setdefault("analysis_1", default_pa_text)
-        inv_ids_raw = values.get("assoc_tx_investigation_ids", "") or ", ".join(assoc.get("investigation", []))
-        inv_ids = [x.strip() for x in inv_ids_raw.split(",") if x.strip()]
-        per_product_inv = {}
-        unmatched_inv = []
-        for txid in inv_ids:
-            log(f"[INV-SUMMARY] Fetching Investigation Summary for INV ID: {txid}")
-            raw_summary, prod_code = read_investigation_summary_and_product_for_txid(page, txid)
-            summary = _normalize_text_preserve(raw_summary)
-            summary = _postprocess_investigation_text(summary)
-            if not summary:
-                summary = ""
-            idx = _match_summary_to_product_index(
-                txid,
-                summary,
-                prod_code,
-                products,
-                code_to_idx,
-                tx_product_map,
+            return assoc_idx
+        bc_code_raw = prod_code_from_bc or ""
+        bc_idx = _fuzzy_lookup(bc_code_raw)
+        if bc_idx:
+            log(
+                f"[Match] txid={txid} matched via bcTitle product="
+                f"{bc_code_raw.strip().upper()!r} → product index {bc_idx}"
             )
-            if idx:
-                prev = per_product_inv.get(idx, "")
-                per_product_inv[idx] = (prev + ("\n\n" if prev else "") + summary).strip()
-            else:
-                unmatched_inv.append(summary)
-                log(f"[INV-SUMMARY] txid={txid} could not be matched to any included product; investigation ignored.")
-        for idx, text in per_product_inv.items():
-            values[f"investigation_{idx}"] = text
-        all_inv_blocks = list(per_product_inv.values())
-        if all_inv_blocks:
-            values["investigation_summary"] = "\n\n\n".join(all_inv_blocks)
+            return bc_idx
+        for i, p in enumerate(products, start=1):
+            pid = (p.get("id") or "").strip()
+            if pid and summary_has_product_id(summary, pid):
+                log(
+                    f"[Match] txid={txid} matched via summary_has_product_id({pid!r}) "
+                    f"→ product index {i}"
+                )
+                return i
+        for i, p in enumerate(products, start=1):
+            desc = (p.get("desc") or "").strip()
+            if not desc:
+                continue
+            code_token = extract_product_code(desc)
+            if not code_token:
+                continue
+            if re.search(rf"\b{re.escape(code_token)}\b", summary, re.I):
+                log(
+                    f"[Match] txid={txid} matched via summary product code token "
+                    f"{code_token!r} → product index {i}"
+                )
+                return i
+        log(f"[Match] txid={txid} could NOT be matched to any product")
+        return None
+    for idx, p in enumerate(products, start=1):
+        pid  = (p.get("id")   or "").strip().upper()
+        code = (p.get("code") or extract_product_code(p.get("desc", ""))).upper()
+        if pid:
+            code_to_idx.setdefault(pid, idx)
+        if code:
+            code_to_idx.setdefault(code, idx)
+    default_pa_text = (
+        "Information provided to Medtronic indicated that the complaint device "
+        "was not available for evaluation."
+    )
+    pa_ids_raw = values.get("assoc_tx_product_analysis_ids", "") or ", ".join(assoc.get("product_analysis", []))
+    pa_ids = [x.strip() for x in pa_ids_raw.split(",") if x.strip()]
+    inv_ids_raw = values.get("assoc_tx_investigation_ids", "") or ", ".join(assoc.get("investigation", []))
+    inv_ids = [x.strip() for x in inv_ids_raw.split(",") if x.strip()]
+    activity_texts = {}
+    if "activities" in steps:
+        _check_cancel(6, "activity summaries")
+        activity_texts = fetch_activity_summaries(
+            page,
+            [("analysis", t) for t in pa_ids] + [("investigation", t) for t in inv_ids],
+            cfg,
+        )
+        _progress("activities", "end", txids=len(pa_ids) + len(inv_ids),
+                  summaries=sum(1 for v in activity_texts.values() if v and v[0]))
+    per_product_pa = {}
+    unmatched_pa = []  # just for logging/debug, not used in outputs
+    for txid in pa_ids:
+        log(f"[PA-SUMMARY] Fetching Analysis Summary for PA ID: {txid}")
+        raw_summary, prod_code = activity_texts.get(("analysis", txid), ("", ""))
+        summary = _normalize_text_preserve(raw_summary)
+        summary = _strip_analysis_phrases(summary)
+        if not summary:
+            summary = "(No Analysis Summary found)"
+        idx = _match_summary_to_product_index(
+            txid,
+            summary,
+            prod_code,
+            products,
+            code_to_idx,
+            tx_product_map,
+        )
+        if idx:
+            prod_desc = ""
+            if 1 <= idx <= len(products):
+                prod_desc = products[idx - 1].get("desc", "")
+            formatted = _format_analysis_block(prod_desc, summary)
+            prev = per_product_pa.get(idx, "")
+            per_product_pa[idx] = (prev + ("\n\n" if prev else "") + formatted).strip()
         else:
-            values.setdefault("investigation_summary", DEFAULT_INV_TEXT)
+            unmatched_pa.append(summary)
+            log(f"[PA-SUMMARY] txid={txid} could not be matched to any included product; analysis ignored.")
+    for idx, text in per_product_pa.items():
+        values[f"analysis_{idx}"] = text
+    all_pa_blocks = list(per_product_pa.values())
+    if all_pa_blocks:
+        values["analysis_results"] = "\n\n".join(all_pa_blocks)
+    else:
+        values["analysis_results"] = default_pa_text
+    if len(products) == 1:
         if values.get("analysis_results"):
             values.setdefault("analysis_1", values["analysis_results"])
         else:
-            values.setdefault(
-                "analysis_1",
-                "Information provided to Medtronic indicated that the complaint device "
-                "was not available for evaluation."
-            )
-        if len(products) == 1:
-            if values.get("investigation_summary"):
-                values.setdefault("investigation_1", values["investigation_summary"])
-            else:
-                values.setdefault("investigation_1", DEFAULT_INV_TEXT)
-        for idx, p in enumerate(products, start=1):
-            code = (p.get("code") or extract_product_code(p.get("desc",""))).upper()
-            values[f"product_id_{idx}"]   = (p.get("id") or code)
-            values[f"product_desc_{idx}"] = p.get("desc", "")
-            sn  = (p.get("sn", "") or "").strip()
-            lot = (p.get("lot", "") or "").strip()
-            values[f"product_sn_{idx}"]  = sn
-            values[f"product_lot_{idx}"] = lot
-            if sn and lot:
-                first_table_display = f"SN: {sn} / LN: {lot}"
-            elif sn:
-                first_table_display = f"SN: {sn}"
-            elif lot:
-                first_table_display = f"LN: {lot}"
-            else:
-                first_table_display = ""
-            values[f"serial_or_lot_{idx}"] = first_table_display
-            if sn and not lot:
-                label_2 = "Serial No:"
-                value_2 = sn
-            elif lot and not sn:
-                label_2 = "Lot No:"
-                value_2 = lot
-            elif sn and lot:
-                label_2 = "Serial/Lot No:"
-                value_2 = f"{sn} / {lot}"
-            else:
-                label_2 = ""
-                value_2 = ""
-            values[f"serial_or_lot_label_{idx}"] = label_2
-            values[f"serial_or_lot_value_{idx}"] = value_2
-        values["assoc_tx_product_analysis_ids"] = ", ".join(assoc["product_analysis"])
-        values["assoc_tx_investigation_ids"]    = ", ".join(assoc["investigation"])
-        if any(values.get(f"investigation_{i+1}", "").strip() for i in range(len(products))):
-            values["investigation_summary"] = "\n\n\n".join(
-                (values.get(f"investigation_{i+1}", "") or "").strip()
-                for i in range(len(products))
-                if (values.get(f"investigation_{i+1}", "") or "").strip()
-            )
-        values['_product_count'] = len(products)
-        if not (values.get('ir_name') or '').strip():
-            values['ir_name'] = 'Customer'
-        if len(products) > 3:
-            extras = [f"{p['id']} — {p['desc']}" for p in products[3:]]
-            values.setdefault("product_extras", "\n".join(extras))
-        default_pa_text = (
+            values.setdefault("analysis_1", default_pa_text)
+    per_product_inv = {}
+    unmatched_inv = []
+    for txid in inv_ids:
+        log(f"[INV-SUMMARY] Fetching Investigation Summary for INV ID: {txid}")
+        raw_summary, prod_code = activity_texts.get(("investigation", txid), ("", ""))
+        summary = _normalize_text_preserve(raw_summary)
+        summary = _postprocess_investigation_text(summary)
+        if not summary:
+            summary = ""
+        idx = _match_summary_to_product_index(
+            txid,
+            summary,
+            prod_code,
+            products,
+            code_to_idx,
+            tx_product_map,
+        )
+        if idx:
+            prev = per_product_inv.get(idx, "")
+            per_product_inv[idx] = (prev + ("\n\n" if prev else "") + summary).strip()
+        else:
+            unmatched_inv.append(summary)
+            log(f"[INV-SUMMARY] txid={txid} could not be matched to any included product; investigation ignored.")
+    for idx, text in per_product_inv.items():
+        values[f"investigation_{idx}"] = text
+    all_inv_blocks = list(per_product_inv.values())
+    if all_inv_blocks:
+        values["investigation_summary"] = "\n\n\n".join(all_inv_blocks)
+    else:
+        values.setdefault("investigation_summary", DEFAULT_INV_TEXT)
+    if values.get("analysis_results"):
+        values.setdefault("analysis_1", values["analysis_results"])
+    else:
+        values.setdefault(
+            "analysis_1",
             "Information provided to Medtronic indicated that the complaint device "
             "was not available for evaluation."
         )
-        for idx in range(1, len(products) + 1):
-            a_key = f"analysis_{idx}"
-            i_key = f"investigation_{idx}"
-            analysis_text = (values.get(a_key) or "").strip()
-            if not analysis_text or analysis_text == DEFAULT_PA_TEXT:
-                values[a_key] = DEFAULT_PA_TEXT
+    if len(products) == 1:
+        if values.get("investigation_summary"):
+            values.setdefault("investigation_1", values["investigation_summary"])
+        else:
+            values.setdefault("investigation_1", DEFAULT_INV_TEXT)
+    for idx, p in enumerate(products, start=1):
+        code = (p.get("code") or extract_product_code(p.get("desc",""))).upper()
+        values[f"product_id_{idx}"]   = (p.get("id") or code)
+        values[f"product_desc_{idx}"] = p.get("desc", "")
+        sn  = (p.get("sn", "") or "").strip()
+        lot = (p.get("lot", "") or "").strip()
+        values[f"product_sn_{idx}"]  = sn
+        values[f"product_lot_{idx}"] = lot
+        if sn and lot:
+            first_table_display = f"SN: {sn} / LN: {lot}"
+        elif sn:
+            first_table_display = f"SN: {sn}"
+        elif lot:
+            first_table_display = f"LN: {lot}"
+        else:
+            first_table_display = ""
+        values[f"serial_or_lot_{idx}"] = first_table_display
+        if sn and not lot:
+            label_2 = "Serial No:"
+            value_2 = sn
+        elif lot and not sn:
+            label_2 = "Lot No:"
+            value_2 = lot
+        elif sn and lot:
+            label_2 = "Serial/Lot No:"
+            value_2 = f"{sn} / {lot}"
+        else:
+            label_2 = ""
+            value_2 = ""
+        values[f"serial_or_lot_label_{idx}"] = label_2
+        values[f"serial_or_lot_value_{idx}"] = value_2
+    values["assoc_tx_product_analysis_ids"] = ", ".join(assoc["product_analysis"])
+    values["assoc_tx_investigation_ids"]    = ", ".join(assoc["investigation"])
+    if any(values.get(f"investigation_{i+1}", "").strip() for i in range(len(products))):
+        values["investigation_summary"] = "\n\n\n".join(
+            (values.get(f"investigation_{i+1}", "") or "").strip()
+            for i in range(len(products))
+            if (values.get(f"investigation_{i+1}", "") or "").strip()
+        )
+    values['_product_count'] = len(products)
+    if not (values.get('ir_name') or '').strip():
+        values['ir_name'] = 'Customer'
+    if len(products) > 3:
+        extras = [f"{p['id']} — {p['desc']}" for p in products[3:]]
+        values.setdefault("product_extras", "\n".join(extras))
+    default_pa_text = (
+        "Information provided to Medtronic indicated that the complaint device "
+        "was not available for evaluation."
+    )
+    for idx in range(1, len(products) + 1):
+        a_key = f"analysis_{idx}"
+        i_key = f"investigation_{idx}"
+        analysis_text = (values.get(a_key) or "").strip()
+        if not analysis_text or analysis_text == DEFAULT_PA_TEXT:
+            values[a_key] = DEFAULT_PA_TEXT
+            values[i_key] = DEFAULT_INV_TEXT
+        else:
+            inv_text = (values.get(i_key) or "").strip()
+            if not inv_text:
                 values[i_key] = DEFAULT_INV_TEXT
-            else:
-                inv_text = (values.get(i_key) or "").strip()
-                if not inv_text:
-                    values[i_key] = DEFAULT_INV_TEXT
-        for k, v in list(values.items()):
-            if not re.match(r"^investigation_\d+$", k):
-                continue
-            if not (v or "").strip():
-                continue
-            body = _extract_investigation_body(v)
-            values[k] = _strip_leading_based_on_evidence(body)
-        log("Collected fields:")
-        log(json.dumps(values, indent=2))    
-        browser.close()
+    for k, v in list(values.items()):
+        if not re.match(r"^investigation_\d+$", k):
+            continue
+        if not (v or "").strip():
+            continue
+        body = _extract_investigation_body(v)
+        values[k] = _strip_leading_based_on_evidence(body)
+    log("Collected fields:")
+    log(json.dumps(values, indent=2))    
+    log_wait_stats(complaint_id)
+    return values, products
+def _daemon_cfg(cfg):
+    return cfg.get('daemon', {}) or {}
+def _daemon_endpoint_path(cfg):
+    raw = (_daemon_cfg(cfg).get('endpoint_file') or "./.crm_session/daemon.json").strip()
+    return Path(raw).expanduser()
+def _daemon_profile_dir(cfg):
+    raw = (_daemon_cfg(cfg).get('profile_dir') or "./.crm_session/daemon_profile").strip()
+    return Path(raw).expanduser()
+def connect_crm_daemon(p, cfg):
+    dc = _daemon_cfg(cfg)
+    path = _daemon_endpoint_path(cfg)
+    if not dc.get('connect', True) or not path.exists():
+        return None
+    started = time.time()
+    try:
+        info = json.loads(path.read_text(encoding="utf-8"))
+        browser = p.chromium.connect_over_cdp(info["endpoint"], timeout=dc.get('connect_timeout_ms', 3000))
+    except Exception as e:
+        log(f"[daemon] endpoint {path} is stale ({e}); launching a private browser")
+        return None
+    if not browser.contexts:
+        log("[daemon] daemon browser has no context; launching a private browser")
+        return None
+    context = browser.contexts[0]
+    session = CrmSession(browser, context, None, restored=True)
+    session.attached = True
+    session.persist = False
+    configure_selector_cache(cfg)
+    configure_offline_dom(cfg)
+    configure_lazy_load(cfg)
+    session.page = watch_page(context.new_page())
+    log(f"[daemon] attached to {info['endpoint']} (pid {info.get('pid')}) in {(time.time() - started) * 1000:.0f} ms")
+    return session
+def run_crm_daemon(cfg_path: str):
+    cfg, _, _ = _load_config(cfg_path)
+    port = int(_daemon_cfg(cfg).get('port', 9333))
+    path = _daemon_endpoint_path(cfg)
+    with sync_playwright() as p:
+        session = open_crm_session(p, cfg, debug_port=port)
+        try:
+            if not ensure_crm_ready(session, cfg):
+                log("[daemon] CRM search never became ready; not publishing the endpoint")
+                return 1
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({
+                "endpoint": f"http://127.0.0.1:{port}",
+                "pid": os.getpid(),
+                "started": datetime.now().isoformat(timespec="seconds"),
+            }), encoding="utf-8")
+            log(f"[daemon] ready; endpoint written to {path}. Close the browser or press Ctrl+C to stop.")
+            try:
+                session.context.wait_for_event("close", timeout=0)
+            except KeyboardInterrupt:
+                pass
+        finally:
+            try:
+                path.unlink()
+            except Exception:
+                pass
+            session.close(cfg)
+    return 0
+def scrape_complaint(complaint_id: str, cfg_path: str):
+    cfg, template_path, out_dir = _load_config(cfg_path)
+    with sync_playwright() as p:
+        session = connect_crm_daemon(p, cfg)
+        if session is not None and not ensure_crm_ready(session, cfg):
+            log("[daemon] launching a private browser instead")
+            session.close(cfg)
+            session = None
+        if session is None:
+            session = open_crm_session(p, cfg)
+            ensure_crm_ready(session, cfg)
+        try:
+            values, products = scrape_complaint_on_page(
+                session.page, complaint_id, cfg, steps=plan_scrape_steps(cfg, template_path)
+            )
+        finally:
+            session.close(cfg)
     return values, products, cfg, template_path, out_dir
+class BrowserWorker:
+    def __init__(self, cfg_path: str):
+        self.cfg_path = cfg_path
+        self.commands = queue.Queue()
+        self.events = queue.Queue()
+        self.session = None
+        self.at_start = False
+        self.at_start_time = 0.0
+        self.prefetched = None
+        self._prefetch = (None, None)
+        self._scrape_cancel = None
+        self.thread = None
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="crm-browser", daemon=True)
+            self.thread.start()
+        return self
+    def warm(self):
+        self.commands.put(("warm", None))
+        self.start()
+    def prefetch(self, complaint_id: str):
+        self.cancel_prefetch()
+        cancel = threading.Event()
+        self._prefetch = (complaint_id, cancel)
+        self.commands.put(("prefetch", (complaint_id, cancel)))
+        self.start()
+    def cancel_prefetch(self, keep_id=None):
+        complaint_id, cancel = self._prefetch
+        if cancel is not None and complaint_id != keep_id:
+            cancel.set()
+            self._prefetch = (None, None)
+    def prefetch_settings(self):
+        cfg = yaml.safe_load(Path(self.cfg_path).read_text()) or {}
+        pc = cfg.get('prefetch', {}) or {}
+        return {
+            "enabled": pc.get('enabled', False),
+            "id_rx": re.compile(pc.get('complaint_id_regex') or r"^\d{6,12}$"),
+            "debounce_ms": int(pc.get('debounce_ms', 700)),
+        }
+    def scrape(self, complaint_id: str):
+        self.cancel_prefetch(keep_id=complaint_id)
+        self._scrape_cancel = threading.Event()
+        self.commands.put(("scrape", (complaint_id, self._scrape_cancel)))
+        self.start()
+    def cancel_scrape(self):
+        if self._scrape_cancel is not None:
+            self._scrape_cancel.set()
+    def stop(self):
+        self.cancel_prefetch()
+        self.cancel_scrape()
+        self.commands.put(("stop", None))
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+    def poll(self):
+        out = []
+        while True:
+            try:
+                out.append(self.events.get_nowait())
+            except queue.Empty:
+                return out
+    def _emit(self, event, **data):
+        data["event"] = event
+        self.events.put(data)
+    def _session_for(self, p, cfg, attach=True):
+        if self.session is not None:
+            try:
+                alive = not self.session.page.is_closed()
+            except Exception:
+                alive = False
+            if not alive:
+                log("[worker] browser page was closed; starting a new session")
+                self.session.close(cfg)
+                self.session = None
+        if self.session is None:
+            self.at_start = False
+            self.session = (attach and connect_crm_daemon(p, cfg)) or open_crm_session(p, cfg)
+        return self.session
+    def _ready(self, p, cfg):
+        session = self._session_for(p, cfg)
+        idle_s = time.time() - self.at_start_time
+        if session.ready and self.at_start and idle_s > _session_cfg(cfg).get('idle_probe_after_s', 300):
+            if not _on_sso_host(session.page) and probe_search_ready(session.page, cfg, timeout_ms=1500):
+                self.at_start_time = time.time()
+            else:
+                log(f"[worker] search screen stale after {idle_s:.0f}s idle; reloading CRM")
+                self.at_start = False
+        if not (session.ready and self.at_start):
+            self.at_start_time = time.time()
+            self.at_start = ensure_crm_ready(session, cfg)
+            if not self.at_start and session.attached:
+                log("[worker] daemon session unusable; launching a private browser")
+                session.close(cfg)
+                self.session = None
+                session = self._session_for(p, cfg, attach=False)
+                self.at_start = ensure_crm_ready(session, cfg)
+        return session
+    def _warm(self, p):
+        cfg, _, _ = _load_config(self.cfg_path)
+        started = time.time()
+        self._emit("status", text="Starting browser and opening GCH…")
+        session = self._ready(p, cfg)
+        log(f"[worker] pre-warm finished in {time.time() - started:.1f}s (ready={session.ready})")
+        self._emit("ready", ok=session.ready, seconds=round(time.time() - started, 1))
+    def _prefetch_run(self, p, complaint_id, cancel):
+        if cancel.is_set():
+            return
+        if self.prefetched and self.prefetched[0] == complaint_id:
+            self._emit("prefetched", complaint_id=complaint_id, seconds=0)
+            return
+        cfg, template_path, _ = _load_config(self.cfg_path)
+        started = time.time()
+        self.prefetched = None
+        session = self._ready(p, cfg)
+        if cancel.is_set():
+            return
+        self.at_start = False
+        wanted = (cfg.get('prefetch', {}) or {}).get('steps') or ["partners", "dates"]
+        planned = plan_scrape_steps(cfg, template_path, keep=UI_REQUIRED_STEPS)
+        steps = [st for st in wanted if st in planned]
+        try:
+            result = scrape_complaint_on_page(session.page, complaint_id, cfg, steps=steps,
+                                              prefetch_only=True, cancel=cancel)
+        except ScrapeCancelled as e:
+            log(f"[prefetch] {e}")
+            return
+        self.prefetched = (complaint_id, result)
+        log(f"[prefetch] {complaint_id} pre-loaded ({', '.join(steps) or 'open only'}) in {time.time() - started:.1f}s")
+        self._emit("prefetched", complaint_id=complaint_id, seconds=round(time.time() - started, 1))
+    def _scrape(self, p, complaint_id, cancel):
+        cfg, template_path, out_dir = _load_config(self.cfg_path)
+        started = time.time()
+        reused = self.session is not None and self.session.ready
+        resume = None
+        if self.prefetched and self.prefetched[0] == complaint_id and self.session is not None:
+            resume = self.prefetched[1]
+        self.prefetched = None
+        session = self._session_for(p, cfg)
+        if resume is not None and session.ready and not object_on_screen(session.page, complaint_id):
+            log(f"[prefetch] {complaint_id} is no longer on screen; opening it again")
+            resume = None
+        if resume is None or not session.ready:
+            resume = None
+            session = self._ready(p, cfg)
+        self.at_start = False
+        steps = plan_scrape_steps(cfg, template_path, keep=UI_REQUIRED_STEPS)
+        values, products = scrape_complaint_on_page(
+            session.page, complaint_id, cfg, steps=steps, resume=resume,
+            cancel=cancel, progress=lambda ev: self._emit("progress", complaint_id=complaint_id, **ev),
+        )
+        log(f"[worker] {complaint_id} scraped in {time.time() - started:.1f}s "
+            f"(session reused={reused}, prefetched={resume is not None})")
+        return values, products, cfg, template_path, out_dir
+    def _run(self):
+        cfg = None
+        try:
+            with sync_playwright() as p:
+                try:
+                    while True:
+                        kind, arg = self.commands.get()
+                        if kind == "stop":
+                            return
+                        if kind == "warm":
+                            try:
+                                self._warm(p)
+                            except Exception as e:
+                                log(f"[worker] pre-warm failed: {e}")
+                                self._emit("ready", ok=False, error=str(e))
+                        if kind == "prefetch":
+                            try:
+                                self._prefetch_run(p, *arg)
+                            except Exception as e:
+                                log(f"[prefetch] {arg[0]} failed: {e}")
+                                self.prefetched = None
+                        if kind == "scrape":
+                            complaint_id, cancel = arg
+                            try:
+                                result = self._scrape(p, complaint_id, cancel)
+                                cfg = result[2]
+                                self._emit("done", complaint_id=complaint_id, result=result)
+                            except ScrapeCancelled as e:
+                                log(f"[worker] {e}")
+                                self._emit("cancelled", complaint_id=complaint_id)
+                            except Exception as e:
+                                log(f"[worker] ERROR for {complaint_id}: {e}")
+                                self._emit("error", complaint_id=complaint_id, error=str(e))
+                finally:
+                    if self.session is not None:
+                        self.session.close(cfg or _load_config(self.cfg_path)[0])
+                        self.session = None
+        except Exception as e:
+            log(f"[worker] browser thread failed: {e}")
+            self._emit("error", complaint_id=None, error=str(e))
+def read_complaint_ids(source: str):
+    text = sys.stdin.read() if source == "-" else Path(source).read_text(encoding="utf-8")
+    ids = []
+    for line in text.splitlines():
+        line = line.split("#", 1)[0]
+        ids.extend(tok for tok in re.split(r"[,;\s]+", line) if tok)
+    return list(dict.fromkeys(ids))
+def write_letter(cfg, template_path, out_dir, values, products):
+    out_name = cfg.get('output_name_pattern', 'Customer_Letter_{complaint_id}.docx').format(**values)
+    out_path = out_dir / out_name
+    fill_docx(str(template_path), str(out_path), values, products)
+    return out_path
+def _batch_concurrency(cfg) -> int:
+    try:
+        return max(1, int((cfg.get('batch', {}) or {}).get('concurrency', 1)))
+    except (TypeError, ValueError):
+        return 1
+def _run_batch_job(session, cfg, template_path, out_dir, complaint_id, n, total, worker=0):
+    log(f"[batch:w{worker}] {n}/{total} complaint {complaint_id}")
+    started = time.time()
+    try:
+        ensure_crm_ready(session, cfg)
+        values, products = scrape_complaint_on_page(
+            session.page, complaint_id, cfg, steps=plan_scrape_steps(cfg, template_path)
+        )
+        out_path = write_letter(cfg, template_path, out_dir, values, products)
+        log(f"[batch:w{worker}] Generated: {out_path}")
+        return {"complaint_id": complaint_id, "ok": True, "path": str(out_path),
+                "error": "", "seconds": round(time.time() - started, 1), "worker": worker}
+    except Exception as e:
+        log(f"[batch:w{worker}] ERROR for {complaint_id}: {e}")
+        return {"complaint_id": complaint_id, "ok": False, "path": "",
+                "error": str(e), "seconds": round(time.time() - started, 1), "worker": worker}
+def _drain_batch_jobs(session, jobs, results, cfg, template_path, out_dir, total, worker):
+    while True:
+        try:
+            idx, complaint_id = jobs.get_nowait()
+        except queue.Empty:
+            return
+        results[idx] = _run_batch_job(session, cfg, template_path, out_dir,
+                                      complaint_id, idx + 1, total, worker)
+def _batch_worker_thread(worker, storage_state, jobs, results, cfg, template_path, out_dir, total):
+    try:
+        with sync_playwright() as p:
+            session = open_crm_session(p, cfg, storage_state=storage_state)
+            try:
+                _drain_batch_jobs(session, jobs, results, cfg, template_path, out_dir, total, worker)
+            finally:
+                session.close(cfg)
+    except Exception as e:
+        log(f"[batch:w{worker}] worker failed to start: {e}")
+def scrape_and_generate_batch(complaint_ids, cfg_path: str):
+    cfg, template_path, out_dir = _load_config(cfg_path)
+    total = len(complaint_ids)
+    results = [None] * total
+    jobs = queue.Queue()
+    for idx, complaint_id in enumerate(complaint_ids):
+        jobs.put((idx, complaint_id))
+    concurrency = min(_batch_concurrency(cfg), total) if total else 1
+    started = time.time()
+    with sync_playwright() as p:
+        session = open_crm_session(p, cfg)
+        try:
+            ensure_crm_ready(session, cfg)
+            workers = []
+            if concurrency > 1:
+                storage_state = session.context.storage_state()
+                log(f"[batch] starting {concurrency - 1} extra worker(s) from the authenticated session")
+                for w in range(1, concurrency):
+                    t = threading.Thread(
+                        target=_batch_worker_thread,
+                        args=(w, storage_state, jobs, results, cfg, template_path, out_dir, total),
+                        name=f"batch-worker-{w}",
+                        daemon=True,
+                    )
+                    t.start()
+                    workers.append(t)
+            _drain_batch_jobs(session, jobs, results, cfg, template_path, out_dir, total, 0)
+            for t in workers:
+                t.join()
+        finally:
+            session.close(cfg)
+    for idx, r in enumerate(results):
+        if r is None:
+            results[idx] = {"complaint_id": complaint_ids[idx], "ok": False, "path": "",
+                            "error": "not processed", "seconds": 0, "worker": None}
+    ok = sum(1 for r in results if r["ok"])
+    log(f"[batch] done: {ok}/{total} letters generated in {time.time() - started:.1f}s "
+        f"with concurrency={concurrency}")
+    for r in results:
+        status = r["path"] if r["ok"] else f"FAILED: {r['error']}"
+        log(f"[batch]   {r['complaint_id']} ({r['seconds']}s) → {status}")
+    return results
 def main():
+    if len(sys.argv) >= 3 and sys.argv[1] == "--daemon":
+        sys.exit(run_crm_daemon(sys.argv[2]))
+    if len(sys.argv) >= 4 and sys.argv[1] == "--batch":
+        complaint_ids = read_complaint_ids(sys.argv[2])
+        if not complaint_ids:
+            print("No complaint IDs found in batch input.")
+            sys.exit(2)
+        results = scrape_and_generate_batch(complaint_ids, sys.argv[3])
+        sys.exit(0 if all(r["ok"] for r in results) else 1)
     if len(sys.argv) < 3:
         print("Usage: python scrape_and_generate.py <complaint_id> <config.yaml>")
+        print("       python scrape_and_generate.py --batch <ids.txt|-> <config.yaml>")
+        print("       python scrape_and_generate.py --daemon <config.yaml>")
         sys.exit(2)
     complaint_id = sys.argv[1]
     cfg_path = sys.argv[2]
     values, products, cfg, template_path, out_dir = scrape_complaint(complaint_id, cfg_path)
-    out_name = cfg.get('output_name_pattern', 'Customer_Letter_{complaint_id}.docx').format(**values)
-    out_path = out_dir / out_name
-    fill_docx(str(template_path), str(out_path), values, products)
+    out_path = write_letter(cfg, template_path, out_dir, values, products)
     log(f"Generated: {out_path}")
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,10 +1,11 @@
 import os
 import sys
 import subprocess
+import time
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from pathlib import Path
-from scrape_and_generate import scrape_complaint, fill_docx
+from scrape_and_generate import BrowserWorker, fill_docx
 DEFAULT_CONFIG_PATH = Path("config.yaml")
 BG_LIGHT = "#f3f4f6"
 CARD_BG = "#ffffff"
@@ -152,6 +153,8 @@ class CustomerLetterApp(tk.Tk):
         self.current_investigation_idx = 0   # 0-based
         self.complaint_var = tk.StringVar()
         self.status_var = tk.StringVar()
+        self.timings_var = tk.StringVar()
+        self.step_log = []
         header = ttk.Frame(self, style="Main.TFrame", padding=(20, 15, 20, 5))
         header.grid(row=0, column=0, sticky="ew")
         header.columnconfigure(0, weight=1)
@@ -180,6 +183,31 @@ class CustomerLetterApp(tk.Tk):
         self._build_step3_analysis()
         self._build_step4_investigation_per_product()
         self._show_step(self.step1_frame, "Step 1 of 4 · Enter GCH PE Number")
+        self.worker = BrowserWorker(str(DEFAULT_CONFIG_PATH))
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.crm_ready = False
+        self.busy = False
+        self.closing = False
+        self.prefetch_cfg = self.worker.prefetch_settings()
+        self._prefetch_job = None
+        self.complaint_var.trace_add("write", self._on_complaint_changed)
+        self.after_idle(self.worker.warm)
+        self.after(100, self._poll_worker)
+    def on_close(self):
+        if self.closing:
+            return
+        self.closing = True
+        self.status_var.set("Closing browser…")
+        if self._prefetch_job is not None:
+            self.after_cancel(self._prefetch_job)
+            self._prefetch_job = None
+        self.worker.stop()
+        self._finish_close(time.time() + 10)
+    def _finish_close(self, deadline):
+        if self.worker.is_alive() and time.time() < deadline:
+            self.after(100, self._finish_close, deadline)
+            return
+        self.destroy()
     def _choose_external_contact_if_needed(self):
         contacts = self.values.get("_external_contacts") or []
         if len(contacts) <= 1:
@@ -238,27 +266,116 @@ class CustomerLetterApp(tk.Tk):
         )
         entry = ttk.Entry(f, textvariable=self.complaint_var, width=30)
         entry.grid(row=2, column=1, sticky="w", padx=(5, 0), pady=(0, 5))
-        go_btn = ttk.Button(f, text="Go", style="Accent.TButton", command=self.on_go_clicked)
-        go_btn.grid(row=2, column=2, padx=(10, 0), pady=(0, 5))
+        self.go_btn = ttk.Button(f, text="Go", style="Accent.TButton", command=self.on_go_clicked)
+        self.go_btn.grid(row=2, column=2, padx=(10, 0), pady=(0, 5))
+        self.cancel_btn = ttk.Button(
+            f, text="Cancel", style="Ghost.TButton", command=self.on_cancel_clicked, state="disabled"
+        )
+        self.cancel_btn.grid(row=2, column=3, padx=(5, 0), pady=(0, 5))
         status = ttk.Label(f, textvariable=self.status_var, style="CardText.TLabel")
-        status.grid(row=3, column=0, columnspan=3, sticky="w", pady=(10, 0))
+        status.grid(row=3, column=0, columnspan=4, sticky="w", pady=(10, 0))
+        self.progress_bar = ttk.Progressbar(f, mode="determinate", maximum=1)
+        self.progress_bar.grid(row=4, column=0, columnspan=4, sticky="ew", pady=(10, 0))
+        timings = ttk.Label(f, textvariable=self.timings_var, style="CardText.TLabel")
+        timings.grid(row=5, column=0, columnspan=4, sticky="w", pady=(5, 0))
         f.grid_columnconfigure(1, weight=1)
     def on_go_clicked(self):
         complaint_id = self.complaint_var.get().strip()
         if not complaint_id:
             messagebox.showerror("Missing complaint number", "Please enter a complaint number first.")
             return
+        if self._prefetch_job is not None:
+            self.after_cancel(self._prefetch_job)
+            self._prefetch_job = None
         self.status_var.set("Contacting GCH and collecting data…")
-        self.update_idletasks()
-        try:
-            values, products, cfg, template_path, out_dir = scrape_complaint(
-                complaint_id,
-                str(DEFAULT_CONFIG_PATH),
-            )
-        except Exception as e:
-            self.status_var.set("")
-            messagebox.showerror("Error", f"Failed to scrape data from GCH:\n{e}")
+        self.go_btn.config(state="disabled")
+        self.cancel_btn.config(state="normal")
+        self.busy = True
+        self.step_log = []
+        self.timings_var.set("")
+        self.progress_bar.config(value=0, maximum=1)
+        self.worker.scrape(complaint_id)
+    def on_cancel_clicked(self):
+        self.worker.cancel_scrape()
+        self.cancel_btn.config(state="disabled")
+        self.status_var.set("Cancelling after the current step…")
+    def _scrape_finished(self):
+        self.busy = False
+        self.go_btn.config(state="normal")
+        self.cancel_btn.config(state="disabled")
+    def _on_progress(self, ev):
+        self.progress_bar.config(maximum=max(1, ev["total"]))
+        if ev["phase"] == "start":
+            self.step_log.append({"step": ev["step"], "label": ev["counts"].get("label", ev["step"]),
+                                  "start": ev["time"], "end": None, "counts": {}})
+        else:
+            for entry in reversed(self.step_log):
+                if entry["step"] == ev["step"] and entry["end"] is None:
+                    entry["end"] = ev["time"]
+                    entry["counts"] = ev["counts"]
+                    break
+            self.progress_bar.config(value=sum(1 for e in self.step_log if e["end"]))
+        self._refresh_progress()
+    def _refresh_progress(self):
+        parts = []
+        for entry in self.step_log:
+            secs = (entry["end"] or time.time()) - entry["start"]
+            counts = ", ".join(f"{k.replace('_', ' ')} {v}" for k, v in entry["counts"].items())
+            parts.append(f"{entry['label']} {secs:.1f}s" + (f" ({counts})" if counts else ""))
+        self.timings_var.set(" · ".join(parts))
+        current = self.step_log[-1] if self.step_log else None
+        if current and current["end"] is None and self.cancel_btn.instate(["!disabled"]):
+            self.status_var.set(f"{current['label']}… {time.time() - current['start']:.0f}s")
+    def _on_complaint_changed(self, *_):
+        if self._prefetch_job is not None:
+            self.after_cancel(self._prefetch_job)
+            self._prefetch_job = None
+        complaint_id = self.complaint_var.get().strip()
+        self.worker.cancel_prefetch(keep_id=complaint_id)
+        if self.busy or not self.prefetch_cfg["enabled"]:
+            return
+        if self.prefetch_cfg["id_rx"].match(complaint_id):
+            self._prefetch_job = self.after(self.prefetch_cfg["debounce_ms"], self._start_prefetch)
+    def _start_prefetch(self):
+        self._prefetch_job = None
+        complaint_id = self.complaint_var.get().strip()
+        if self.busy or not self.prefetch_cfg["id_rx"].match(complaint_id):
+            return
+        self.worker.prefetch(complaint_id)
+        self.status_var.set(f"Opening {complaint_id} in GCH…")
+    def _poll_worker(self):
+        if self.closing:
             return
+        for ev in self.worker.poll():
+            kind = ev["event"]
+            if kind == "status" and not self.busy:
+                self.status_var.set(ev["text"])
+            elif kind == "ready":
+                self.crm_ready = ev["ok"]
+                if not self.busy:
+                    if ev["ok"]:
+                        self.status_var.set(f"GCH is ready ({ev['seconds']}s). Enter a PE number and press Go.")
+                    else:
+                        self.status_var.set("GCH is not ready yet; pressing Go will retry the sign-in.")
+            elif kind == "prefetched":
+                if not self.busy and ev["complaint_id"] == self.complaint_var.get().strip():
+                    self.status_var.set(f"{ev['complaint_id']} is loaded. Press Go to continue.")
+            elif kind == "progress":
+                self._on_progress(ev)
+            elif kind == "done":
+                self._scrape_finished()
+                self._on_scrape_done(*ev["result"])
+            elif kind == "cancelled":
+                self._scrape_finished()
+                self.status_var.set(f"Cancelled {ev['complaint_id']}.")
+            elif kind == "error":
+                self._scrape_finished()
+                self.status_var.set("")
+                messagebox.showerror("Error", f"Failed to scrape data from GCH:\n{ev['error']}")
+        if self.busy and self.step_log:
+            self._refresh_progress()
+        self.after(100, self._poll_worker)
+    def _on_scrape_done(self, values, products, cfg, template_path, out_dir):
         self.values = values or {}
         self.products = products or []
         self.cfg = cfg
@@ -640,6 +757,9 @@ class CustomerLetterApp(tk.Tk):
         self.current_investigation_idx = 0
         self.complaint_var.set("")
         self.status_var.set("")
+        self.timings_var.set("")
+        self.step_log = []
+        self.progress_bar.config(value=0)
         self.ir_text_widget.config(state="normal")
         self.ir_text_widget.delete("1.0", "end")
         self.analysis_text_widget.config(state="normal")